@@ -1,61 +1,59 @@
-import subprocess
-import schedule
-import time
+import os
 from datetime import datetime
 
-
-def run_job():
-    """執行整個交易流程（fetch → feature → analysis → decision）"""
-    steps = [
-        ("📥 獲取 4H K 線數據", ["python3", "fetch_data.py"]),
-        ("🧮 特徵工程", ["python3", "add_features.py"]),
-        ("📊 特徵分箱", ["python3", "binned_features.py"]),
-        ("🔍 箱子分析", ["python3", "feature_bin_analysis.py"]),
-        ("📈 計算交易分數", ["python3", "calculate_trading_scores.py"]),
-        ("🧾 生成評估報告", ["python3", "generate_latest_assessment.py"]),
-        # ("📨 發送到 Discord", ["python", "send_to_discord.py"]),
-        # ("🤖 執行交易建議", ["python", "go_again.py", "--live"]),
-        ("💾 儲存結果到資料庫", ["python3", "save_results_sql.py"]),
-    ]
-
+from multi_runner import pair_output_dir
+from pipeline import STAGE_OUTPUT_FILES, STAGES, PipelineStageError, run_pipeline
+
+
+def run_job(symbol="BTCUSDT", interval="4h", bar_close_ms=None):
+    """
+    執行整個交易流程（fetch → feature → analysis → decision），全部在同一行程內完成
+    bar_close_ms：由排程器傳入剛收盤的邊界時間（= 新 K 線 open_time），作為 fetch 快取鍵
+    回傳這次寫出的評估報告路徑（失敗時為 None）
+    """
+    # 每個 (symbol, interval) 寫到自己的目錄（與 multi_runner 相同：data/{symbol}_{interval}/），
+    # 同時排程多個 interval 時，評估報告、K 線資料庫與快取紀錄不會互相覆蓋。
+    # 📨 發送到 Discord 與 🤖 執行交易建議以 --json 指定要讀哪一份報告：
+    #     python send_to_discord.py --json data/BTCUSDT_4h/latest_trading_assessment.json
+    #     python go_again.py --json data/BTCUSDT_4h/latest_trading_assessment.json --live
+    output_dir = pair_output_dir("data", symbol, interval)
+    report_path = os.path.join(output_dir, STAGE_OUTPUT_FILES["assessment"])
     print("\n────────────────────────────────────────")
-    print(f"🚀 開始執行任務時間：{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-
-    for desc, cmd in steps:
-        print(f"\n▶️ {desc}...")
-        try:
-            result = subprocess.run(cmd, check=True)
-            if result.returncode == 0:
-                print(f"✅ {desc} 完成")
-        except subprocess.CalledProcessError as e:
-            print(f"❌ {desc} 執行失敗: {e}")
-        except Exception as e:
-            print(f"⚠️ {desc} 發生未知錯誤: {e}")
-
+    print(f"🚀 開始執行任務時間：{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}（{symbol} {interval}）")
+
+    try:
+        run_pipeline(save_outputs=["assessment"], output_dir=output_dir,
+                     symbol=symbol, interval=interval, bar_slot=bar_close_ms)
+    except PipelineStageError as e:
+        # 已完成的階段都已寫入快取，下次觸發會直接從這個階段繼續
+        print(f"❌ {e}")
+        print(f"⏩ 下次執行將從「{e.desc}」繼續")
+        names = [stage.name for stage in STAGES]
+        if names.index(e.stage) <= names.index("assessment"):
+            report_path = None  # 評估報告還沒寫出（之後的 save_sql 失敗時報告仍是這次的）
+    except Exception as e:
+        print(f"⚠️ 發生未知錯誤: {e}")
+        report_path = None
+
+    if report_path:
+        print(f"📄 評估報告：{report_path}")
     print(f"🎯 任務結束時間：{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     print("────────────────────────────────────────\n")
+    return report_path
 
 
-def schedule_c4h_jobs():
-    """設定每 4 小時執行一次"""
-    times = ["03:56", "07:56", "11:56", "15:56", "19:56", "23:56"]
-    for t in times:
-        schedule.every().day.at(t).do(run_job)
-        print(f"🕒 已排程：每日 {t} 執行")
-
-    print("\n✅ 排程啟動成功，等待下一個觸發時間...\n")
-
-    while True:
-        schedule.run_pending()
-        time.sleep(1)
+def schedule_bar_close_jobs(intervals=("4h",), symbol="BTCUSDT", grace_seconds=3.0):
+    """每根 K 線收盤（+ grace 秒）並確認已收盤後執行一次，可同時排程多個 interval"""
+    from bar_scheduler import BarCloseScheduler
+    BarCloseScheduler(run_job, intervals=intervals, symbol=symbol, grace_seconds=grace_seconds).run_forever()
 
 
 if __name__ == "__main__":
-    # True = 定期自動執行
+    # True = 定期自動執行（每根 K 線收盤後觸發）
     # False = 立即執行一次
     AUTO_MODE = False
 
     if AUTO_MODE:
-        schedule_c4h_jobs()
+        schedule_bar_close_jobs(intervals=["4h"])
     else:
         run_job()
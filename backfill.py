@@ -0,0 +1,165 @@
+"""
+深度歷史 K 線回補（突破 Binance 單次 1000 根的限制）
+
+- 把任意時間區間切成每頁 1000 根的請求，以 thread pool 並行抓取
+- 以 token bucket 控制請求權重，並依回應標頭 X-MBX-USED-WEIGHT-1M 與伺服器同步剩餘額度
+- 連線池、429 / 418 的 Retry-After 與錯誤重試由共用 http_client 處理
+- 每頁回應直接解析成具型別的陣列（kline_parser），拼接、排序、去重都在陣列上完成，
+  最後才建一次 DataFrame，並可直接寫入本地 K 線資料庫（kline_store）
+
+使用方式
+    python backfill.py --symbol BTCUSDT --interval 1h --start 2021-01-01
+    python backfill.py --symbol ETHUSDT --interval 15m --start 2023-01-01 --end 2024-01-01 --workers 8
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import fetch_data
+from fetch_data import INTERVAL_MS, klines_to_frame
+from http_client import get_client
+from kline_parser import closed_only, concat, parse_klines, sort_dedupe
+
+KLINES_PATH = "/api/v3/klines"
+PAGE_BARS = 1000
+KLINES_WEIGHT = 2            # /api/v3/klines 每次請求權重
+WEIGHT_LIMIT_PER_MIN = 6000  # Binance 現貨 REQUEST_WEIGHT 每分鐘上限
+SAFETY_RATIO = 0.8           # 只用上限的 80%，保留給其他程式（排程、下單）
+
+
+class TokenBucket:
+    """
+    請求權重的 token bucket（執行緒安全）：
+    - 容量 = 每分鐘權重上限 × SAFETY_RATIO，每秒補充 容量/60
+    - observe() 以伺服器回報的已用權重校正剩餘 token
+    """
+
+    def __init__(self, limit_per_min=WEIGHT_LIMIT_PER_MIN, safety=SAFETY_RATIO):
+        self.capacity = limit_per_min * safety
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, weight=1):
+        while True:
+            with self.lock:
+                self._refill(time.monotonic())
+                if self.tokens >= weight:
+                    self.tokens -= weight
+                    return
+                wait = (weight - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def observe(self, used_weight):
+        """以伺服器回報的本分鐘已用權重校正（只會往下調，不會多給 token）"""
+        if used_weight is None:
+            return
+        with self.lock:
+            self._refill(time.monotonic())
+            self.tokens = min(self.tokens, self.capacity - used_weight)
+
+
+def page_ranges(start_ms, end_ms, step, page_bars=PAGE_BARS):
+    """把 [start_ms, end_ms] 依 open_time 切成每頁最多 page_bars 根的 (startTime, endTime)"""
+    first_open = -(-start_ms // step) * step  # 對齊到第一根 K 線的 open_time（無條件進位）
+    pages = []
+    cur = first_open
+    while cur <= end_ms:
+        page_end = min(cur + page_bars * step - 1, end_ms)
+        pages.append((cur, page_end))
+        cur += page_bars * step
+    return pages
+
+
+def _fetch_page(params, limiter, max_attempts=6):
+    """抓一頁；先向 token bucket 取得權重額度，回傳解析好的 {欄位: 陣列}"""
+    limiter.acquire(KLINES_WEIGHT)
+    try:
+        # 每次讀取 fetch_data.BASE_URL，指向本地替身時回補也跟著改
+        resp = get_client().request("GET", fetch_data.BASE_URL + KLINES_PATH, params=params,
+                                    max_attempts=max_attempts)
+        resp.raise_for_status()
+    except Exception as e:
+        raise RuntimeError(f"❌ 分頁 {params.get('startTime')} 多次重試後仍失敗：{e}")
+    used = resp.headers.get("X-MBX-USED-WEIGHT-1M")
+    limiter.observe(int(used) if used is not None else None)
+    return parse_klines(resp.content)
+
+
+def fetch_pages(symbol, interval, pages, max_workers=8, limiter=None, now_ms=None):
+    """
+    並行抓取多個 (startTime, endTime) 分頁（每頁最多 PAGE_BARS 根），
+    回傳依 open_time 排序、去重後的已收盤 K 線（本地資料庫格式）。
+    """
+    limiter = limiter or TokenBucket()
+    if now_ms is None:
+        now_ms = int(time.time() * 1000)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = [
+            pool.submit(_fetch_page, {
+                "symbol": symbol, "interval": interval,
+                "startTime": s, "endTime": e, "limit": PAGE_BARS,
+            }, limiter)
+            for s, e in pages
+        ]
+        # 依頁序收集，確保拼接順序
+        parts = [fut.result() for fut in futures]
+
+    return klines_to_frame(sort_dedupe(closed_only(concat(parts), now_ms)))
+
+
+def backfill_klines(symbol, interval, start_ms, end_ms=None, max_workers=8, store=None, limiter=None):
+    """
+    並行抓取 [start_ms, end_ms] 的所有已收盤 K 線，回傳本地資料庫格式的 DataFrame
+    （依 open_time 排序、去重）。有給 store 時同時寫入本地資料庫。
+    end_ms 預設為現在；尚未收盤的 K 線會被排除。
+    """
+    if interval not in INTERVAL_MS or interval == "1M":
+        raise ValueError(f"不支援的 interval: {interval}")
+    step = INTERVAL_MS[interval]
+    now_ms = int(time.time() * 1000)
+    end_ms = min(end_ms if end_ms is not None else now_ms, now_ms)
+    pages = page_ranges(start_ms, end_ms, step)
+    if not pages:
+        return klines_to_frame([])
+
+    print(f"📥 回補 {symbol} {interval}：{len(pages)} 頁（約 {len(pages) * PAGE_BARS:,} 根），{max_workers} 條執行緒")
+    started = time.perf_counter()
+    df = fetch_pages(symbol, interval, pages, max_workers=max_workers, limiter=limiter, now_ms=now_ms)
+    print(f"✅ 回補完成：{len(df):,} 根，耗時 {time.perf_counter() - started:.1f}s")
+
+    if store is not None and len(df):
+        added = store.append(symbol, interval, df)
+        print(f"🗄️ 寫入本地資料庫 {symbol} {interval}：新增 {added:,} 根（共 {store.count(symbol, interval):,} 根）")
+    return df
+
+
+def _parse_date_ms(text):
+    dt = datetime.fromisoformat(text)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp() * 1000)
+
+
+if __name__ == "__main__":
+    import argparse
+    from kline_store import KlineStore
+
+    parser = argparse.ArgumentParser(description="並行回補任意區間的歷史 K 線到本地資料庫")
+    parser.add_argument("--symbol", default="BTCUSDT")
+    parser.add_argument("--interval", default="1h")
+    parser.add_argument("--start", required=True, help="開始日期（UTC），例如 2021-01-01")
+    parser.add_argument("--end", default=None, help="結束日期（UTC，預設現在）")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--store-dir", default="data/store")
+    args = parser.parse_args()
+
+    backfill_klines(args.symbol, args.interval, _parse_date_ms(args.start),
+                    _parse_date_ms(args.end) if args.end else None,
+                    max_workers=args.workers, store=KlineStore(args.store_dir))
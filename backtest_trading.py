@@ -1,6 +1,5 @@
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
 import os
 from datetime import datetime
 
@@ -9,7 +8,9 @@ class TradingBacktest:
         """
         初始化回測器
         """
-        self.df = pd.read_csv(signals_file)
+        from columnar_store import read_frame
+        # 欄式資料表的 Date 已是 datetime，不必再從字串解析
+        self.df = read_frame(signals_file)
         self.df['Date'] = pd.to_datetime(self.df['Date'])
         self.trades = []
         self.position = None  # None, 'long', 'short'
@@ -250,6 +251,11 @@ class TradingBacktest:
 
         # ========== 繪製權益曲線（按 exit_time） ==========
         try:
+            # matplotlib 載入很慢，只在真的要畫圖時才 import
+            import matplotlib
+            matplotlib.use("Agg")
+            import matplotlib.pyplot as plt
+
             # 取出槓桿化 pnl 欄（若不存在，使用未槓桿 pnl）
             pnl_col = 'pnl_leveraged' if 'pnl_leveraged' in trades_df.columns else 'pnl'
             trades_df = trades_df.sort_values('exit_time')
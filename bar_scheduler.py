@@ -0,0 +1,124 @@
+"""
+K 線收盤驅動的排程器
+
+不再寫死本地時間（"03:56"、"07:56"...），而是：
+1. 由 INTERVAL_MS 與交易所時鐘偏移算出下一根 K 線的收盤時間
+2. 在「收盤 + grace 秒」準時醒來
+3. 以 get_latest_closed_kline_close_time 確認該 K 線確實已收盤後才執行任務
+4. 可同時排程多個 interval（同一時刻收盤的 interval 依序執行）
+
+使用方式
+    from bar_scheduler import BarCloseScheduler
+    BarCloseScheduler(run_job, intervals=["1h", "4h"], grace_seconds=3).run_forever()
+"""
+import heapq
+import time
+from datetime import datetime, timezone
+
+from fetch_data import (BAR_ALIGN_OFFSET_MS, INTERVAL_MS, get_latest_closed_kline_close_time,
+                        get_server_time_offset_ms)
+
+
+def next_bar_close_ms(interval: str, server_now_ms: int) -> int:
+    """
+    回傳 server_now_ms 之後下一個 K 線收盤邊界（= 下一根 K 線的 open_time，毫秒）。
+    該根 K 線的 close_time 為回傳值 - 1。
+    """
+    if interval == "1M":
+        raise ValueError("月線長度不固定，無法以 INTERVAL_MS 推算收盤時間")
+    if interval not in INTERVAL_MS:
+        raise ValueError(f"不支援的 interval: {interval}")
+    step = INTERVAL_MS[interval]
+    align = BAR_ALIGN_OFFSET_MS.get(interval, 0)
+    return ((server_now_ms - align) // step + 1) * step + align
+
+
+def _fmt_ms(ms):
+    return datetime.fromtimestamp(ms / 1000, tz=timezone.utc).strftime('%Y-%m-%d %H:%M:%S UTC')
+
+
+class BarCloseScheduler:
+    """
+    在每根 K 線收盤後觸發 job(symbol=..., interval=..., bar_close_ms=...)。
+    - intervals: 要排程的 interval 清單（例如 ["4h"] 或 ["15m", "1h", "4h"]）
+    - grace_seconds: 收盤後再等幾秒（讓交易所完成 K 線結算）
+    - confirm_timeout: 確認收盤的最長等待秒數；逾時仍未確認就跳過該根 K 線
+    - confirm_poll: 確認失敗時的重試間隔（秒）
+    """
+
+    def __init__(self, job, intervals=("4h",), symbol="BTCUSDT", grace_seconds=3.0,
+                 confirm_timeout=60.0, confirm_poll=1.0):
+        for interval in intervals:
+            next_bar_close_ms(interval, 0)  # 提早檢查 interval 是否支援
+        self.job = job
+        self.intervals = list(intervals)
+        self.symbol = symbol
+        self.grace_ms = int(grace_seconds * 1000)
+        self.confirm_timeout = confirm_timeout
+        self.confirm_poll = confirm_poll
+        self.offset_ms = 0
+
+    def sync_clock(self):
+        """更新交易所時鐘偏移；失敗時沿用上一次的值"""
+        try:
+            self.offset_ms = get_server_time_offset_ms()
+            print(f"🕒 與 Binance 伺服器時間差：{self.offset_ms} ms")
+        except Exception as e:
+            print(f"⚠️ 無法取得伺服器時間差，沿用 {self.offset_ms} ms：{e}")
+
+    def server_now_ms(self):
+        return int(time.time() * 1000) + self.offset_ms
+
+    def _sleep_until(self, server_ms):
+        """睡到伺服器時間 server_ms；長時間等待時分段睡並在醒來前重新校時"""
+        while True:
+            remaining = (server_ms - self.server_now_ms()) / 1000
+            if remaining <= 0:
+                return
+            if remaining > 120:
+                time.sleep(remaining - 60)
+                self.sync_clock()
+            else:
+                time.sleep(min(remaining, 30))
+
+    def confirm_closed(self, interval, boundary_ms):
+        """確認 close_time = boundary_ms - 1 的 K 線已收盤"""
+        expected_close = boundary_ms - 1
+        deadline = time.monotonic() + self.confirm_timeout
+        while True:
+            try:
+                latest = get_latest_closed_kline_close_time(self.symbol, interval, now_ms=self.server_now_ms())
+                if latest >= expected_close:
+                    return True
+                print(f"⏳ {interval} 最新已收盤 K 線仍為 {_fmt_ms(latest + 1)}，等待交易所結算...")
+            except Exception as e:
+                print(f"⚠️ 確認 {interval} 收盤失敗：{e}")
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(self.confirm_poll)
+
+    def run_forever(self):
+        self.sync_clock()
+        now = self.server_now_ms()
+        heap = [(next_bar_close_ms(i, now), idx, i) for idx, i in enumerate(self.intervals)]
+        heapq.heapify(heap)
+        for boundary, _, interval in sorted(heap):
+            print(f"🕒 已排程：{self.symbol} {interval} 下次收盤 {_fmt_ms(boundary)}（+{self.grace_ms / 1000:.1f}s）")
+        print("\n✅ 排程啟動成功，等待下一根 K 線收盤...\n")
+
+        while True:
+            boundary, idx, interval = heapq.heappop(heap)
+            self._sleep_until(boundary + self.grace_ms)
+
+            if self.confirm_closed(interval, boundary):
+                lag = (self.server_now_ms() - boundary) / 1000
+                print(f"🔔 {self.symbol} {interval} K 線已收盤（{_fmt_ms(boundary)}，延遲 {lag:.1f}s）")
+                try:
+                    self.job(symbol=self.symbol, interval=interval, bar_close_ms=boundary)
+                except Exception as e:
+                    print(f"❌ {interval} 任務執行失敗: {e}")
+            else:
+                print(f"⚠️ {interval} K 線 {_fmt_ms(boundary)} 逾時仍未確認收盤，跳過本次")
+
+            # 任務可能跑很久，以執行後的時間重新計算，避免補跑已過期的 K 線
+            heapq.heappush(heap, (next_bar_close_ms(interval, max(self.server_now_ms(), boundary)), idx, interval))
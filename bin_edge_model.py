@@ -0,0 +1,192 @@
+"""
+可保存的分箱邊界模型：在訓練區間學出每個特徵的邊界，之後的 K 線都用同一組邊界分箱
+
+bin_features 每次執行都從頭算分位數，邊界從未記錄；feature_analysis_report.json 的最佳箱子
+是用哪一組邊界得到的，之後也無從得知。BinEdgeModel：
+- fit：每個數值特徵以訓練區間的全部有效值算 qcut(q=5) 分位數邊界（重複邊界合併），
+  Weekday 以 cut(bins=7) 的等寬邊界；非數值欄位維持以字串當分類標籤
+- save / load：邊界存成 JSON（float 以 repr 寫出，讀回逐位元相同）
+- transform：每個欄位以 np.searchsorted 一次分完整段資料；transform_row 把所有特徵的邊界
+  排成補 +inf 的矩陣，一次比較就得到最新一根的全部箱子（每根數微秒）
+- 超出訓練範圍的值歸到最外側的箱子（新高落在最高箱），不會變成缺值；NaN 仍為 NaN
+
+分箱代碼一律為 float64（缺值 NaN），不隨資料是否有缺值改變型別，訓練與即時運行的箱子標籤因此一致。
+在訓練資料本身上，結果與 pd.qcut(整欄, q=5, labels=False, duplicates='drop') 相同。
+
+    python bin_edge_model.py --fit --input data/cleaned_features.csv --edges data/bin_edges.json
+    python bin_edge_model.py --input data/cleaned_features.csv --edges data/bin_edges.json --output data/binned_features.csv
+"""
+import json
+
+import numpy as np
+
+from binned_features import QCUT_BINS, QUANTILES, WEEKDAY_BINS, cut_edges, is_numeric
+
+FORMAT_VERSION = 1
+BASE_COLS = ['Date', 'open', 'high', 'low', 'close']
+
+
+def _column_kind(df, col):
+    if col == 'Weekday':
+        return 'weekday'
+    return 'qcut' if is_numeric(df[col].dtype) else 'text'
+
+
+def fit_edges(values, kind):
+    """一個欄位的分箱邊界（已排序、無重複的 list）；有效值（非 NaN、非 ±inf）不足時為空 list"""
+    values = np.asarray(values, dtype=np.float64)
+    values = values[np.isfinite(values)]
+    if not len(values):
+        return []
+    if kind == 'weekday':
+        edges = cut_edges(values.min(), values.max(), WEEKDAY_BINS)
+    else:
+        edges = np.quantile(values, QUANTILES)
+    edges = edges[np.r_[True, edges[1:] != edges[:-1]]]
+    return edges.tolist()
+
+
+class BinEdgeModel:
+    """每個欄位的分箱邊界：columns = {欄位: {"kind": "qcut" / "weekday" / "text", "edges": [...]}}"""
+
+    def __init__(self, columns, meta=None):
+        self.columns = {name: dict(spec) for name, spec in columns.items()}
+        self.meta = dict(meta or {})
+        self._numeric = [name for name, spec in self.columns.items() if spec['kind'] != 'text']
+        # (特徵, 最多邊界數) 的矩陣，不足的位置補 +inf（永遠不會小於任何值）
+        width = max([len(self.columns[name]['edges']) for name in self._numeric] or [0])
+        self._matrix = np.full((len(self._numeric), width), np.inf)
+        self._counts = np.zeros(len(self._numeric), dtype=np.int64)
+        for j, name in enumerate(self._numeric):
+            edges = self.columns[name]['edges']
+            self._matrix[j, :len(edges)] = edges
+            self._counts[j] = len(edges)
+
+    @classmethod
+    def fit(cls, df):
+        """以 df（訓練區間的特徵）學出每個欄位的邊界；Date 不分箱"""
+        columns = {}
+        for col in df.columns:
+            if col == 'Date':
+                continue
+            kind = _column_kind(df, col)
+            edges = [] if kind == 'text' else fit_edges(df[col].to_numpy(dtype=np.float64), kind)
+            columns[col] = {"kind": kind, "edges": edges}
+        meta = {"rows": len(df), "q": QCUT_BINS, "weekday_bins": WEEKDAY_BINS}
+        if 'Date' in df.columns and len(df):
+            meta.update(start=str(df['Date'].iloc[0]), end=str(df['Date'].iloc[-1]))
+        return cls(columns, meta)
+
+    def save(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({"version": FORMAT_VERSION, "meta": self.meta, "columns": self.columns},
+                      f, ensure_ascii=False, indent=2)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get("version") != FORMAT_VERSION:
+            raise ValueError(f"不支援的分箱邊界檔版本：{data.get('version')}（{path}）")
+        return cls(data["columns"], data.get("meta"))
+
+    def _check_columns(self, columns):
+        missing = [c for c in self.columns if c not in columns]
+        if missing:
+            raise ValueError(f"資料缺少分箱模型的欄位：{', '.join(missing)}")
+
+    @staticmethod
+    def _codes(ids, counts, values):
+        """searchsorted(side='left') 的結果 → 箱子代碼：超出範圍的歸到最外側，缺值或邊界不足兩個為 NaN"""
+        codes = (np.clip(ids, 1, np.maximum(counts - 1, 1)) - 1).astype(np.float64)
+        codes[np.isnan(values) | (counts < 2)] = np.nan
+        return codes
+
+    def transform(self, df, compact=False):
+        """與 bin_features 相同的輸出格式（基本欄位 + "{col}_binned"），以保存的邊界分箱"""
+        import pandas as pd
+        self._check_columns(df.columns)
+        output = {c: df[c].reset_index(drop=True) for c in BASE_COLS if c in df.columns}
+        for col, spec in self.columns.items():
+            if spec['kind'] == 'text':
+                binned = df[col].astype(str).reset_index(drop=True)
+            else:
+                values = df[col].to_numpy(dtype=np.float64)
+                edges = np.asarray(spec['edges'], dtype=np.float64)
+                binned = self._codes(np.searchsorted(edges, values, side='left'), len(edges), values)
+            output[f"{col}_binned"] = binned
+        output_df = pd.DataFrame(output, index=pd.RangeIndex(len(df)))
+        if compact:
+            from compact_frames import compact_bins
+            output_df = compact_bins(output_df)
+        return output_df
+
+    def transform_row(self, row):
+        """單根 K 線（dict 或 Series）→ {"{col}_binned": 代碼}；所有數值特徵一次比較完成"""
+        values = np.array([row[name] for name in self._numeric], dtype=np.float64)
+        ids = (self._matrix < values[:, None]).sum(axis=1)
+        codes = dict(zip(self._numeric, self._codes(ids, self._counts, values).tolist()))
+        return {f"{name}_binned": codes[name] if name in codes else str(row[name]) for name in self.columns}
+
+
+def load_or_fit(path, features):
+    """path 已存在時讀入邊界；否則以 features 訓練並保存（回傳 (模型, 是否新訓練)）"""
+    import os
+    if os.path.exists(path):
+        return BinEdgeModel.load(path), False
+    model = BinEdgeModel.fit(features)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    model.save(path)
+    return model, True
+
+
+def _training_span(df, start=None, end=None):
+    """依 Date 取出 [start, end] 的訓練區間（不指定則為全部）"""
+    if start is None and end is None:
+        return df
+    import pandas as pd
+    dates = pd.to_datetime(df['Date'], utc=True)
+    mask = np.ones(len(df), dtype=bool)
+    if start is not None:
+        mask &= (dates >= pd.Timestamp(start, tz='UTC')).to_numpy()
+    if end is not None:
+        mask &= (dates <= pd.Timestamp(end, tz='UTC')).to_numpy()
+    return df[mask]
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="訓練 / 套用保存的分箱邊界")
+    parser.add_argument("--input", default="data/cleaned_features.csv")
+    parser.add_argument("--edges", default="data/bin_edges.json")
+    parser.add_argument("--fit", action="store_true", help="以 --input 的訓練區間重新學習邊界並保存")
+    parser.add_argument("--start", default=None, help="訓練區間起點（Date，例如 2024-01-01）")
+    parser.add_argument("--end", default=None, help="訓練區間終點（含）")
+    parser.add_argument("--output", default=None, help="以邊界分箱後寫出（預設不寫）")
+    args = parser.parse_args()
+
+    from columnar_store import read_frame
+    df = read_frame(args.input)
+    if args.fit:
+        train = _training_span(df, args.start, args.end)
+        model = BinEdgeModel.fit(train)
+        model.save(args.edges)
+        print(f"💾 以 {len(train)} 列訓練 {len(model.columns)} 個欄位的邊界 → {args.edges}")
+    else:
+        model = BinEdgeModel.load(args.edges)
+        print(f"📂 讀入 {args.edges}（訓練 {model.meta.get('rows')} 列，"
+              f"{model.meta.get('start')} ~ {model.meta.get('end')}）")
+
+    started = time.perf_counter()
+    binned = model.transform(df)
+    print(f"📊 分箱 {len(df)} 列：{(time.perf_counter() - started) * 1000:.1f}ms")
+    rows = df.tail(min(len(df), 1000)).to_dict('records')
+    started = time.perf_counter()
+    for row in rows:
+        model.transform_row(row)
+    print(f"⚡ 單根即時分箱：每根 {(time.perf_counter() - started) / max(len(rows), 1) * 1e6:.1f}µs")
+    if args.output:
+        binned.to_csv(args.output, index=False)
+        print(f"💾 已儲存：{args.output}")
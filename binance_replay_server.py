@@ -0,0 +1,654 @@
+"""
+本地 Binance REST 替身（離線重播 / 合成資料）
+
+不連 api.binance.com / fapi.binance.com 也能跑 fetch_data、backfill、pipeline、go_again，
+讓效能量測與 CI 結果可重現。提供：
+- 現貨：/api/v3/klines、/api/v3/time
+- 合約：/fapi/v1/time、/fapi/v1/ping、/fapi/v1/ticker/price、/fapi/v2/account、
+        /fapi/v2/positionRisk、/fapi/v1/order、/fapi/v1/marginType、/fapi/v1/leverage
+- K 線來源：本地 K 線資料庫（kline_store，真實錄下的資料）或固定種子的合成隨機漫步
+- 模擬 Binance 行為：每分鐘權重上限與 X-MBX-USED-WEIGHT-1M、簽章 / recvWindow 檢查、
+  尚未收盤的最後一根 K 線、可指定起點或凍結的伺服器時鐘
+- 故障注入：固定延遲 + 抖動、隨機 429（附 Retry-After）、418、5xx
+- 管理端點：GET /_replay/stats（各 endpoint 次數與狀態碼）、POST /_replay/faults（執行中調整故障設定）
+
+使用方式
+    python binance_replay_server.py --port 8765 --latency-ms 20 --rate-limit-rate 0.02
+    BINANCE_BASE_URL=http://127.0.0.1:8765 python pipeline.py --skip save_sql
+    python go_again.py --live --base-url http://127.0.0.1:8765
+
+    python binance_replay_server.py bench --requests 500 --concurrency 16 --latency-ms 5
+
+    from binance_replay_server import ReplayServer
+    with ReplayServer(now_ms=1_700_000_000_000, freeze=True, latency_ms=10) as srv:
+        fetch_data.BASE_URL = srv.url
+"""
+import hashlib
+import hmac
+import json
+import random
+import socket
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+import numpy as np
+
+from fetch_data import BAR_ALIGN_OFFSET_MS, INTERVAL_MS
+
+SYNTH_EPOCH_MS = 1_577_836_800_000   # 2020-01-01 00:00 UTC：合成 K 線的第一根
+SYNTH_CHUNK_BARS = 65_536            # 合成資料每次生成的根數（依序生成，確保價格連續且可重現）
+
+# 各 endpoint 的請求權重（依 Binance 文件取常見值）
+ENDPOINT_WEIGHTS = {
+    "/api/v3/klines": 2,
+    "/api/v3/time": 1,
+    "/fapi/v1/time": 1,
+    "/fapi/v1/ping": 1,
+    "/fapi/v1/ticker/price": 1,
+    "/fapi/v2/account": 5,
+    "/fapi/v2/positionRisk": 5,
+    "/fapi/v1/order": 1,
+    "/fapi/v1/marginType": 1,
+    "/fapi/v1/leverage": 1,
+}
+SIGNED_ENDPOINTS = ("/fapi/v2/account", "/fapi/v2/positionRisk", "/fapi/v1/order",
+                    "/fapi/v1/marginType", "/fapi/v1/leverage")
+
+
+class ApiError(Exception):
+    """以 Binance 錯誤格式回應：HTTP status + {"code", "msg"}"""
+
+    def __init__(self, status, code, msg, headers=None):
+        super().__init__(msg)
+        self.status = status
+        self.code = code
+        self.msg = msg
+        self.headers = headers or {}
+
+
+def _first_open(interval, epoch_ms):
+    step = INTERVAL_MS[interval]
+    align = BAR_ALIGN_OFFSET_MS.get(interval, 0)
+    return -(-(epoch_ms - align) // step) * step + align
+
+
+# === K 線來源 ===
+class SyntheticKlines:
+    """
+    固定種子的合成 K 線：每個 (symbol, interval) 從 SYNTH_EPOCH_MS 開始的對數常態隨機漫步。
+    依 chunk 依序生成並快取，同樣的參數永遠得到同樣的資料。
+    """
+
+    def __init__(self, seed=0, epoch_ms=SYNTH_EPOCH_MS, start_price=30_000.0):
+        self.seed = seed
+        self.epoch_ms = epoch_ms
+        self.start_price = start_price
+        self._chunks = {}
+        self._lock = threading.Lock()
+
+    def first_open(self, symbol, interval):
+        return _first_open(interval, self.epoch_ms)
+
+    def _chunk(self, symbol, interval, k):
+        key = (symbol, interval)
+        with self._lock:
+            chunks = self._chunks.setdefault(key, [])
+            while len(chunks) <= k:
+                i = len(chunks)
+                prev_close = chunks[-1][:, 3][-1] if chunks else self.start_price
+                rng = np.random.default_rng([self.seed, zlib.crc32(symbol.encode()), INTERVAL_MS[interval], i])
+                n = SYNTH_CHUNK_BARS
+                vol = 0.002 * np.sqrt(INTERVAL_MS[interval] / 60_000)
+                close = prev_close * np.exp(np.cumsum(rng.normal(0, vol, n)))
+                opn = np.r_[prev_close, close[:-1]]
+                high = np.maximum(opn, close) * (1 + np.abs(rng.normal(0, vol / 2, n)))
+                low = np.minimum(opn, close) * (1 - np.abs(rng.normal(0, vol / 2, n)))
+                volume = rng.gamma(2.0, 50.0, n)
+                trades = rng.integers(100, 5000, n)
+                taker = volume * rng.uniform(0.3, 0.7, n)
+                chunks.append(np.column_stack([opn, high, low, close, volume, trades, taker]))
+            return chunks[k]
+
+    def rows(self, symbol, interval, lo, hi):
+        """第 lo ~ hi-1 根（以 first_open 為第 0 根）的 Binance klines 原始陣列"""
+        step = INTERVAL_MS[interval]
+        base = self.first_open(symbol, interval)
+        out = []
+        for i in range(lo, hi):
+            o, h, l, c, v, n, tb = self._chunk(symbol, interval, i // SYNTH_CHUNK_BARS)[i % SYNTH_CHUNK_BARS]
+            ot = base + i * step
+            out.append([ot, f"{o:.2f}", f"{h:.2f}", f"{l:.2f}", f"{c:.2f}", f"{v:.5f}", ot + step - 1,
+                        f"{v * c:.4f}", int(n), f"{tb:.5f}", f"{tb * c:.4f}", "0"])
+        return out
+
+    def klines(self, symbol, interval, now_ms, start=None, end=None, limit=500):
+        """依 Binance 的 startTime / endTime / limit 規則回傳 K 線（含尚未收盤的最後一根）"""
+        step = INTERVAL_MS[interval]
+        base = self.first_open(symbol, interval)
+        last = (now_ms - base) // step          # 目前（尚未收盤）那一根
+        if last < 0:
+            return []
+        if end is not None:
+            last = min(last, (end - base) // step)
+        if start is not None:
+            lo = max(0, -(-(start - base) // step))
+            hi = min(last + 1, lo + limit)
+        else:
+            hi = last + 1
+            lo = max(0, hi - limit)
+        return self.rows(symbol, interval, lo, hi) if hi > lo else []
+
+    def price(self, symbol, now_ms, interval="1m"):
+        rows = self.klines(symbol, interval, now_ms, limit=1)
+        return float(rows[-1][4]) if rows else self.start_price
+
+
+class RecordedKlines:
+    """以本地 K 線資料庫（錄下的真實資料）回應；資料庫沒有的 (symbol, interval) 交給 fallback"""
+
+    def __init__(self, store, fallback=None):
+        self.store = store
+        self.fallback = fallback
+        self._frames = {}
+        self._lock = threading.Lock()
+
+    def _frame(self, symbol, interval):
+        with self._lock:
+            if (symbol, interval) not in self._frames:
+                df = self.store.load(symbol, interval)
+                self._frames[(symbol, interval)] = df if len(df) else None
+            return self._frames[(symbol, interval)]
+
+    def klines(self, symbol, interval, now_ms, start=None, end=None, limit=500):
+        df = self._frame(symbol, interval)
+        if df is None:
+            if self.fallback is None:
+                return []
+            return self.fallback.klines(symbol, interval, now_ms, start, end, limit)
+        t = df["open_time"].to_numpy()
+        hi = int(np.searchsorted(t, min(now_ms, end) if end is not None else now_ms, side="right"))
+        if start is not None:
+            lo = int(np.searchsorted(t, start, side="left"))
+            hi = min(hi, lo + limit)
+        else:
+            lo = max(0, hi - limit)
+        part = df.iloc[lo:hi]
+        return [[int(r.open_time), f"{r.open}", f"{r.high}", f"{r.low}", f"{r.close}", f"{r.volume}",
+                 int(r.close_time), f"{r.quote_asset_volume}", int(r.num_trades),
+                 f"{r.taker_buy_base_asset_volume}", f"{r.taker_buy_quote_asset_volume}", "0"]
+                for r in part.itertuples(index=False)]
+
+    def price(self, symbol, now_ms, interval="1m"):
+        for iv in (interval, *INTERVAL_MS):
+            if iv != "1M" and self._frame(symbol, iv) is not None:
+                rows = self.klines(symbol, iv, now_ms, limit=1)
+                if rows:
+                    return float(rows[-1][4])
+        return self.fallback.price(symbol, now_ms, interval) if self.fallback else 0.0
+
+
+# === 模擬交易所 ===
+class ReplayExchange:
+    """
+    替身伺服器的狀態：時鐘、權重計數、故障設定、模擬合約帳戶、統計。
+    - now_ms: 伺服器時鐘的起點（None 表示跟著本地時鐘走，再加上 clock_offset_ms）
+    - freeze: 時鐘停在 now_ms 不動（K 線回應完全可重現；此時不檢查 recvWindow）
+    - clock: 回傳伺服器時間（毫秒）的函式，取代上面的時鐘設定（例如與 binance_ws 的串流替身共用時鐘）
+    - weight_limit: 每分鐘權重上限（超過回 429）
+    - api_secret: 有給時驗證 HMAC 簽章
+    - faults: latency_ms / jitter_ms / rate_limit_rate / ban_rate / error_rate / retry_after / paths
+    """
+
+    DEFAULT_FAULTS = {
+        "latency_ms": 0.0, "jitter_ms": 0.0,
+        "rate_limit_rate": 0.0, "ban_rate": 0.0, "error_rate": 0.0,
+        "retry_after": 1, "paths": None,
+    }
+
+    def __init__(self, source=None, now_ms=None, freeze=False, clock_offset_ms=0, weight_limit=6000,
+                 api_secret=None, initial_balance=10_000.0, seed=0, clock=None, **faults):
+        self.source = source or SyntheticKlines(seed=seed)
+        self.clock = clock
+        self.start_ms = now_ms
+        self.freeze = freeze and now_ms is not None
+        self.started = time.monotonic()
+        self.clock_offset_ms = clock_offset_ms
+        self.weight_limit = weight_limit
+        self.api_secret = api_secret
+        self.faults = dict(self.DEFAULT_FAULTS)
+        self.set_faults(**faults)
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.weight_minute = None
+        self.weight_used = 0
+        self.stats = {}
+        self.balance = initial_balance
+        self.positions = {}
+        self.leverage = {}
+        self.margin_type = {}
+        self.next_order_id = 1
+
+    def set_faults(self, **faults):
+        unknown = set(faults) - set(self.DEFAULT_FAULTS)
+        if unknown:
+            raise ValueError(f"未知的故障設定：{sorted(unknown)}")
+        self.faults.update(faults)
+
+    def now(self):
+        if self.clock is not None:
+            return int(self.clock())
+        if self.start_ms is None:
+            return int(time.time() * 1000) + self.clock_offset_ms
+        if self.freeze:
+            return int(self.start_ms)
+        return int(self.start_ms + (time.monotonic() - self.started) * 1000)
+
+    # --- 權重與故障 ---
+    def _use_weight(self, weight):
+        """回傳本分鐘已用權重；超過上限拋出 429"""
+        now = self.now()
+        minute = now // 60_000
+        with self.lock:
+            if minute != self.weight_minute:
+                self.weight_minute, self.weight_used = minute, 0
+            self.weight_used += weight
+            used = self.weight_used
+        if used > self.weight_limit:
+            retry = max(1, (60_000 - now % 60_000 + 999) // 1000)
+            raise ApiError(429, -1003, "Too many requests; current limit is exceeded.",
+                           {"Retry-After": str(retry), "X-MBX-USED-WEIGHT-1M": str(used)})
+        return used
+
+    def _inject_faults(self, path):
+        f = self.faults
+        if f["paths"] and not any(path.startswith(p) for p in f["paths"]):
+            return
+        delay = f["latency_ms"] + (self.rng.uniform(0, f["jitter_ms"]) if f["jitter_ms"] else 0)
+        if delay > 0:
+            time.sleep(delay / 1000)
+        r = self.rng.random()
+        if r < f["rate_limit_rate"]:
+            raise ApiError(429, -1003, "Too many requests (injected).", {"Retry-After": str(f["retry_after"])})
+        r -= f["rate_limit_rate"]
+        if r < f["ban_rate"]:
+            raise ApiError(418, -1003, "IP banned (injected).", {"Retry-After": str(f["retry_after"])})
+        r -= f["ban_rate"]
+        if r < f["error_rate"]:
+            raise ApiError(503, -1001, "Internal error (injected).")
+
+    def _record(self, path, status):
+        with self.lock:
+            s = self.stats.setdefault(path, {})
+            s[str(status)] = s.get(str(status), 0) + 1
+
+    # --- 簽章 ---
+    def _check_signed(self, params, raw_query, headers):
+        if not headers.get("X-MBX-APIKEY"):
+            raise ApiError(401, -2015, "Invalid API-key, IP, or permissions for action.")
+        if "signature" not in params or "timestamp" not in params:
+            raise ApiError(400, -1102, "Mandatory parameter 'signature' or 'timestamp' was not sent.")
+        ts = int(params["timestamp"])
+        recv_window = int(params.get("recvWindow", 5000))
+        now = self.now()
+        if not self.freeze and (ts > now + 1000 or now - ts > recv_window):
+            raise ApiError(400, -1021, "Timestamp for this request is outside of the recvWindow.")
+        if self.api_secret:
+            payload = "&".join(f"{k}={v}" for k, v in parse_qsl(raw_query, keep_blank_values=True)
+                               if k != "signature")
+            expected = hmac.new(self.api_secret.encode(), payload.encode(), hashlib.sha256).hexdigest()
+            if not hmac.compare_digest(expected, params["signature"]):
+                raise ApiError(400, -1022, "Signature for this request is not valid.")
+
+    # --- 請求分派 ---
+    def handle(self, method, path, params, raw_query, headers):
+        """回傳 (status, body, headers)"""
+        extra = {}
+        try:
+            route = ROUTES.get((method, path))
+            if route is None:
+                raise ApiError(404, -1000, f"Unknown endpoint {method} {path}")
+            self._inject_faults(path)
+            extra["X-MBX-USED-WEIGHT-1M"] = str(self._use_weight(ENDPOINT_WEIGHTS.get(path, 1)))
+            if path in SIGNED_ENDPOINTS:
+                self._check_signed(params, raw_query, headers)
+            status, body = 200, route(self, params)
+        except ApiError as e:
+            status, body = e.status, {"code": e.code, "msg": e.msg}
+            extra.update(e.headers)
+        except (KeyError, ValueError) as e:
+            status, body = 400, {"code": -1102, "msg": f"Invalid parameter: {e}"}
+        self._record(path, status)
+        return status, body, extra
+
+    # --- 現貨 ---
+    def klines(self, params):
+        interval = params["interval"]
+        if interval not in INTERVAL_MS or interval == "1M":
+            raise ApiError(400, -1120, "Invalid interval.")
+        limit = int(params.get("limit", 500))
+        if not 1 <= limit <= 1000:
+            raise ApiError(400, -1130, "Data sent for parameter 'limit' is not valid.")
+        start = int(params["startTime"]) if "startTime" in params else None
+        end = int(params["endTime"]) if "endTime" in params else None
+        return self.source.klines(params["symbol"], interval, self.now(), start, end, limit)
+
+    def server_time(self, params):
+        return {"serverTime": self.now()}
+
+    # --- 合約 ---
+    def ping(self, params):
+        return {}
+
+    def ticker_price(self, params):
+        symbol = params["symbol"]
+        return {"symbol": symbol, "price": f"{self.source.price(symbol, self.now()):.2f}", "time": self.now()}
+
+    def _position_rows(self):
+        rows = []
+        with self.lock:
+            positions = dict(self.positions)
+        for symbol, (amt, entry) in positions.items():
+            mark = self.source.price(symbol, self.now())
+            lev = self.leverage.get(symbol, 20)
+            rows.append({
+                "symbol": symbol, "positionAmt": f"{amt:.3f}", "entryPrice": f"{entry:.2f}",
+                "markPrice": f"{mark:.2f}", "unRealizedProfit": f"{(mark - entry) * amt:.8f}",
+                "leverage": str(lev), "marginType": self.margin_type.get(symbol, "cross"),
+                "notional": f"{mark * amt:.8f}", "positionSide": "BOTH",
+            })
+        return rows
+
+    def account(self, params):
+        rows = self._position_rows()
+        upnl = sum(float(r["unRealizedProfit"]) for r in rows)
+        margin = sum(abs(float(r["notional"])) / int(r["leverage"]) for r in rows)
+        with self.lock:
+            wallet = self.balance
+        return {
+            "totalWalletBalance": f"{wallet:.8f}",
+            "totalUnrealizedProfit": f"{upnl:.8f}",
+            "totalMarginBalance": f"{wallet + upnl:.8f}",
+            "availableBalance": f"{wallet + upnl - margin:.8f}",
+            "assets": [{"asset": "USDT", "walletBalance": f"{wallet:.8f}"}],
+            "positions": rows,
+        }
+
+    def position_risk(self, params):
+        return self._position_rows()
+
+    def order(self, params):
+        symbol, side = params["symbol"], params["side"]
+        if params.get("type", "MARKET") != "MARKET":
+            raise ApiError(400, -1116, "Invalid orderType.（替身只支援 MARKET）")
+        qty = float(params["quantity"])
+        if qty <= 0:
+            raise ApiError(400, -4003, "Quantity less than or equal to zero.")
+        price = self.source.price(symbol, self.now())
+        signed = qty if side == "BUY" else -qty
+        with self.lock:
+            amt, entry = self.positions.get(symbol, (0.0, 0.0))
+            new_amt = round(amt + signed, 8)
+            if amt == 0 or (amt > 0) == (signed > 0):
+                # 加倉：均價加權
+                entry = (entry * abs(amt) + price * qty) / abs(new_amt)
+            else:
+                # 減倉 / 平倉：實現損益入帳
+                closed = min(abs(amt), qty)
+                self.balance += (price - entry) * closed * (1 if amt > 0 else -1)
+                if abs(new_amt) > 0 and (new_amt > 0) != (amt > 0):
+                    entry = price   # 反手
+            if new_amt == 0:
+                self.positions.pop(symbol, None)
+            else:
+                self.positions[symbol] = (new_amt, entry)
+            order_id = self.next_order_id
+            self.next_order_id += 1
+        return {
+            "orderId": order_id, "symbol": symbol, "status": "FILLED", "side": side, "type": "MARKET",
+            "origQty": f"{qty:.3f}", "executedQty": f"{qty:.3f}", "avgPrice": f"{price:.2f}",
+            "updateTime": self.now(),
+        }
+
+    def set_margin_type(self, params):
+        symbol = params["symbol"]
+        if self.margin_type.get(symbol, "cross") == params["marginType"].lower().replace("crossed", "cross"):
+            raise ApiError(400, -4046, "No need to change margin type.")
+        self.margin_type[symbol] = params["marginType"].lower().replace("crossed", "cross")
+        return {"code": 200, "msg": "success"}
+
+    def set_leverage(self, params):
+        symbol, lev = params["symbol"], int(params["leverage"])
+        self.leverage[symbol] = lev
+        return {"symbol": symbol, "leverage": lev, "maxNotionalValue": "1000000"}
+
+
+ROUTES = {
+    ("GET", "/api/v3/klines"): ReplayExchange.klines,
+    ("GET", "/api/v3/time"): ReplayExchange.server_time,
+    ("GET", "/fapi/v1/time"): ReplayExchange.server_time,
+    ("GET", "/fapi/v1/ping"): ReplayExchange.ping,
+    ("GET", "/fapi/v1/ticker/price"): ReplayExchange.ticker_price,
+    ("GET", "/fapi/v2/account"): ReplayExchange.account,
+    ("GET", "/fapi/v2/positionRisk"): ReplayExchange.position_risk,
+    ("POST", "/fapi/v1/order"): ReplayExchange.order,
+    ("POST", "/fapi/v1/marginType"): ReplayExchange.set_margin_type,
+    ("POST", "/fapi/v1/leverage"): ReplayExchange.set_leverage,
+}
+
+
+# === HTTP 伺服器 ===
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"   # keep-alive，與 http_client 的連線池搭配
+
+    def setup(self):
+        super().setup()
+        # 標頭與 body 分兩次寫出；不關 Nagle 的話 keep-alive 連線每個回應會多等 ~40ms（delayed ACK）
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, fmt, *args):
+        if self.server.verbose:
+            super().log_message(fmt, *args)
+
+    def _send(self, status, body, headers=None):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _dispatch(self, method):
+        exchange = self.server.exchange
+        parts = urlsplit(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+
+        if parts.path == "/_replay/stats":
+            return self._send(200, {"stats": exchange.stats, "faults": exchange.faults,
+                                    "weight_used": exchange.weight_used, "now": exchange.now()})
+        if parts.path == "/_replay/faults" and method == "POST":
+            try:
+                exchange.set_faults(**json.loads(body or b"{}"))
+            except (ValueError, TypeError) as e:
+                return self._send(400, {"code": -1000, "msg": str(e)})
+            return self._send(200, exchange.faults)
+
+        # Binance 的參數可以放在 query string 或 x-www-form-urlencoded body
+        raw_query = parts.query
+        if body and self.headers.get("Content-Type", "").startswith("application/x-www-form-urlencoded"):
+            raw_query = "&".join(q for q in (raw_query, body.decode()) if q)
+        params = dict(parse_qsl(raw_query, keep_blank_values=True))
+        status, payload, headers = exchange.handle(method, parts.path, params, raw_query, self.headers)
+        self._send(status, payload, headers)
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_DELETE(self):
+        self._dispatch("DELETE")
+
+
+class ReplayServer:
+    """
+    在背景執行緒啟動替身伺服器（port=0 自動挑可用埠）；可當 context manager 使用。
+    其餘參數傳給 ReplayExchange（now_ms、weight_limit、latency_ms、rate_limit_rate ...）。
+    source 可直接給資料來源（例如與 binance_ws 的串流替身共用同一個 SyntheticKlines）。
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, store_dir=None, verbose=False, source=None, **options):
+        if store_dir:
+            from kline_store import KlineStore
+            source = RecordedKlines(KlineStore(store_dir), fallback=SyntheticKlines(seed=options.get("seed", 0)))
+        self.exchange = ReplayExchange(source=source, **options)
+        self.httpd = ThreadingHTTPServer((host, port), _Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.exchange = self.exchange
+        self.httpd.verbose = verbose
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+# === 負載量測 ===
+def _percentiles(samples):
+    arr = np.sort(np.asarray(samples)) * 1000
+    if not len(arr):
+        return {}
+    out = {p: round(float(np.percentile(arr, q)), 2) for p, q in (("p50", 50), ("p95", 95), ("p99", 99))}
+    out["max"] = round(float(arr[-1]), 2)
+    return out
+
+
+def run_bench(requests_per_path=200, concurrency=8, **options):
+    """
+    啟動替身伺服器，以 concurrency 條執行緒分別壓 fetch 路徑（klines）與下單路徑（簽章 order），
+    回傳 {路徑: {count, errors, p50, p95, p99, max}}（毫秒）。
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    import fetch_data
+    import go_again
+    from http_client import get_client
+
+    options.setdefault("weight_limit", 10 ** 9)
+    with ReplayServer(**options) as srv:
+        fetch_data.BASE_URL = srv.url
+        go_again.BASE_URL = srv.url
+        go_again.API_KEY, go_again.SECRET_KEY = "bench-key", "bench-secret"
+        srv.exchange.api_secret = "bench-secret"
+        go_again.get_server_time_offset()
+
+        def fetch_once(_):
+            t0 = time.perf_counter()
+            fetch_data.fetch_with_retry(f"{srv.url}/api/v3/klines",
+                                        {"symbol": "BTCUSDT", "interval": "1m", "limit": 1000})
+            return time.perf_counter() - t0
+
+        def order_once(i):
+            t0 = time.perf_counter()
+            res = go_again._req("POST", "/fapi/v1/order", {"symbol": "BTCUSDT", "side": "BUY" if i % 2 else "SELL",
+                                                           "type": "MARKET", "quantity": 0.001})
+            if "orderId" not in res:
+                raise RuntimeError(res)
+            return time.perf_counter() - t0
+
+        fetch_once(0)   # 先生成合成資料，避免第一次請求的生成時間混進量測
+        results = {}
+        for name, fn in (("fetch klines", fetch_once), ("order", order_once)):
+            samples, errors = [], 0
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                for fut in [pool.submit(fn, i) for i in range(requests_per_path)]:
+                    try:
+                        samples.append(fut.result())
+                    except Exception:
+                        errors += 1
+            elapsed = time.perf_counter() - started
+            results[name] = {"count": len(samples), "errors": errors,
+                             "rps": round(requests_per_path / elapsed, 1), **_percentiles(samples)}
+        get_client().print_stats()
+    return results
+
+
+def _parse_time_ms(text):
+    if text is None:
+        return None
+    if text.isdigit():
+        return int(text)
+    from datetime import datetime, timezone
+    dt = datetime.fromisoformat(text)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp() * 1000)
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="本地 Binance REST 替身（重播 / 合成資料 + 故障注入）")
+    parser.add_argument("mode", nargs="?", choices=["serve", "bench"], default="serve")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--store-dir", default=None, help="使用本地 K 線資料庫的錄製資料（預設合成資料）")
+    parser.add_argument("--now", default=None, help="伺服器時鐘起點（毫秒或 ISO 日期，UTC）")
+    parser.add_argument("--freeze", action="store_true", help="時鐘停在 --now 不動（K 線回應完全可重現）")
+    parser.add_argument("--clock-offset-ms", type=int, default=0, help="伺服器時間相對本地時鐘的偏移")
+    parser.add_argument("--weight-limit", type=int, default=6000)
+    parser.add_argument("--api-secret", default=None, help="有給時驗證簽章")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="隨機回 429 的比例")
+    parser.add_argument("--ban-rate", type=float, default=0.0, help="隨機回 418 的比例")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="隨機回 503 的比例")
+    parser.add_argument("--retry-after", type=int, default=1, help="注入 429/418 時的 Retry-After 秒數")
+    parser.add_argument("--requests", type=int, default=200, help="bench：每條路徑的請求數")
+    parser.add_argument("--concurrency", type=int, default=8, help="bench：並行執行緒數")
+    parser.add_argument("--verbose", action="store_true", help="印出每個請求")
+    args = parser.parse_args()
+
+    options = dict(store_dir=args.store_dir, now_ms=_parse_time_ms(args.now), freeze=args.freeze,
+                   clock_offset_ms=args.clock_offset_ms,
+                   seed=args.seed, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                   rate_limit_rate=args.rate_limit_rate, ban_rate=args.ban_rate, error_rate=args.error_rate,
+                   retry_after=args.retry_after)
+    if args.mode == "bench":
+        results = run_bench(args.requests, args.concurrency, **options)
+        print("\n🏁 替身伺服器負載量測（毫秒）：")
+        for name, r in results.items():
+            print(f"   {name:<14} {r}")
+    else:
+        srv = ReplayServer(args.host, args.port, weight_limit=args.weight_limit, api_secret=args.api_secret,
+                           verbose=args.verbose, **options)
+        print(f"🧪 Binance 替身伺服器：{srv.url}")
+        print(f"   BINANCE_BASE_URL={srv.url}  /  go_again.py --base-url {srv.url}")
+        try:
+            srv.httpd.serve_forever()
+        except KeyboardInterrupt:
+            print("\n👋 已停止")
+        finally:
+            srv.httpd.server_close()
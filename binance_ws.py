@@ -0,0 +1,510 @@
+"""
+Binance K 線 websocket 串流寫入（asyncio）
+
+- 一條連線以 SUBSCRIBE 訂閱多個 <symbol>@kline_<interval> 串流（超過 1024 個自動分多條連線）
+- 收到 x: true（已收盤）事件時，直接把該根 K 線追加到本地 K 線資料庫（kline_store）
+  並觸發下游流程；每根新 K 線不再需要 REST 輪詢
+- 只有在連線 / 重新連線後，或偵測到事件跳號時，才用 REST 補齊期間漏掉的 K 線
+- 斷線以指數退避重連；連線滿 23.5 小時主動重連（Binance 單一連線上限 24 小時）
+- StreamReplayServer：本地 websocket 替身，以合成或錄下的 K 線模擬串流（可加速、可注入斷線），供測試使用
+
+需要 websockets 套件（pip install websockets）。
+
+使用方式
+    python binance_ws.py --pairs BTCUSDT:1m ETHUSDT:1m SOLUSDT:5m --run-pipeline
+    python binance_ws.py replay --port 8766 --bar-seconds 0.5
+    python binance_ws.py replay --port 8766 --rest-port 8765 --bar-seconds 0.5 --drop-after 30
+    python binance_ws.py --pairs BTCUSDT:1m --url ws://127.0.0.1:8766 --rest-url http://127.0.0.1:8765
+    python binance_ws.py --check --pairs BTCUSDT:1m ETHUSDT:1m SOLUSDT:5m
+"""
+import asyncio
+import json
+import os
+import time
+from collections import deque
+
+try:
+    import websockets
+    WEBSOCKETS_AVAILABLE = True
+except ImportError:
+    WEBSOCKETS_AVAILABLE = False
+
+from fetch_data import INTERVAL_MS, klines_to_frame, sync_kline_store
+
+WS_BASE_URL = os.environ.get("BINANCE_WS_URL", "wss://stream.binance.com:9443").rstrip("/")
+MAX_STREAMS_PER_CONNECTION = 1024
+SUBSCRIBE_BATCH = 200             # 每則 SUBSCRIBE 訊息的串流數
+SUBSCRIBE_INTERVAL_S = 0.25       # Binance 每條連線每秒最多 5 則訊息
+FORCED_RECONNECT_SECONDS = 23.5 * 3600
+
+
+def _require_websockets():
+    if not WEBSOCKETS_AVAILABLE:
+        raise RuntimeError("websockets 套件未安裝，無法使用串流模式（pip install websockets）")
+
+
+def stream_name(symbol, interval):
+    return f"{symbol.lower()}@kline_{interval}"
+
+
+def kline_event_to_row(k):
+    """串流事件的 k 物件 → REST klines 的原始陣列格式（可直接給 klines_to_frame）"""
+    return [k["t"], k["o"], k["h"], k["l"], k["c"], k["v"], k["T"], k["q"], k["n"], k["V"], k["Q"], "0"]
+
+
+def row_to_kline_event(row, symbol, interval, closed, event_ms=None):
+    """REST klines 原始陣列 → 串流事件（替身伺服器使用）"""
+    return {
+        "e": "kline", "E": event_ms if event_ms is not None else row[6], "s": symbol,
+        "k": {"t": row[0], "T": row[6], "s": symbol, "i": interval, "f": 0, "L": 0,
+              "o": row[1], "c": row[4], "h": row[2], "l": row[3], "v": row[5], "n": row[8],
+              "x": closed, "q": row[7], "V": row[9], "Q": row[10], "B": "0"},
+    }
+
+
+class KlineStreamIngester:
+    """
+    訂閱多個 (symbol, interval) 的 K 線串流並寫入本地資料庫。
+    - on_bar_closed(symbol, interval, bar_close_ms)：每根 K 線寫入後呼叫；
+      可為 coroutine function，否則丟到 executor（預設執行緒池）執行，不阻塞接收。
+      同一個 (symbol, interval) 一次只跑一個；前一個還沒跑完時又收盤的 K 線只保留最新一根
+    - min_bars：連線時用 REST 補齊時，資料庫至少要有的根數
+    - catch_up：連線 / 重連後是否用 REST 補齊漏掉的 K 線
+    """
+
+    def __init__(self, pairs, store, on_bar_closed=None, url=WS_BASE_URL, min_bars=500,
+                 catch_up=True, executor=None):
+        _require_websockets()
+        self.pairs = [(s.upper(), i) for s, i in pairs]
+        for _, interval in self.pairs:
+            if interval not in INTERVAL_MS or interval == "1M":
+                raise ValueError(f"不支援的 interval: {interval}")
+        self.store = store
+        self.on_bar_closed = on_bar_closed
+        self.url = url.rstrip("/")
+        self.min_bars = min_bars
+        self.catch_up = catch_up
+        self.executor = executor
+        self._by_stream = {stream_name(s, i): (s, i) for s, i in self.pairs}
+        self._locks = {}
+        self._trigger_locks = {}
+        self._latest_close = {}
+        self._last_open = {}
+        self._server_ms = None      # 最近一則事件的伺服器時間（E），REST 補齊以它判斷哪些 K 線已收盤
+        self._tasks = set()
+        self.stats = {"messages": 0, "closed_bars": 0, "appended": 0, "skipped": 0,
+                      "rest_syncs": 0, "reconnects": 0, "triggers": 0, "coalesced": 0,
+                      "lag_ms": deque(maxlen=10_000)}
+
+    # === 資料庫寫入 ===
+    def _lock(self, key):
+        if key not in self._locks:
+            self._locks[key] = asyncio.Lock()
+        return self._locks[key]
+
+    async def _sync(self, symbol, interval):
+        """以 REST 補齊到最新一根已收盤 K 線（只在連線時 / 事件跳號時使用）"""
+        await asyncio.to_thread(sync_kline_store, self.store, symbol, interval, self.min_bars, self._server_ms)
+        self.stats["rest_syncs"] += 1
+        self._last_open[(symbol, interval)] = self.store.meta(symbol, interval).get("last_open_time")
+
+    async def _catch_up_pair(self, symbol, interval):
+        async with self._lock((symbol, interval)):
+            try:
+                await self._sync(symbol, interval)
+            except Exception as e:
+                print(f"⚠️ {symbol} {interval} REST 補齊失敗：{e}")
+
+    async def _on_closed(self, symbol, interval, row):
+        key = (symbol, interval)
+        step = INTERVAL_MS[interval]
+        async with self._lock(key):
+            if key not in self._last_open:
+                self._last_open[key] = await asyncio.to_thread(
+                    lambda: self.store.meta(symbol, interval).get("last_open_time"))
+            last = self._last_open[key]
+            if last is not None and row[0] <= last:
+                self.stats["skipped"] += 1      # 補齊時已經寫入
+                return
+            if last is not None and row[0] > last + step:
+                # 中間漏了事件：改用 REST 補齊（通常會一併抓到這一根）
+                print(f"⚠️ {symbol} {interval} 串流跳號（缺 {(row[0] - last) // step - 1} 根），改以 REST 補齊")
+                try:
+                    await self._sync(symbol, interval)
+                except Exception as e:
+                    print(f"⚠️ {symbol} {interval} REST 補齊失敗：{e}")
+                last = self._last_open[key]
+            if last is None or row[0] > last:
+                # REST 還沒有這一根時仍照寫；剩下的缺口由 kline_integrity / 下次補齊處理
+                await asyncio.to_thread(self.store.append, symbol, interval, klines_to_frame([row]))
+                self._last_open[key] = row[0]
+                self.stats["appended"] += 1
+        self.stats["lag_ms"].append(int(time.time() * 1000) - row[6])
+        await self._trigger(symbol, interval, row[6] + 1)
+
+    async def _trigger(self, symbol, interval, bar_close_ms):
+        if self.on_bar_closed is None:
+            return
+        key = (symbol, interval)
+        self._latest_close[key] = max(self._latest_close.get(key, 0), bar_close_ms)
+        # 與寫入用的鎖分開：下游流程跑很久時，串流仍可繼續寫入資料庫
+        lock = self._trigger_locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            if self._latest_close[key] > bar_close_ms:
+                # 排隊期間又有更新的 K 線收盤，這一根直接交給之後那次處理
+                self.stats["coalesced"] += 1
+                return
+            await self._run_trigger(symbol, interval, bar_close_ms)
+
+    async def _run_trigger(self, symbol, interval, bar_close_ms):
+        self.stats["triggers"] += 1
+        try:
+            if asyncio.iscoroutinefunction(self.on_bar_closed):
+                await self.on_bar_closed(symbol, interval, bar_close_ms)
+            else:
+                loop = asyncio.get_running_loop()
+                await loop.run_in_executor(self.executor, self.on_bar_closed, symbol, interval, bar_close_ms)
+        except Exception as e:
+            print(f"❌ {symbol} {interval} 下游流程失敗：{e}")
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    # === 連線 ===
+    def handle_message(self, raw):
+        """解析一則串流訊息；已收盤的 K 線交給背景 task 寫入（不阻塞接收迴圈）"""
+        msg = json.loads(raw)
+        data = msg.get("data", msg)
+        if data.get("e") != "kline":
+            return  # SUBSCRIBE 回應等
+        self.stats["messages"] += 1
+        if "E" in data:
+            self._server_ms = max(self._server_ms or 0, data["E"])
+        k = data["k"]
+        if not k["x"]:
+            return
+        pair = self._by_stream.get(msg.get("stream")) or (k["s"], k["i"])
+        self.stats["closed_bars"] += 1
+        self._spawn(self._on_closed(pair[0], pair[1], kline_event_to_row(k)))
+
+    async def _subscribe(self, ws, streams):
+        for n, lo in enumerate(range(0, len(streams), SUBSCRIBE_BATCH)):
+            if n:
+                await asyncio.sleep(SUBSCRIBE_INTERVAL_S)
+            await ws.send(json.dumps({"method": "SUBSCRIBE", "params": streams[lo:lo + SUBSCRIBE_BATCH],
+                                      "id": n + 1}))
+
+    async def _connection_loop(self, streams, stop):
+        backoff = 1.0
+        first = True
+        while not stop.is_set():
+            try:
+                async with websockets.connect(self.url + "/stream", max_size=2 ** 22) as ws:
+                    if not first:
+                        self.stats["reconnects"] += 1
+                    first = False
+                    print(f"🔌 已連線 {self.url}（{len(streams)} 個串流）")
+                    await self._subscribe(ws, streams)
+                    backoff = 1.0
+                    if self.catch_up:
+                        # 先訂閱再補齊：補齊期間收盤的 K 線會排在補齊之後寫入（同一把鎖）
+                        for s in streams:
+                            self._spawn(self._catch_up_pair(*self._by_stream[s]))
+                    deadline = time.monotonic() + FORCED_RECONNECT_SECONDS
+                    while not stop.is_set():
+                        timeout = deadline - time.monotonic()
+                        if timeout <= 0:
+                            print("🔄 連線將滿 24 小時，主動重新連線")
+                            break
+                        stop_wait = asyncio.ensure_future(stop.wait())
+                        recv = asyncio.ensure_future(ws.recv())
+                        done, _ = await asyncio.wait({recv, stop_wait}, timeout=timeout,
+                                                     return_when=asyncio.FIRST_COMPLETED)
+                        stop_wait.cancel()
+                        if recv not in done:
+                            recv.cancel()
+                            continue
+                        self.handle_message(recv.result())
+            except (OSError, asyncio.TimeoutError, websockets.exceptions.WebSocketException) as e:
+                if stop.is_set():
+                    break
+                print(f"⚠️ 串流中斷：{e}，{backoff:.0f} 秒後重連")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 60.0)
+
+    async def run(self, stop=None):
+        """執行到 stop（asyncio.Event）被設定為止；結束前等待進行中的寫入完成"""
+        stop = stop or asyncio.Event()
+        streams = list(self._by_stream)
+        chunks = [streams[i:i + MAX_STREAMS_PER_CONNECTION]
+                  for i in range(0, len(streams), MAX_STREAMS_PER_CONNECTION)]
+        try:
+            await asyncio.gather(*(self._connection_loop(c, stop) for c in chunks))
+        finally:
+            if self._tasks:
+                await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+    def print_stats(self):
+        lags = sorted(self.stats["lag_ms"])
+        lag = f"，收盤到寫入延遲 p50={lags[len(lags) // 2]}ms / max={lags[-1]}ms" if lags else ""
+        s = self.stats
+        print(f"📊 串流統計：訊息 {s['messages']:,}、收盤 K 線 {s['closed_bars']:,}、寫入 {s['appended']:,}、"
+              f"略過 {s['skipped']:,}、REST 補齊 {s['rest_syncs']:,}、重連 {s['reconnects']:,}、"
+              f"觸發 {s['triggers']:,}（合併 {s['coalesced']:,}）{lag}")
+
+
+# === 本地串流替身 ===
+class StreamReplayServer:
+    """
+    本地 websocket 替身：接受 /stream 連線與 SUBSCRIBE，依訂閱的串流送出 K 線事件。
+    - 替身時鐘（now）從 start_ms 起，每 bar_seconds（真實秒數）前進一根 interval；
+      預設 start_ms 為目前最後一根已收盤 K 線的收盤時間，與 REST 替身的資料接得上
+    - 每根 interval 送 updates_per_bar 次事件：未收盤更新（x: false），跨過收盤時送上一根的收盤事件（x: true）；
+      較長週期的串流依同一個時鐘收盤（訂閱的週期不應短於 interval）
+    - source：binance_replay_server 的 SyntheticKlines / RecordedKlines（與 REST 替身共用資料）；
+      REST 替身以 ReplayServer(clock=srv.now) 共用時鐘，重連後的 REST 補齊才拿得到串流已送出的 K 線
+    - drop_after：每條連線送出幾則訊息後主動斷線（測試重連）；None 表示不斷線
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, source=None, start_ms=None, bar_seconds=1.0,
+                 updates_per_bar=3, drop_after=None, seed=0, interval="1m"):
+        _require_websockets()
+        from binance_replay_server import SyntheticKlines
+        self.host, self.port = host, port
+        self.source = source or SyntheticKlines(seed=seed)
+        self.interval = interval
+        step = INTERVAL_MS[interval]
+        self.start_ms = start_ms if start_ms is not None else int(time.time() * 1000) // step * step
+        self.bar_seconds = bar_seconds
+        self.updates_per_bar = max(1, updates_per_bar)
+        self.drop_after = drop_after
+        self.sent = 0
+        self._server = None
+        self._started = None
+
+    @property
+    def url(self):
+        return f"ws://{self.host}:{self.port}"
+
+    def now(self):
+        """替身的伺服器時間（毫秒）"""
+        if self._started is None:
+            return self.start_ms
+        elapsed = (time.monotonic() - self._started) / self.bar_seconds
+        return self.start_ms + int(elapsed * INTERVAL_MS[self.interval])
+
+    def _tick_ms(self, tick):
+        """第 tick 次送出事件時的伺服器時間（整數運算，收盤那一步恰好落在收盤時間）"""
+        return self.start_ms + tick * INTERVAL_MS[self.interval] // self.updates_per_bar
+
+    def _bar(self, symbol, interval, open_time):
+        rows = self.source.klines(symbol, interval, open_time, start=open_time, limit=1)
+        return rows[0] if rows else None
+
+    async def _handler(self, ws, path=None):
+        request = getattr(ws, "request", None)
+        path = request.path if request is not None else (path or getattr(ws, "path", ""))
+        if not path.startswith("/stream"):
+            await ws.close(code=1008, reason="only /stream is supported")
+            return
+        streams = []
+
+        async def receiver():
+            async for raw in ws:
+                msg = json.loads(raw)
+                if msg.get("method") == "SUBSCRIBE":
+                    streams.extend(p for p in msg.get("params", []) if p not in streams)
+                    await ws.send(json.dumps({"result": None, "id": msg.get("id")}))
+
+        recv_task = asyncio.create_task(receiver())
+        dt = self.bar_seconds / self.updates_per_bar
+        # 以伺服器啟動時間為時間軸：所有連線看到同一串 K 線，重連後從目前那一根繼續（中間的由 REST 補齊）
+        tick = int((time.monotonic() - self._started) / dt)
+        sent_here = 0
+        try:
+            while True:
+                await asyncio.sleep(max(0.0, self._started + (tick + 1) * dt - time.monotonic()))
+                prev, now = self._tick_ms(tick), self._tick_ms(tick + 1)
+                tick += 1
+                for name in list(streams):
+                    symbol, _, interval = name.partition("@kline_")
+                    step = INTERVAL_MS[interval]
+                    current = now // step * step        # 尚未收盤的那一根
+                    closed = prev < current             # 這一步跨過收盤：送上一根的收盤事件
+                    row = self._bar(symbol.upper(), interval, current - step if closed else current)
+                    if row is None:
+                        continue
+                    event = row_to_kline_event(row, symbol.upper(), interval, closed, event_ms=now)
+                    await ws.send(json.dumps({"stream": name, "data": event}))
+                    self.sent += 1
+                    sent_here += 1
+                    if self.drop_after is not None and sent_here >= self.drop_after:
+                        await ws.close(code=1011, reason="injected disconnect")
+                        return
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        finally:
+            recv_task.cancel()
+
+    async def start(self):
+        self._server = await websockets.serve(self._handler, self.host, self.port)
+        self.port = list(self._server.sockets)[0].getsockname()[1]
+        self._started = time.monotonic()
+        return self
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc):
+        await self.stop()
+
+
+def _run_pair_from_stream(symbol, interval, output_root, skip, quiet, store_dir, bar_close_ms):
+    from multi_runner import run_pair
+    return run_pair(symbol, interval, output_root=output_root, skip=skip, quiet=quiet,
+                    store_dir=store_dir, sync_store=False, bar_slot=bar_close_ms,
+                    incremental_features=True)
+
+
+async def _check(pairs, seconds=10.0, bar_seconds=0.2, updates_per_bar=3, drop_after=20, min_bars=200):
+    """
+    以共用時鐘的 REST + 串流替身跑 seconds 秒：串流每 drop_after 則訊息斷線一次，
+    結束後檢查資料庫每個 (symbol, interval) 都連續無缺口，且與替身資料逐筆相同。
+    回傳 ({(symbol, interval): scan 報告}, 是否與替身資料相同, 串流統計)。
+    """
+    import tempfile
+    import fetch_data
+    from binance_replay_server import ReplayServer, SyntheticKlines
+    from kline_integrity import scan_store
+    from kline_store import KlineStore
+
+    source = SyntheticKlines()
+    clock_interval = min((i for _, i in pairs), key=INTERVAL_MS.get)
+    with tempfile.TemporaryDirectory() as store_dir:
+        store = KlineStore(store_dir)
+        async with StreamReplayServer(source=source, bar_seconds=bar_seconds, updates_per_bar=updates_per_bar,
+                                      drop_after=drop_after, interval=clock_interval) as srv:
+            with ReplayServer(source=source, clock=srv.now, weight_limit=10 ** 9) as rest:
+                base_url = fetch_data.BASE_URL
+                fetch_data.BASE_URL = rest.url
+                try:
+                    ingester = KlineStreamIngester(pairs, store, url=srv.url, min_bars=min_bars)
+                    stop = asyncio.Event()
+                    task = asyncio.create_task(ingester.run(stop))
+                    await asyncio.sleep(seconds)
+                    stop.set()
+                    await task
+                finally:
+                    fetch_data.BASE_URL = base_url
+        reports, same = {}, True
+        for symbol, interval in ingester.pairs:
+            reports[(symbol, interval)] = scan_store(store, symbol, interval)
+            df = store.load(symbol, interval)
+            if not len(df):
+                same = False
+                continue
+            first, last = int(df["open_time"].iloc[0]), int(df["open_time"].iloc[-1])
+            ref = klines_to_frame(source.klines(symbol, interval, last, start=first, limit=1000))
+            same = same and df.reset_index(drop=True).equals(ref)
+    return reports, same, ingester.stats
+
+
+async def _main(args):
+    from kline_store import KlineStore
+    from multi_runner import parse_pair
+
+    if args.mode == "replay":
+        async with StreamReplayServer(args.host, args.port, bar_seconds=args.bar_seconds,
+                                      updates_per_bar=args.updates_per_bar, drop_after=args.drop_after,
+                                      interval=args.clock_interval) as srv:
+            print(f"🧪 Binance 串流替身：{srv.url}（每根 {args.clock_interval} K 線 {args.bar_seconds}s）")
+            if args.rest_port is None:
+                await asyncio.Future()
+            # REST 替身與串流共用同一個時鐘與資料，ingest 端以 --rest-url 補齊
+            from binance_replay_server import ReplayServer
+            with ReplayServer(args.host, args.rest_port, source=srv.source, clock=srv.now):
+                print(f"🧪 REST 替身：http://{args.host}:{args.rest_port}")
+                await asyncio.Future()
+
+    if args.check:
+        pairs = [parse_pair(p) for p in args.pairs]
+        reports, same, stats = await _check(pairs, args.seconds, args.bar_seconds, args.updates_per_bar,
+                                            args.drop_after or 20, min(args.min_bars, 1000))
+        from kline_integrity import format_report
+        for (symbol, interval), report in reports.items():
+            print(("✅ " if report["ok"] else "❌ ") + f"{symbol} {interval}：{format_report(report)}")
+        ok = same and all(r["ok"] for r in reports.values()) and stats["reconnects"] > 0
+        print(("✅ " if ok else "❌ ") + f"重連 {stats['reconnects']} 次、REST 補齊 {stats['rest_syncs']} 次，"
+              f"資料庫與替身資料{'相同' if same else '不同'}")
+        return ok
+
+    if args.rest_url:
+        import fetch_data
+        fetch_data.BASE_URL = args.rest_url.rstrip("/")
+    pairs = [parse_pair(p) for p in args.pairs]
+    store = KlineStore(args.store_dir)
+    on_bar_closed = None
+    pool = None
+    if args.run_pipeline:
+        from concurrent.futures import ProcessPoolExecutor
+        pool = ProcessPoolExecutor(max_workers=args.workers)
+        loop = asyncio.get_running_loop()
+
+        async def on_bar_closed(symbol, interval, bar_close_ms):
+            summary = await loop.run_in_executor(pool, _run_pair_from_stream, symbol, interval, args.output_root,
+                                                 ("save_sql",), True, args.store_dir, bar_close_ms)
+            if summary["status"] == "ok":
+                print(f"✅ {symbol} {interval}：{summary['recommendation']}"
+                      f"（買 {summary['buy_score']:.3f} / 賣 {summary['sell_score']:.3f}，{summary['elapsed_s']:.1f}s）")
+            else:
+                print(f"❌ {symbol} {interval}：{summary.get('error')}")
+
+    ingester = KlineStreamIngester(pairs, store, on_bar_closed=on_bar_closed, url=args.url,
+                                   min_bars=args.min_bars)
+    try:
+        await ingester.run()
+    finally:
+        ingester.print_stats()
+        if pool is not None:
+            pool.shutdown()
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="以 websocket 串流把已收盤 K 線寫入本地資料庫並觸發流程")
+    parser.add_argument("mode", nargs="?", choices=["ingest", "replay"], default="ingest")
+    parser.add_argument("--pairs", nargs="+", default=["BTCUSDT:4h"], help="SYMBOL:INTERVAL，可多個")
+    parser.add_argument("--url", default=WS_BASE_URL, help="串流位址（替身：ws://127.0.0.1:8766）")
+    parser.add_argument("--rest-url", default=None, help="補齊用的 REST 位址（預設 fetch_data.BASE_URL）")
+    parser.add_argument("--store-dir", default="data/store")
+    parser.add_argument("--min-bars", type=int, default=500, help="連線時資料庫至少補齊的根數")
+    parser.add_argument("--run-pipeline", action="store_true", help="每根 K 線收盤後執行完整流程")
+    parser.add_argument("--output-root", default="data/stream", help="--run-pipeline 的輸出根目錄")
+    parser.add_argument("--workers", type=int, default=None, help="--run-pipeline 的行程數")
+    parser.add_argument("--host", default="127.0.0.1", help="replay：監聽位址")
+    parser.add_argument("--port", type=int, default=8766, help="replay：監聽埠")
+    parser.add_argument("--bar-seconds", type=float, default=1.0, help="replay：每根 K 線的真實秒數")
+    parser.add_argument("--updates-per-bar", type=int, default=3, help="replay：每根 K 線送幾則事件")
+    parser.add_argument("--clock-interval", default="1m", help="replay：--bar-seconds 對應的週期（替身時鐘的速度）")
+    parser.add_argument("--rest-port", type=int, default=None, help="replay：同時啟動共用時鐘的 REST 替身")
+    parser.add_argument("--drop-after", type=int, default=None, help="replay / --check：每條連線送幾則訊息後斷線")
+    parser.add_argument("--check", action="store_true",
+                        help="以本地替身測試斷線重連與 REST 補齊（資料庫不得有缺口）")
+    parser.add_argument("--seconds", type=float, default=10.0, help="--check：執行秒數")
+    args = parser.parse_args()
+    if args.check and args.bar_seconds == parser.get_default("bar_seconds"):
+        args.bar_seconds = 0.2
+    try:
+        ok = asyncio.run(_main(args))
+    except KeyboardInterrupt:
+        print("\n👋 已停止")
+    else:
+        if args.check and not ok:
+            raise SystemExit(1)
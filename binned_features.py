@@ -1,77 +1,275 @@
 import pandas as pd
 import numpy as np
 
-# 讀取數據
-df = pd.read_csv('data/cleaned_features.csv')
-
-# 保留基本欄位（若存在），但不要只限制為這些欄位——我們會在輸出時把這些欄位放到最前面
-base_cols = ['Date', 'open', 'high', 'low', 'close']
-present_base_cols = [c for c in base_cols if c in df.columns]
-
-# 其餘欄位也會參與分箱
-all_cols_for_binning = [c for c in df.columns]
-
-# 定義窗口大小
-window_size = 12
-
-# 初始化分箱結果
-binned_data = []
-
-# 遍歷窗口並為每個欄位產生一個分箱後的新欄位："{col}_binned"
-for i in range(0, len(df), window_size):
-    window = df.iloc[i:i + window_size]
-    
-    # 對每個特徵進行分箱，存到 binned_window 並以 col_binned 命名
-    binned_window = {}
-    for col in all_cols_for_binning:
-        if col not in window.columns:
-            continue
-        # 不對 Date 欄位做分箱（我們要保留原始 Date）
+
+def is_numeric(dtype):
+    return pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype)
+
+
+# 分箱數：一般數值欄位 qcut 5 個分位數箱（重複邊界會合併），Weekday 以 cut 分 7 箱；
+# qcut 失敗時退回 cut 4 箱（只有非一般數值才會發生，由逐窗口的原始寫法處理）
+QCUT_BINS = 5
+WEEKDAY_BINS = 7
+FALLBACK_BINS = 4
+# 每次向量化處理的窗口數（暫存約 CHUNK_WINDOWS × window_size × 欄位數 個 float64）
+CHUNK_WINDOWS = 2048
+
+
+def _qcut_quantiles(q):
+    """與 pd.qcut 相同的分位點：無法以二進位精確表示的分位點往上取下一個浮點數"""
+    quantiles = np.linspace(0, 1, q + 1)
+    np.putmask(quantiles, q * quantiles != np.arange(q + 1), np.nextafter(quantiles, 1))
+    return quantiles
+
+
+QUANTILES = _qcut_quantiles(QCUT_BINS)
+
+
+def codes_from_edges(block, edges, include_lowest):
+    """
+    block: (窗口, 列, 欄位)；edges: (邊界數, 窗口, 欄位)，各窗口各欄位已排序的邊界。
+    等同 pandas 的 _bins_to_cuts(labels=False, duplicates='drop')：重複邊界只算一次，
+    以「小於 x 的相異邊界數」當 searchsorted(side='left') 的結果，落在第一個邊界以下或最後一個以上為 NaN。
+    """
+    keep = np.ones(edges.shape, dtype=bool)
+    keep[1:] = edges[1:] != edges[:-1]
+    n_bins = keep.sum(axis=0)
+    ids = np.zeros(block.shape, dtype=np.int64)
+    for edge, kept in zip(edges, keep):
+        ids += (edge[:, None, :] < block) & kept[:, None, :]
+    if include_lowest:
+        ids[block == edges[0][:, None, :]] = 1
+    missing = np.isnan(block) | (ids == n_bins[:, None, :]) | (ids == 0)
+    codes = (ids - 1).astype(np.float64)
+    codes[missing] = np.nan
+    return codes
+
+
+def _qcut_codes(block):
+    """每個窗口、每個欄位各自做 pd.qcut(q=5, labels=False, duplicates='drop')"""
+    with np.errstate(invalid='ignore'):
+        edges = np.quantile(block, QUANTILES, axis=1)
+    # 部分缺值的窗口：pandas 以去掉 NaN 後的值計算分位數（全為 NaN 的窗口邊界本來就是 NaN）
+    nan = np.isnan(block)
+    partial = nan.any(axis=1) & ~nan.all(axis=1)
+    for b, f in zip(*np.nonzero(partial)):
+        values = block[b, :, f]
+        edges[:, b, f] = np.quantile(values[~nan[b, :, f]], QUANTILES)
+    return codes_from_edges(block, edges, include_lowest=True)
+
+
+def cut_edges(mn, mx, bins):
+    """與 pd.cut(bins=bins) 相同的等寬邊界：(bins + 1, *mn.shape)；常數窗口上下各放寬 0.1%"""
+    same = mn == mx
+    lo = np.where(same, mn - np.where(mn != 0, 0.001 * np.abs(mn), 0.001), mn)
+    hi = np.where(same, mx + np.where(mx != 0, 0.001 * np.abs(mx), 0.001), mx)
+    edges = np.linspace(lo, hi, bins + 1)
+    edges[0] = np.where(same, edges[0], edges[0] - (mx - mn) * 0.001)
+    return edges
+
+
+def _cut_codes(block, bins):
+    """每個窗口、每個欄位各自做 pd.cut(bins=bins, labels=False)"""
+    with np.errstate(invalid='ignore'):
+        mn = np.nanmin(block, axis=1)
+        mx = np.nanmax(block, axis=1)
+    return codes_from_edges(block, cut_edges(mn, mx, bins), include_lowest=False)
+
+
+def _window_codes(series, weekday):
+    """單一窗口的原始寫法（含 qcut 失敗時的 cut 退路），供含 ±inf 的窗口使用"""
+    if weekday:
+        return np.asarray(pd.cut(series, bins=WEEKDAY_BINS, labels=False), dtype=np.float64)
+    try:
+        return np.asarray(pd.qcut(series, q=QCUT_BINS, labels=False, duplicates='drop'), dtype=np.float64)
+    except Exception:
+        return np.asarray(pd.cut(series, bins=FALLBACK_BINS, labels=False), dtype=np.float64)
+
+
+def _bin_block(block, weekday):
+    """block: (窗口, 列, 欄位) → 同形狀的分箱代碼（float64，缺值為 NaN）"""
+    codes = _cut_codes(block, WEEKDAY_BINS) if weekday else _qcut_codes(block)
+    if block.dtype.kind == 'f':
+        # 含 ±inf 的窗口分位數會出現 inf - inf，交給 pandas 原本的逐窗口流程
+        for b, f in zip(*np.nonzero(np.isinf(block).any(axis=1))):
+            codes[b, :, f] = _window_codes(pd.Series(block[b, :, f]), weekday)
+    return codes
+
+
+def _numeric_codes(df, names, window_size, weekday=False):
+    """
+    names 的欄位以 (窗口, window_size, 欄位) 的區塊一次計算；最後不足一個窗口的列自成一個窗口。
+    同一批欄位需有相同的計算型別（整數以 float64 計算，與 pandas 相同；float32 維持 float32）。
+    """
+    n = len(df)
+    arrays = [df[name].to_numpy() for name in names]
+    dtype = arrays[0].dtype if arrays[0].dtype.kind == 'f' else np.float64
+    out = np.empty((n, len(names)), dtype=np.float64)
+    chunk = CHUNK_WINDOWS * window_size
+    for lo in range(0, n, chunk):
+        hi = min(lo + chunk, n)
+        values = np.stack([a[lo:hi] for a in arrays], axis=1).astype(dtype, copy=False)
+        full = (hi - lo) // window_size * window_size
+        if full:
+            block = values[:full].reshape(-1, window_size, len(names))
+            out[lo:lo + full] = _bin_block(block, weekday).reshape(full, len(names))
+        if full < hi - lo:
+            block = values[full:].reshape(1, hi - lo - full, len(names))
+            out[lo + full:hi] = _bin_block(block, weekday).reshape(hi - lo - full, len(names))
+    return {name: out[:, j] for j, name in enumerate(names)}
+
+
+def bin_features(df: pd.DataFrame, window_size: int = 12, compact: bool = False) -> pd.DataFrame:
+    """
+    以 window_size 根 K 線為一個窗口，對每個欄位產生分箱後的新欄位 "{col}_binned"，
+    回傳「基本欄位 + 所有分箱欄位」的 DataFrame。
+    所有數值欄位排成 (窗口, window_size, 欄位) 的區塊，以 numpy 一次算出每個窗口的分位數邊界與代碼，
+    結果（含重複邊界合併、常數窗口為 NaN 等行為與欄位型別）與逐窗口呼叫 qcut / cut 的 bin_features_loop 相同。
+    compact=True 時分箱代碼存成 int8（缺值為 -1）、文字分箱存成 category（見 compact_frames.py）。
+    """
+    base_cols = ['Date', 'open', 'high', 'low', 'close']
+    present_base_cols = [c for c in base_cols if c in df.columns]
+
+    # 依計算型別把數值欄位分批（Weekday 用 cut、其餘 qcut）；Date 不分箱、非數值欄位以字串作為分類標籤
+    groups = {}
+    for col in df.columns:
         if col == 'Date':
             continue
-        out_col = f"{col}_binned"
         if col == 'Weekday':
-            # Weekday 分7箱
-            binned_window[out_col] = pd.cut(window[col], bins=7, labels=False)
-        elif window[col].dtype in ['float64', 'int64']:
-            # 數值型特徵分4箱（使用 qcut，若重複分位數則 drop duplicates）
-            try:
-                binned_window[out_col] = pd.qcut(window[col], q=5, labels=False, duplicates='drop')
-            except Exception:
-                # 若 qcut 失敗（例如常數列），退回到 cut
-                binned_window[out_col] = pd.cut(window[col], bins=4, labels=False)
+            key = ('weekday', None)
+        elif is_numeric(df[col].dtype):
+            key = ('qcut', df[col].dtype.str if df[col].dtype.kind == 'f' else 'int')
         else:
-            # 非數值型特徵保持原值作為分箱（分類標籤）
-            binned_window[out_col] = window[col].astype(str)
-    
-    # 將分箱結果加入列表
-    binned_data.append(pd.DataFrame(binned_window))
-
-# 合併所有窗口的分箱結果
-binned_df = pd.concat(binned_data, ignore_index=True)
-
-# 如果存在基本欄位，將原始基本欄位加入到最前面
-final_cols = []
-for c in present_base_cols:
-    final_cols.append(c)
-
-# 接著加入所有分箱欄位（維持 binned_df 目前的欄位順序）
-binned_cols = [c for c in binned_df.columns if c.endswith('_binned')]
-final_cols.extend(binned_cols)
-
-# 合併原始基本欄位（從原始 df）與分箱結果（binned_df）
-output_df = pd.DataFrame()
-if len(present_base_cols) > 0:
-    # 將原始基本欄位對齊到 output_df（注意索引長度應相同）
-    # 若原始 df 比 binned_df 長，先取相同長度的前面部份
-    n = len(binned_df)
-    output_df = df[present_base_cols].reset_index(drop=True).iloc[:n].copy()
-else:
-    output_df = pd.DataFrame(index=range(len(binned_df)))
-
-# 將分箱欄位加入
-output_df = pd.concat([output_df.reset_index(drop=True), binned_df.reset_index(drop=True)], axis=1)
-
-
-# 儲存包含基本欄位與所有分箱欄位的數據
-output_df.to_csv('data/binned_features.csv', index=False)
\ No newline at end of file
+            continue
+        groups.setdefault(key, []).append(col)
+    codes = {}
+    for (method, _), names in groups.items():
+        codes.update(_numeric_codes(df, names, window_size, weekday=(method == 'weekday')))
+
+    output = {c: df[c].reset_index(drop=True) for c in present_base_cols}
+    for col in df.columns:
+        if col == 'Date':
+            continue
+        if col in codes:
+            values = codes[col]
+            # 與逐窗口 concat 的型別相同：整欄都沒有缺值時為 int64，否則 float64
+            binned = values if np.isnan(values).any() else values.astype(np.int64)
+        else:
+            binned = df[col].astype(str).reset_index(drop=True)
+        output[f"{col}_binned"] = binned
+    output_df = pd.DataFrame(output, index=pd.RangeIndex(len(df)))
+    if compact:
+        from compact_frames import compact_bins
+        output_df = compact_bins(output_df)
+    return output_df
+
+
+def bin_features_loop(df: pd.DataFrame, window_size: int = 12) -> pd.DataFrame:
+    """
+    以 window_size 根 K 線為一個窗口，對每個欄位產生分箱後的新欄位 "{col}_binned"，
+    回傳「基本欄位 + 所有分箱欄位」的 DataFrame。
+    逐窗口、逐欄位呼叫 qcut / cut 的原始寫法；bin_features 的結果與它逐一相同，這裡保留作為對照與效能比較。
+    """
+    # 保留基本欄位（若存在），但不要只限制為這些欄位——我們會在輸出時把這些欄位放到最前面
+    base_cols = ['Date', 'open', 'high', 'low', 'close']
+    present_base_cols = [c for c in base_cols if c in df.columns]
+
+    # 其餘欄位也會參與分箱
+    all_cols_for_binning = [c for c in df.columns]
+
+    # 初始化分箱結果
+    binned_data = []
+
+    # 遍歷窗口並為每個欄位產生一個分箱後的新欄位："{col}_binned"
+    for i in range(0, len(df), window_size):
+        window = df.iloc[i:i + window_size]
+
+        # 對每個特徵進行分箱，存到 binned_window 並以 col_binned 命名
+        binned_window = {}
+        for col in all_cols_for_binning:
+            if col not in window.columns:
+                continue
+            # 不對 Date 欄位做分箱（我們要保留原始 Date）
+            if col == 'Date':
+                continue
+            out_col = f"{col}_binned"
+            if col == 'Weekday':
+                # Weekday 分7箱
+                binned_window[out_col] = pd.cut(window[col], bins=7, labels=False)
+            elif is_numeric(window[col].dtype):
+                # 數值型特徵分4箱（使用 qcut，若重複分位數則 drop duplicates）
+                try:
+                    binned_window[out_col] = pd.qcut(window[col], q=5, labels=False, duplicates='drop')
+                except Exception:
+                    # 若 qcut 失敗（例如常數列），退回到 cut
+                    binned_window[out_col] = pd.cut(window[col], bins=4, labels=False)
+            else:
+                # 非數值型特徵保持原值作為分箱（分類標籤）
+                binned_window[out_col] = window[col].astype(str)
+
+        # 將分箱結果加入列表
+        binned_data.append(pd.DataFrame(binned_window))
+
+    # 合併所有窗口的分箱結果
+    binned_df = pd.concat(binned_data, ignore_index=True)
+
+    # 合併原始基本欄位（從原始 df）與分箱結果（binned_df）
+    output_df = pd.DataFrame()
+    if len(present_base_cols) > 0:
+        # 將原始基本欄位對齊到 output_df（注意索引長度應相同）
+        # 若原始 df 比 binned_df 長，先取相同長度的前面部份
+        n = len(binned_df)
+        output_df = df[present_base_cols].reset_index(drop=True).iloc[:n].copy()
+    else:
+        output_df = pd.DataFrame(index=range(len(binned_df)))
+
+    # 將分箱欄位加入
+    output_df = pd.concat([output_df.reset_index(drop=True), binned_df.reset_index(drop=True)], axis=1)
+    return output_df
+
+
+def _benchmark(rows, loop_rows, window_size=12):
+    """合成 rows 根 1h K 線的特徵，比較 bin_features 與逐窗口的 bin_features_loop"""
+    import time
+    import warnings
+    from add_features import compute_features
+    from binance_replay_server import SyntheticKlines
+    from fetch_data import klines_to_frame, to_window_frame
+
+    warnings.filterwarnings('ignore')
+    df = compute_features(to_window_frame(klines_to_frame(SyntheticKlines().rows("BTCUSDT", "1h", 0, rows))))
+    started = time.perf_counter()
+    fast = bin_features(df, window_size=window_size)
+    fast_s = time.perf_counter() - started
+
+    head = df.iloc[:loop_rows]
+    started = time.perf_counter()
+    slow = bin_features_loop(head, window_size=window_size)
+    slow_s = time.perf_counter() - started
+    same = slow.equals(bin_features(head, window_size=window_size))
+    estimate = slow_s * rows / len(head)
+    print(f"📊 {rows:,} 列 × {df.shape[1]} 欄：向量化 {fast_s:.2f}s（{fast.shape[1]} 個輸出欄位）")
+    print(f"   逐窗口 {len(head):,} 列 {slow_s:.2f}s → {rows:,} 列估計 {estimate:.0f}s（約 {estimate / fast_s:.0f}x）")
+    print(f"   前 {len(head):,} 列結果與逐窗口版本相同：{same}")
+
+
+# === 主程式執行區 ===
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="特徵分箱（每 window_size 根一個窗口）")
+    parser.add_argument("--benchmark", action="store_true", help="以合成資料比較向量化與逐窗口版本")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--loop-rows", type=int, default=5_000, help="逐窗口版本只跑前幾列（很慢），其餘以比例估計")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        _benchmark(args.rows, args.loop_rows)
+        raise SystemExit(0)
+
+    # 讀取數據
+    from columnar_store import read_frame
+    df = read_frame('data/cleaned_features.csv')
+
+    # 儲存包含基本欄位與所有分箱欄位的數據
+    output_df = bin_features(df, window_size=12)
+    output_df.to_csv('data/binned_features.csv', index=False)
@@ -0,0 +1,398 @@
+"""
+欄式二進位資料表（K 線、特徵、分箱、交易訊號共用）
+
+- 每個欄位一個 .npy 檔，依列數切成多個 segment：{path}/seg_00000/{欄位}.npy
+- 時間欄位以 int64 保存（datetime 欄位記下單位與時區，讀回時還原），不再從字串重新解析
+- meta.json 記錄每個 segment 的列數與時間範圍（time-range index）；
+  讀取某段時間 / 某幾列時只 memmap 相關 segment，再切出需要的部分，不必載入整個檔案
+- 追加資料時只重寫最後一個未滿的 segment，其餘 segment 不動
+
+使用方式
+    from columnar_store import write_table, append_table, read_table, read_frame
+    write_table("data/features.cols", df, time_col="Date")
+    df = read_table("data/features.cols", start="2024-01-01", end="2024-02-01")
+    df = read_frame("data/trading_signals_with_scores.csv")   # CSV 或 .cols 都可以
+"""
+import json
+import os
+import shutil
+
+import numpy as np
+
+META_FILE = "meta.json"
+# 每個 segment 最多幾列（1m K 線約 45 天）；追加時會重寫最後一個 segment，
+# 太大會讓每根新 K 線（websocket 串流每分鐘每個交易對一次）都要重寫數十 MB
+SEGMENT_ROWS = 65_536
+COLUMNAR_SUFFIX = ".cols"
+_NS_PER_UNIT = {"s": 1_000_000_000, "ms": 1_000_000, "us": 1_000, "ns": 1}
+
+
+# === 欄位編碼 ===
+def _encode_column(series):
+    """
+    pandas 欄位 → (numpy 陣列, 欄位描述, null 遮罩或 None)
+    - 數值 / 布林：原 dtype
+    - datetime：int64（記錄單位與時區）
+    - 其他（字串、混合）：定長 unicode，缺值另存遮罩
+    """
+    import pandas as pd
+    dtype = series.dtype
+    if isinstance(dtype, pd.DatetimeTZDtype) or getattr(dtype, "kind", None) == "M":
+        idx = pd.DatetimeIndex(series)
+        tz = str(idx.tz) if idx.tz is not None else None
+        return idx.asi8, {"kind": "datetime", "unit": idx.unit, "tz": tz}, None
+    if pd.api.types.is_bool_dtype(dtype) and not series.isna().any():
+        return series.to_numpy(dtype=bool), {"kind": "bool"}, None
+    if pd.api.types.is_numeric_dtype(dtype) and not isinstance(dtype, pd.CategoricalDtype):
+        arr = series.to_numpy()
+        if arr.dtype == object:   # nullable 整數含缺值 → float64
+            arr = series.to_numpy(dtype="float64", na_value=np.nan)
+        return arr, {"kind": "numeric"}, None
+    mask = series.isna().to_numpy()
+    text = series.astype(object).where(~mask, "").astype(str).to_numpy(dtype=str)
+    return text, {"kind": "string"}, (mask if mask.any() else None)
+
+
+def _decode_column(arr, desc, mask=None):
+    """numpy 陣列 + 欄位描述 → pandas 可用的值"""
+    import pandas as pd
+    kind = desc["kind"]
+    if kind == "datetime":
+        values = np.asarray(arr, dtype="int64").view(f"M8[{desc['unit']}]")
+        idx = pd.DatetimeIndex(values)
+        if desc.get("tz"):
+            idx = idx.tz_localize("UTC").tz_convert(desc["tz"])
+        return idx
+    if kind == "string":
+        values = np.asarray(arr).astype(object)
+        if mask is not None:
+            values[np.asarray(mask)] = np.nan
+        return pd.array(values, dtype="str")
+    return np.asarray(arr)
+
+
+# === metadata ===
+def is_columnar(path):
+    return os.path.isfile(os.path.join(path, META_FILE))
+
+
+def table_meta(path):
+    """讀取資料表 metadata；不存在時回傳 None"""
+    try:
+        with open(os.path.join(path, META_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_meta(path, meta):
+    tmp = os.path.join(path, META_FILE + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, os.path.join(path, META_FILE))
+
+
+def _time_bound(value, desc):
+    """查詢邊界（毫秒整數、字串或 Timestamp）→ 與時間欄位同單位的 int64"""
+    if value is None:
+        return None
+    if isinstance(value, (int, np.integer)) and desc["kind"] != "datetime":
+        return int(value)
+    import pandas as pd
+    if isinstance(value, (int, np.integer)):
+        # datetime 欄位給整數時視為毫秒
+        ts = pd.Timestamp(int(value), unit="ms", tz="UTC")
+    else:
+        ts = pd.Timestamp(value)
+        if ts.tzinfo is None and desc.get("tz"):
+            ts = ts.tz_localize(desc["tz"])
+    # Timestamp.value 一律為奈秒；數值時間欄位視為毫秒
+    unit = desc["unit"] if desc["kind"] == "datetime" else "ms"
+    return int(ts.value // _NS_PER_UNIT[unit])
+
+
+# === segment 讀寫 ===
+def _write_segment(path, seg_id, columns, arrays, masks):
+    """寫出一個 segment（先寫到暫存目錄再改名，寫到一半中斷不會留下半個 segment）"""
+    name = f"seg_{seg_id:05d}"
+    tmp = os.path.join(path, name + ".tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    for col in columns:
+        np.save(os.path.join(tmp, f"{col}.npy"), arrays[col], allow_pickle=False)
+        if masks.get(col) is not None:
+            np.save(os.path.join(tmp, f"{col}.mask.npy"), masks[col], allow_pickle=False)
+    os.replace(tmp, os.path.join(path, name))
+    return name
+
+
+def _load_segment(path, seg, columns, lo=None, hi=None):
+    """以 memmap 讀取 segment 的 [lo, hi) 列；只有切出的部分會真的讀進記憶體"""
+    out = {}
+    for col in columns:
+        base = os.path.join(path, seg["name"], col)
+        arr = np.load(base + ".npy", mmap_mode="r")[lo:hi]
+        out[col] = np.array(arr)
+        if col in seg.get("masks", ()):
+            out[col + ".mask"] = np.array(np.load(base + ".mask.npy", mmap_mode="r")[lo:hi])
+    return out
+
+
+def _segment_index(t, rows):
+    """segment 的索引項目：列數與時間範圍（沒有時間欄位時只有列數）"""
+    entry = {"rows": rows}
+    if t is not None and rows:
+        entry["t_min"] = int(t[0])
+        entry["t_max"] = int(t[-1])
+    return entry
+
+
+def _encode_frame(df, time_col):
+    if time_col is not None and time_col not in df.columns:
+        raise ValueError(f"找不到時間欄位：{time_col}")
+    columns = [str(c) for c in df.columns]
+    if len(set(columns)) != len(columns):
+        raise ValueError("欄位名稱重複，無法以欄式格式保存")
+    arrays, masks, schema = {}, {}, {}
+    for col, name in zip(df.columns, columns):
+        arrays[name], schema[name], masks[name] = _encode_column(df[col])
+    if time_col is not None:
+        t = arrays[time_col]
+        if len(t) > 1 and (np.diff(t) < 0).any():
+            raise ValueError(f"時間欄位 {time_col} 必須遞增，才能建立時間索引")
+    return columns, arrays, masks, schema
+
+
+def _write_segments(path, columns, arrays, masks, time_col, segment_rows, start_id):
+    total = len(arrays[columns[0]]) if columns else 0
+    segments = []
+    seg_id = start_id
+    for lo in range(0, total, segment_rows):
+        hi = min(lo + segment_rows, total)
+        part = {c: arrays[c][lo:hi] for c in columns}
+        part_masks = {c: masks[c][lo:hi] for c in columns if masks.get(c) is not None}
+        name = _write_segment(path, seg_id, columns, part, part_masks)
+        entry = {"name": name, "masks": sorted(part_masks)}
+        entry.update(_segment_index(part[time_col] if time_col else None, hi - lo))
+        segments.append(entry)
+        seg_id += 1
+    return segments
+
+
+def write_table(path, df, time_col=None, segment_rows=SEGMENT_ROWS):
+    """整份寫出（覆蓋舊表）。time_col 有給時必須遞增，並建立時間範圍索引"""
+    columns, arrays, masks, schema = _encode_frame(df, time_col)
+    os.makedirs(path, exist_ok=True)
+    old = table_meta(path)
+    next_id = old["next_id"] if old else 0
+    segments = _write_segments(path, columns, arrays, masks, time_col, segment_rows, next_id)
+    _write_meta(path, {
+        "columns": columns,
+        "schema": schema,
+        "time_col": time_col,
+        "rows": len(df),
+        "segment_rows": segment_rows,
+        "next_id": next_id + len(segments),
+        "segments": segments,
+    })
+    _remove_unused_segments(path, segments)
+    return path
+
+
+def append_table(path, df, time_col=None):
+    """
+    追加到表尾；表不存在時等同 write_table。
+    新資料的時間必須晚於表內最後一筆（否則拋出 ValueError，由呼叫端改用合併後 write_table）。
+    最後一個 segment 未滿時與新資料合併重寫，避免每次追加都產生一個小 segment。
+    """
+    meta = table_meta(path)
+    if meta is None:
+        return write_table(path, df, time_col=time_col)
+    if len(df) == 0:
+        return path
+    time_col = meta["time_col"]
+    columns, arrays, masks, schema = _encode_frame(df, time_col)
+    if columns != meta["columns"]:
+        raise ValueError(f"欄位與既有資料表不同：{columns} != {meta['columns']}")
+    for col in columns:
+        if schema[col]["kind"] != meta["schema"][col]["kind"]:
+            raise ValueError(f"欄位 {col} 型別不同：{schema[col]} != {meta['schema'][col]}")
+
+    segments = list(meta["segments"])
+    if time_col is not None and segments and int(arrays[time_col][0]) <= segments[-1]["t_max"]:
+        raise ValueError("追加資料的時間必須晚於資料表最後一筆")
+
+    if segments and segments[-1]["rows"] < meta["segment_rows"]:
+        last = segments.pop()
+        old = _load_segment(path, last, columns)
+        for col in columns:
+            arr = arrays[col]
+            prev = old[col]
+            arrays[col] = np.concatenate([prev, arr if arr.dtype.kind == "U" else arr.astype(prev.dtype, copy=False)])
+            prev_mask = old.get(col + ".mask")
+            if prev_mask is not None or masks.get(col) is not None:
+                masks[col] = np.concatenate([
+                    prev_mask if prev_mask is not None else np.zeros(len(prev), dtype=bool),
+                    masks[col] if masks.get(col) is not None else np.zeros(len(arr), dtype=bool),
+                ])
+    new_segments = _write_segments(path, columns, arrays, masks, time_col, meta["segment_rows"], meta["next_id"])
+    segments.extend(new_segments)
+    meta.update({
+        "rows": sum(s["rows"] for s in segments),
+        "next_id": meta["next_id"] + len(new_segments),
+        "segments": segments,
+    })
+    _write_meta(path, meta)
+    _remove_unused_segments(path, segments)
+    return path
+
+
+def truncate_table(path, rows):
+    """
+    只保留前 rows 列（例如呼叫端的狀態檔只記到這裡，表尾是中斷前多寫入的部分）。
+    完整落在範圍內的 segment 不動，只重寫跨過邊界的那一個。
+    """
+    meta = table_meta(path)
+    if meta is None or rows >= meta["rows"]:
+        return path
+    columns, time_col = meta["columns"], meta["time_col"]
+    segments = []
+    next_id = meta["next_id"]
+    offset = 0
+    for seg in meta["segments"]:
+        if offset + seg["rows"] <= rows:
+            segments.append(seg)
+            offset += seg["rows"]
+            continue
+        if rows > offset:
+            part = _load_segment(path, seg, columns, 0, rows - offset)
+            arrays = {c: part[c] for c in columns}
+            masks = {c: part.get(c + ".mask") for c in columns}
+            new_segments = _write_segments(path, columns, arrays, masks, time_col, meta["segment_rows"], next_id)
+            segments.extend(new_segments)
+            next_id += len(new_segments)
+        break
+    meta.update({"rows": rows, "next_id": next_id, "segments": segments})
+    _write_meta(path, meta)
+    _remove_unused_segments(path, segments)
+    return path
+
+
+def _remove_unused_segments(path, segments):
+    """刪掉 meta 已不再引用的 segment（meta 先更新，中斷時最多留下孤兒目錄）"""
+    keep = {s["name"] for s in segments}
+    for name in os.listdir(path):
+        if name.startswith("seg_") and name not in keep:
+            shutil.rmtree(os.path.join(path, name), ignore_errors=True)
+
+
+def read_table(path, start=None, end=None, columns=None, rows=None):
+    """
+    讀出資料表（或其中一段）為 DataFrame：
+    - start / end: 時間範圍（含兩端；毫秒整數、日期字串或 Timestamp），依 time-range index 只讀相關 segment
+    - rows: (起, 迄) 列位置（同 Python 切片，可為負數），例如 (-500, None) 取最後 500 列
+    - columns: 只讀指定欄位
+    """
+    import pandas as pd
+    meta = table_meta(path)
+    if meta is None:
+        raise FileNotFoundError(f"找不到欄式資料表：{path}")
+    columns = list(columns) if columns is not None else meta["columns"]
+    schema = meta["schema"]
+    time_col = meta["time_col"]
+    if (start is not None or end is not None) and time_col is None:
+        raise ValueError("此資料表沒有時間欄位，無法依時間範圍讀取")
+
+    # 以列位置決定要讀的範圍
+    total = meta["rows"]
+    lo_row, hi_row = slice(*(rows or (None, None))).indices(total)[:2]
+    lo_t = _time_bound(start, schema[time_col]) if start is not None else None
+    hi_t = _time_bound(end, schema[time_col]) if end is not None else None
+
+    parts = []
+    offset = 0
+    for seg in meta["segments"]:
+        seg_lo, seg_hi = offset, offset + seg["rows"]
+        offset = seg_hi
+        if seg_hi <= lo_row or seg_lo >= hi_row:
+            continue
+        if lo_t is not None and seg["t_max"] < lo_t:
+            continue
+        if hi_t is not None and seg["t_min"] > hi_t:
+            continue
+        lo = max(lo_row, seg_lo) - seg_lo
+        hi = min(hi_row, seg_hi) - seg_lo
+        if lo_t is not None or hi_t is not None:
+            t = np.load(os.path.join(path, seg["name"], f"{time_col}.npy"), mmap_mode="r")
+            if lo_t is not None:
+                lo = max(lo, int(np.searchsorted(t, lo_t, side="left")))
+            if hi_t is not None:
+                hi = min(hi, int(np.searchsorted(t, hi_t, side="right")))
+        if hi > lo:
+            parts.append(_load_segment(path, seg, columns, lo, hi))
+
+    data = {}
+    for col in columns:
+        if parts:
+            arr = np.concatenate([p[col] for p in parts])
+            mask = None
+            if any(col + ".mask" in p for p in parts):
+                mask = np.concatenate([p.get(col + ".mask", np.zeros(len(p[col]), dtype=bool)) for p in parts])
+        else:
+            arr = np.load(os.path.join(path, meta["segments"][0]["name"], f"{col}.npy"), mmap_mode="r")[:0] \
+                if meta["segments"] else np.array([])
+            mask = None
+        data[col] = _decode_column(arr, schema[col], mask)
+    return pd.DataFrame(data, columns=columns)
+
+
+def columnar_path(path):
+    """CSV 路徑 → 對應的欄式資料表路徑（xxx.csv → xxx.cols）"""
+    root, ext = os.path.splitext(path)
+    return (root if ext == ".csv" else path) + COLUMNAR_SUFFIX
+
+
+def read_frame(path, **kwargs):
+    """
+    讀取流程輸出：path 本身是欄式資料表，或同名 .cols 存在且不比 CSV 舊時讀欄式資料表，否則讀 CSV。
+    kwargs 只在欄式資料表時生效（start / end / columns / rows）。
+    """
+    if is_columnar(path):
+        return read_table(path, **kwargs)
+    cols = columnar_path(path)
+    if is_columnar(cols) and (not os.path.exists(path) or
+                              os.path.getmtime(os.path.join(cols, META_FILE)) >= os.path.getmtime(path)):
+        return read_table(cols, **kwargs)
+    import pandas as pd
+    return pd.read_csv(path)
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="CSV ↔ 欄式資料表轉換與查詢")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_conv = sub.add_parser("convert", help="把 CSV 轉成欄式資料表")
+    p_conv.add_argument("csv")
+    p_conv.add_argument("--out", default=None, help="輸出路徑（預設同名 .cols）")
+    p_conv.add_argument("--time-col", default=None, help="時間欄位（建立時間索引）")
+    p_info = sub.add_parser("info", help="顯示資料表資訊")
+    p_info.add_argument("path")
+    args = parser.parse_args()
+
+    if args.cmd == "convert":
+        import pandas as pd
+        df = pd.read_csv(args.csv)
+        if args.time_col and not pd.api.types.is_numeric_dtype(df[args.time_col]):
+            df[args.time_col] = pd.to_datetime(df[args.time_col])
+        out = args.out or columnar_path(args.csv)
+        write_table(out, df, time_col=args.time_col)
+        print(f"✅ 已轉換：{args.csv} → {out}（{len(df):,} 列）")
+    else:
+        meta = table_meta(args.path)
+        if meta is None:
+            print(f"❌ 找不到欄式資料表：{args.path}")
+        else:
+            print(f"📦 {args.path}：{meta['rows']:,} 列、{len(meta['columns'])} 欄、{len(meta['segments'])} 個 segment")
+            print(f"   時間欄位：{meta['time_col']}")
+            for col in meta["columns"]:
+                print(f"   - {col}: {meta['schema'][col]}")
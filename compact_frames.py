@@ -0,0 +1,129 @@
+"""
+精簡型別模式：特徵用 float32、分箱代碼用 int8（缺值以 -1 表示）、文字欄位改成 category
+
+預設流程的特徵表是 40 多個 float64 / int64 欄位，分箱代碼因為 qcut 可能產生 NaN 而存成 float64，
+非數值欄位的分箱則是一個個 Python 字串。多交易對、多年份一起跑時記憶體是瓶頸，因此提供可選的精簡模式：
+- compact_features：特徵轉 float32（open / high / low / close 保留 float64，未來報酬與執行價格都用到它們），
+  整數欄位縮到放得下的最小型別（Hour、Weekday → int8），文字欄位轉 category；時間欄位不動
+- compact_bins：*_binned 數值代碼轉 int8，NaN 以 BIN_SENTINEL（-1）表示；文字分箱轉 category
+- FeatureBinAnalyzer 會略過 -1 這個箱子，與預設模式略過 NaN 的行為相同
+
+float32 會讓少數值落在分位數邊界另一側，分箱與最終分數可能有些微差異；
+score_precision 以同一份特徵分別跑兩種模式，比較 buy / sell 分數與記憶體用量：
+
+    python compact_frames.py --input data/cleaned_features.csv
+"""
+import numpy as np
+
+BIN_SENTINEL = -1
+# 保留 float64 的欄位：分析器以 close / high / low 算未來報酬，評分以 open 當執行價格
+PRICE_COLS = ('open', 'high', 'low', 'close')
+
+
+def _is_text(dtype):
+    import pandas as pd
+    return pd.api.types.is_object_dtype(dtype) or pd.api.types.is_string_dtype(dtype)
+
+
+def compact_features(df, keep_float64=PRICE_COLS):
+    """特徵 DataFrame → 精簡型別版本（不修改傳入的 df；Date 與 datetime 欄位維持原樣）"""
+    import pandas as pd
+    columns = {}
+    for name in df.columns:
+        col = df[name]
+        kind = col.dtype.kind
+        if name == 'Date' or kind == 'M' or isinstance(col.dtype, pd.DatetimeTZDtype):
+            pass
+        elif kind == 'f' and name not in keep_float64:
+            col = col.astype(np.float32)
+        elif kind in 'iu':
+            col = pd.to_numeric(col, downcast='integer')
+        elif _is_text(col.dtype):
+            col = col.astype('category')
+        columns[name] = col
+    return pd.DataFrame(columns, index=df.index)
+
+
+def compact_bins(binned):
+    """分箱 DataFrame 的 *_binned 欄位 → int8 代碼（NaN 為 BIN_SENTINEL）或 category（文字分箱）"""
+    import pandas as pd
+    columns = {}
+    for name in binned.columns:
+        col = binned[name]
+        if name.endswith('_binned'):
+            if col.dtype.kind == 'f':
+                codes = col.to_numpy()
+                col = pd.Series(np.where(np.isnan(codes), BIN_SENTINEL, codes).astype(np.int8), index=col.index)
+            elif col.dtype.kind in 'iu':
+                col = col.astype(np.int8)
+            elif _is_text(col.dtype):
+                col = col.astype('category')
+        columns[name] = col
+    return pd.DataFrame(columns, index=binned.index)
+
+
+def drop_sentinel(stats):
+    """groupby 結果以整數分箱代碼為索引時，移除 BIN_SENTINEL（精簡模式下的缺值箱子）"""
+    import pandas as pd
+    if pd.api.types.is_integer_dtype(stats.index.dtype):
+        return stats[stats.index != BIN_SENTINEL]
+    return stats
+
+
+def frame_bytes(df):
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+def score_precision(features, bin_window=12, top_features=8):
+    """
+    同一份特徵分別以預設與精簡模式跑 分箱 → 分析 → 評分，回傳兩者的差異與記憶體用量：
+    {max_buy_diff, max_sell_diff, rows_changed, latest_same, top_features_same, bytes: {...}}
+    """
+    from binned_features import bin_features
+    from calculate_trading_scores import calculate_trading_scores
+    from feature_bin_analysis import FeatureBinAnalyzer
+
+    def run(frame, compact):
+        binned = bin_features(frame, window_size=bin_window, compact=compact)
+        report = FeatureBinAnalyzer(binned).generate_json_report(top_features=top_features)
+        return binned, report, calculate_trading_scores(binned, report)
+
+    full_binned, full_report, full_scores = run(features, False)
+    small = compact_features(features)
+    small_binned, small_report, small_scores = run(small, True)
+
+    buy = np.abs(full_scores['buy_score'].to_numpy() - small_scores['buy_score'].to_numpy())
+    sell = np.abs(full_scores['sell_score'].to_numpy() - small_scores['sell_score'].to_numpy())
+    names = lambda report: [f['feature_name'] for f in report['top_features']]  # noqa: E731
+    return {
+        "max_buy_diff": float(buy.max()) if len(buy) else 0.0,
+        "max_sell_diff": float(sell.max()) if len(sell) else 0.0,
+        "rows_changed": int(((buy > 0) | (sell > 0)).sum()),
+        "rows": len(buy),
+        "latest_same": bool(len(buy) and buy[-1] == 0 and sell[-1] == 0),
+        "top_features_same": names(full_report) == names(small_report),
+        "bytes": {
+            "features": frame_bytes(features), "features_compact": frame_bytes(small),
+            "binned": frame_bytes(full_binned), "binned_compact": frame_bytes(small_binned),
+        },
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="精簡型別模式對記憶體與最終買賣分數的影響")
+    parser.add_argument("--input", default="data/cleaned_features.csv")
+    parser.add_argument("--bin-window", type=int, default=12)
+    parser.add_argument("--top-features", type=int, default=8)
+    args = parser.parse_args()
+
+    from columnar_store import read_frame
+    result = score_precision(read_frame(args.input), args.bin_window, args.top_features)
+    b = result["bytes"]
+    print(f"\n📦 特徵表：{b['features'] / 1e6:.2f} MB → {b['features_compact'] / 1e6:.2f} MB")
+    print(f"📦 分箱表：{b['binned'] / 1e6:.2f} MB → {b['binned_compact'] / 1e6:.2f} MB")
+    print(f"🎯 buy 分數最大差 {result['max_buy_diff']:.4f}、sell 分數最大差 {result['max_sell_diff']:.4f}，"
+          f"{result['rows_changed']} / {result['rows']} 筆分數不同")
+    print(f"   前 {args.top_features} 名特徵相同：{result['top_features_same']}，"
+          f"最新一筆分數相同：{result['latest_same']}")
@@ -0,0 +1,156 @@
+"""
+一次掃描的分箱統計張量：FeatureBinAnalyzer 的所有分數與每箱統計都由它推導
+
+原本 analyze_all_features 對每個特徵、每個目標各做一次 groupby，generate_json_report 又對前幾名
+特徵再各做兩次 groupby；候選特徵上百個時分析是整個流程最慢的階段。這裡：
+1. 每個 *_binned 欄位 factorize 成密集整數代碼（依箱子值排序；NaN 與精簡模式的 -1 為缺值），
+   組成 (列, 特徵) 的代碼矩陣
+2. 每個統計量以一次 np.bincount 累加整個矩陣，得到 (特徵 × 箱子 × 統計量) 的張量：
+   列數，以及每個目標（high / low）的有效報酬數、總和、平移後總和與平方和、上漲次數。
+   各特徵的箱子數差很多（文字欄位可能有上萬個值），因此箱子軸不補齊，而是依 offsets 串接
+3. 平均、標準差（ddof=1）、上漲機率與特徵分數都從張量計算
+   - 變異數以平移後的總和與平方和計算（平移量為整體平均，避免大數相減失去精度）
+   - 上漲機率是整數相除，與 groupby 逐位元相同；特徵分數的箱子間標準差以與 pandas 相同的兩段式算法計算，
+     排名與 prediction_score 因此不變
+   - 報告的統計值四捨五入到小數 4 位，與 groupby 版本相同（總和順序不同，只差在最後幾個位元）
+"""
+import numpy as np
+
+# 每次累加的列數（暫存約 CHUNK_ROWS × 特徵數 個 int64 / float64）
+CHUNK_ROWS = 1 << 13
+# 代碼值小於此數的整數分箱直接以 bincount 編碼（其餘用 pd.factorize）
+MAX_DIRECT_CODE = 1 << 16
+STATS = ('count', 'sum', 'shifted_sum', 'shifted_sq', 'up')
+
+
+def encode_bins(column):
+    """分箱欄位 → (代碼 int64 陣列（缺值 -1）, 依序排列的箱子值)；與 groupby(observed=True) 的箱子相同"""
+    import pandas as pd
+    from compact_frames import BIN_SENTINEL
+    values = column.to_numpy() if column.dtype.kind in 'iuf' else None
+    if values is not None:
+        # 分箱代碼通常是 0 ~ 幾十的整數：以 bincount 找出出現過的值，不必排序
+        valid = ~np.isnan(values) if values.dtype.kind == 'f' else values != BIN_SENTINEL
+        present = values[valid]
+        if len(present) and present.min() >= 0 and present.max() < MAX_DIRECT_CODE and \
+                (values.dtype.kind != 'f' or (present == np.floor(present)).all()):
+            seen = np.bincount(present.astype(np.int64)) > 0
+            codes = np.full(len(values), -1, dtype=np.int64)
+            codes[valid] = (np.cumsum(seen) - 1)[present.astype(np.int64)]
+            return codes, np.flatnonzero(seen).astype(values.dtype).tolist()
+    codes, uniques = pd.factorize(column, sort=True)
+    labels = list(uniques)
+    if pd.api.types.is_integer_dtype(column.dtype) and BIN_SENTINEL in labels:
+        # 精簡模式以 -1 表示缺值（與 drop_sentinel 相同）
+        drop = labels.index(BIN_SENTINEL)
+        codes = np.where(codes == drop, -1, np.where(codes > drop, codes - 1, codes))
+        del labels[drop]
+    return codes.astype(np.int64, copy=False), labels
+
+
+class BinStatsTensor:
+    """
+    features 個分箱欄位在 targets 上的統計張量。
+    tensor[目標][箱子, 統計量]，統計量依 STATS 排列；rows[箱子] 為每箱列數。
+    特徵 j 的箱子是 offsets[j]:offsets[j + 1] 這一段。
+    """
+
+    def __init__(self, df, features, targets):
+        """
+        df：分箱資料；features：分箱欄位名稱；
+        targets：{目標名稱: (報酬欄位, 方向欄位)}，報酬可含 NaN（不計入 count / 平均 / 標準差），方向為 0 / 1
+        """
+        self.features = list(features)
+        self.index = {name: j for j, name in enumerate(self.features)}
+        # (特徵, 列)：每個特徵的代碼連續存放
+        codes = np.empty((len(self.features), len(df)), dtype=np.int64)
+        self.labels = []
+        for j, name in enumerate(self.features):
+            codes[j], labels = encode_bins(df[name])
+            self.labels.append(labels)
+        self.n_bins = np.array([len(labels) for labels in self.labels], dtype=np.int64)
+        self.offsets = np.r_[0, np.cumsum(self.n_bins)]
+        size = int(self.offsets[-1])
+
+        # 每列的量（每個特徵共用）；報酬為 NaN 的列很少（最後 12 根），另外累加後從列數扣除
+        values = {}
+        for target, (pct_col, direction_col) in targets.items():
+            pct = df[pct_col].to_numpy(dtype=np.float64)
+            missing = np.isnan(pct)
+            shift = pct[~missing].mean() if not missing.all() else 0.0
+            values[target] = (
+                missing,
+                shift,
+                np.stack([np.where(missing, 0.0, pct),
+                          np.where(missing, 0.0, (pct - shift) ** 2),
+                          df[direction_col].to_numpy(dtype=np.float64)]),
+            )
+
+        # 缺值代碼一律落在最後一個「丟棄」箱子，不必逐格篩選；權重是每列的值對每個特徵重複一次
+        rows = np.zeros(size + 1)
+        acc = {t: np.zeros((3, size + 1)) for t in targets}
+        nan_rows = {t: np.zeros(size + 1) for t in targets}
+        for lo in range(0, len(df), CHUNK_ROWS):
+            block = codes[:, lo:lo + CHUNK_ROWS]
+            index = np.where(block >= 0, block + self.offsets[:-1, None], size).ravel()
+            rows += np.bincount(index, minlength=size + 1)
+            for target, (missing, _, weights) in values.items():
+                for s, per_row in enumerate(weights[:, lo:lo + CHUNK_ROWS]):
+                    acc[target][s] += np.bincount(index, weights=np.tile(per_row, len(block)), minlength=size + 1)
+                gap = missing[lo:lo + CHUNK_ROWS]
+                if gap.any():
+                    nan_rows[target] += np.bincount(index.reshape(block.shape)[:, gap].ravel(), minlength=size + 1)
+
+        rows = rows[:size]
+        self.tensor = {}
+        for target, (_, shift, _) in values.items():
+            total, sq, up = acc[target][:, :size]
+            count = rows - nan_rows[target][:size]
+            self.tensor[target] = np.stack([count, total, total - count * shift, sq, up], axis=-1)
+        self.rows = rows
+        self._bin_stats = {}
+
+    def _stat(self, target, stat):
+        return self.tensor[target][..., STATS.index(stat)]
+
+    def bin_stats(self, target):
+        """{count, mean, std, up, up_prob}，各為全部箱子的一維陣列；沒有有效報酬的箱子平均 / 標準差為 NaN"""
+        if target not in self._bin_stats:
+            self._bin_stats[target] = self._derive(target)
+        return self._bin_stats[target]
+
+    def _derive(self, target):
+        count = self._stat(target, 'count')
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = self._stat(target, 'sum') / count
+            shifted = self._stat(target, 'shifted_sum')
+            m2 = np.maximum(self._stat(target, 'shifted_sq') - shifted * shifted / count, 0.0)
+            std = np.sqrt(m2 / (count - 1))
+            up = self._stat(target, 'up')
+            up_prob = up / self.rows
+        mean[count == 0] = np.nan
+        std[count < 2] = np.nan
+        return {'count': count, 'mean': mean, 'std': std, 'up': up, 'up_prob': up_prob}
+
+    def feature_stats(self, name, target):
+        """單一特徵在 target 的每箱統計：(箱子值清單, {count, mean, std, up, up_prob} 各為一維陣列)"""
+        j = self.index[name]
+        part = slice(self.offsets[j], self.offsets[j + 1])
+        stats = self.bin_stats(target)
+        return self.labels[j], {key: values[part] for key, values in stats.items()}
+
+    def scores(self, targets):
+        """每個特徵的預測分數：各目標「箱子上漲機率的標準差」的平均（只有一個箱子時為 0）"""
+        probs = {t: self.bin_stats(t)['up_prob'] for t in targets}
+        out = {}
+        for j, name in enumerate(self.features):
+            lo, hi = self.offsets[j], self.offsets[j + 1]
+            out[name] = np.mean([_std(probs[t][lo:hi]) if hi - lo > 1 else 0 for t in targets])
+        return out
+
+
+def _std(values):
+    """與 pandas Series.std() 相同的兩段式算法（ddof=1），結果逐位元相同"""
+    count = np.float64(len(values))
+    avg = values.sum(dtype=np.float64) / count
+    return np.sqrt(((avg - values) ** 2).sum(dtype=np.float64) / (count - 1))
@@ -1,11 +1,12 @@
 import json
-import requests
 from datetime import datetime
 
 def send_discord_webhook(webhook_url, assessment_data):
     """
     發送Discord webhook with embed
     """
+    import requests
+    from http_client import get_client
     # 構建embed
     embed = {
         "title": "🎯 BTC/USDT 交易評估報告",
@@ -53,7 +54,7 @@ def send_discord_webhook(webhook_url, assessment_data):
 
     # 發送webhook
     try:
-        response = requests.post(webhook_url, json=payload)
+        response = get_client().request("POST", webhook_url, json=payload, timeout=10)
         response.raise_for_status()
         print("✅ Discord webhook 發送成功!")
         return True
@@ -74,13 +75,13 @@ def get_embed_color(recommendation):
     }
     return color_map.get(recommendation, 0x808080)  # 默認灰色
 
-def send_latest_assessment_to_discord(webhook_url):
+def send_latest_assessment_to_discord(webhook_url, json_path='data/BTCUSDT_4h/latest_trading_assessment.json'):
     """
-    發送最新評估到Discord
+    發送最新評估到Discord（json_path：要發送的評估報告，a_main 寫在 data/{symbol}_{interval}/）
     """
     try:
         # 讀取最新評估數據
-        with open('data/latest_trading_assessment.json', 'r', encoding='utf-8') as f:
+        with open(json_path, 'r', encoding='utf-8') as f:
             assessment_data = json.load(f)
 
         # 發送webhook
@@ -4,6 +4,32 @@ import json
 import warnings
 warnings.filterwarnings('ignore')
 
+from compact_frames import drop_sentinel
+
+
+def _load_frame(source):
+    """接受 CSV / 欄式資料表路徑或 DataFrame；DataFrame 會複製一份，避免分析時新增的欄位汙染呼叫端"""
+    if isinstance(source, pd.DataFrame):
+        return source.copy()
+    from columnar_store import read_frame
+    return read_frame(source)
+
+def _bin_analysis(bins, stats):
+    """統計張量中一個特徵、一個目標的每箱統計 → 報告格式 {箱子值: {...}}"""
+    count = stats['count'].astype(np.int64).tolist()
+    up = stats['up'].astype(np.int64).tolist()
+    mean, std, prob = (np.round(stats[key], 4).tolist() for key in ('mean', 'std', 'up_prob'))
+    return {
+        str(bin_value): {
+            "sample_count": c,
+            "avg_change_pct": round(m, 4),
+            "change_std": round(s, 4),
+            "up_count": u,
+            "up_probability": round(p, 4),
+        }
+        for bin_value, c, m, s, u, p in zip(bins, count, mean, std, up, prob)
+    }
+
 class FeatureBinAnalyzer:
     """
     特徵分箱與未來走勢關聯分析器
@@ -11,14 +37,26 @@ class FeatureBinAnalyzer:
     例如：某特徵值較高時，未來是否更容易上漲。
     """
     
-    def __init__(self, binned_data_path, original_data_path):
+    # 目標 → (報酬欄位, 方向欄位, 中文標籤)
+    TARGETS = {
+        'high': ('future_high_pct', 'future_high_direction', '高點'),
+        'low': ('future_low_pct', 'future_low_direction', '低點'),
+    }
+
+    def __init__(self, binned_data_path, original_data_path=None, engine="tensor"):
         """
         初始化分析器
-        - binned_data_path: 已完成分箱的特徵資料 CSV
-        - original_data_path: 原始數據 CSV（可用於比對或擴充）
+        - binned_data_path: 已完成分箱的特徵資料 CSV（或直接傳入 DataFrame）
+        - original_data_path: 原始數據 CSV 或 DataFrame（可用於比對或擴充，可省略）
+        - engine: "tensor"（預設）一次掃描建出所有特徵的統計張量（見 contingency_engine.py）；
+          "groupby" 為原本逐特徵、逐目標 groupby 的寫法，結果相同
         """
-        self.binned_df = pd.read_csv(binned_data_path)
-        self.original_df = pd.read_csv(original_data_path)
+        if engine not in ("tensor", "groupby"):
+            raise ValueError(f"不支援的 engine: {engine}")
+        self.engine = engine
+        self._tensor = None
+        self.binned_df = _load_frame(binned_data_path)
+        self.original_df = _load_frame(original_data_path) if original_data_path is not None else None
         
         # 篩選出所有以「_binned」結尾的特徵欄位
         self.binned_features = [col for col in self.binned_df.columns if col.endswith('_binned')]
@@ -42,11 +80,37 @@ class FeatureBinAnalyzer:
         self.binned_df['future_high_direction'] = (self.binned_df['future_high_pct'] > 0).astype(int)
         self.binned_df['future_low_direction'] = (self.binned_df['future_low_pct'] < 0).astype(int)
 
+    @property
+    def tensor(self):
+        """所有分箱特徵 × 箱子 × 統計量的張量（第一次使用時建立）"""
+        if self._tensor is None:
+            from contingency_engine import BinStatsTensor
+            targets = {t: (pct, direction) for t, (pct, direction, _) in self.TARGETS.items()}
+            self._tensor = BinStatsTensor(self.binned_df, self.binned_features, targets)
+        return self._tensor
+
     def analyze_single_feature(self, feature_name, targets=['high', 'low']):
         """
         分析單一特徵與未來高/低點的關係
         回傳每個箱子（bin）的樣本數、平均變化、上漲機率等統計結果
         """
+        if self.engine == "groupby":
+            return self._analyze_single_feature_groupby(feature_name, targets)
+        results = {}
+        for target in targets:
+            label = self.TARGETS[target][2]
+            bins, stats = self.tensor.feature_stats(feature_name, target)
+            group_stats = pd.DataFrame({
+                f'{label}_樣本數': stats['count'].astype(np.int64),
+                f'{label}_平均變化%': stats['mean'],
+                f'{label}_變化標準差': stats['std'],
+                f'{label}_上漲次數': stats['up'].astype(np.int64),
+                f'{label}_上漲機率': stats['up_prob'],
+            }, index=pd.Index(bins, name=feature_name)).round(4)
+            results[f'{label}預測'] = group_stats
+        return results
+
+    def _analyze_single_feature_groupby(self, feature_name, targets=['high', 'low']):
         results = {}
         for target in targets:
             # 根據目標類型設定對應欄位與標籤
@@ -56,10 +120,10 @@ class FeatureBinAnalyzer:
                 pct_col, direction_col, label = 'future_low_pct', 'future_low_direction', '低點'
             
             # 以箱子分組，計算每個箱子的統計資料
-            group_stats = self.binned_df.groupby(feature_name).agg({
+            group_stats = drop_sentinel(self.binned_df.groupby(feature_name, observed=True).agg({
                 pct_col: ['count', 'mean', 'std'],
                 direction_col: ['sum', 'mean']
-            }).round(4)
+            }).round(4))
             
             # 重命名欄位
             group_stats.columns = [
@@ -75,6 +139,16 @@ class FeatureBinAnalyzer:
         預測能力衡量方式：各箱子的上漲機率差異（標準差）
         越大表示該特徵越能分出漲跌差異。
         """
+        if self.engine == "groupby":
+            feature_scores = self._feature_scores_groupby(targets)
+        else:
+            feature_scores = self.tensor.scores(targets)
+
+        # 排序後取出前 N 名
+        sorted_features = sorted(feature_scores.items(), key=lambda x: x[1], reverse=True)
+        return sorted_features[:top_n]
+
+    def _feature_scores_groupby(self, targets=['high', 'low']):
         feature_scores = {}
         for feature in self.binned_features:
             scores = []
@@ -82,15 +156,12 @@ class FeatureBinAnalyzer:
                 # 根據高/低點選擇對應方向欄位
                 direction_col = 'future_high_direction' if target == 'high' else 'future_low_direction'
                 # 計算每個箱子的上漲機率
-                bin_probs = self.binned_df.groupby(feature)[direction_col].mean()
+                bin_probs = drop_sentinel(self.binned_df.groupby(feature, observed=True)[direction_col].mean())
                 # 使用標準差衡量箱子間的差異
                 scores.append(bin_probs.std() if len(bin_probs) > 1 else 0)
             # 平均作為該特徵的總體預測分數
             feature_scores[feature] = np.mean(scores)
-        
-        # 排序後取出前 N 名
-        sorted_features = sorted(feature_scores.items(), key=lambda x: x[1], reverse=True)
-        return sorted_features[:top_n]
+        return feature_scores
 
     def generate_json_report(self, top_features=8):
         """
@@ -126,34 +197,43 @@ class FeatureBinAnalyzer:
             }
 
             # 單特徵詳細統計
-            results = self.analyze_single_feature(feature_name)
-            if results:
-                # 高點統計
-                if '高點預測' in results:
-                    high_stats = results['高點預測']
-                    for bin_value in high_stats.index:
-                        feature_data["high_point_analysis"][str(bin_value)] = {
-                            "sample_count": int(high_stats.loc[bin_value, '高點_樣本數']),
-                            "avg_change_pct": round(float(high_stats.loc[bin_value, '高點_平均變化%']), 4),
-                            "change_std": round(float(high_stats.loc[bin_value, '高點_變化標準差']), 4),
-                            "up_count": int(high_stats.loc[bin_value, '高點_上漲次數']),
-                            "up_probability": round(float(high_stats.loc[bin_value, '高點_上漲機率']), 4)
-                        }
-                # 低點統計
-                if '低點預測' in results:
-                    low_stats = results['低點預測']
-                    for bin_value in low_stats.index:
-                        feature_data["low_point_analysis"][str(bin_value)] = {
-                            "sample_count": int(low_stats.loc[bin_value, '低點_樣本數']),
-                            "avg_change_pct": round(float(low_stats.loc[bin_value, '低點_平均變化%']), 4),
-                            "change_std": round(float(low_stats.loc[bin_value, '低點_變化標準差']), 4),
-                            "up_count": int(low_stats.loc[bin_value, '低點_上漲次數']),
-                            "up_probability": round(float(low_stats.loc[bin_value, '低點_上漲機率']), 4)
-                        }
+            if self.engine == "groupby":
+                self._fill_groupby_analysis(feature_data, feature_name)
+            else:
+                # 直接由統計張量取每箱數值（四捨五入方式與 groupby 版本的 .round(4) 相同）
+                for target, key in (('high', 'high_point_analysis'), ('low', 'low_point_analysis')):
+                    bins, stats = self.tensor.feature_stats(feature_name, target)
+                    feature_data[key] = _bin_analysis(bins, stats)
             report["top_features"].append(feature_data)
 
         return report
 
+    def _fill_groupby_analysis(self, feature_data, feature_name):
+        results = self.analyze_single_feature(feature_name)
+        if results:
+            # 高點統計
+            if '高點預測' in results:
+                high_stats = results['高點預測']
+                for bin_value in high_stats.index:
+                    feature_data["high_point_analysis"][str(bin_value)] = {
+                        "sample_count": int(high_stats.loc[bin_value, '高點_樣本數']),
+                        "avg_change_pct": round(float(high_stats.loc[bin_value, '高點_平均變化%']), 4),
+                        "change_std": round(float(high_stats.loc[bin_value, '高點_變化標準差']), 4),
+                        "up_count": int(high_stats.loc[bin_value, '高點_上漲次數']),
+                        "up_probability": round(float(high_stats.loc[bin_value, '高點_上漲機率']), 4)
+                    }
+            # 低點統計
+            if '低點預測' in results:
+                low_stats = results['低點預測']
+                for bin_value in low_stats.index:
+                    feature_data["low_point_analysis"][str(bin_value)] = {
+                        "sample_count": int(low_stats.loc[bin_value, '低點_樣本數']),
+                        "avg_change_pct": round(float(low_stats.loc[bin_value, '低點_平均變化%']), 4),
+                        "change_std": round(float(low_stats.loc[bin_value, '低點_變化標準差']), 4),
+                        "up_count": int(low_stats.loc[bin_value, '低點_上漲次數']),
+                        "up_probability": round(float(low_stats.loc[bin_value, '低點_上漲機率']), 4)
+                    }
+
 
 # ========== 主程式執行區 ========== #
 if __name__ == "__main__":
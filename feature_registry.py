@@ -0,0 +1,286 @@
+"""
+宣告式特徵登錄表：每個特徵宣告輸入、參數與相依，依需求只計算用得到的節點
+
+compute_features 一律算完全部 23 個指標，但下游評分只用得到分析報告挑出的前 8 個特徵。
+這裡把每個特徵拆成一個節點 Feature(name, func, inputs, params)：
+- inputs 是 K 線欄位（open / high / low / close / volume / Date）或其他節點的名稱
+- 要求一組特徵時只解析它們的相依（拓撲排序），其餘節點完全不計算
+- 相同的 (func, inputs, params) 只算一次：MA_20 與布林通道中線、MACD 與 signal 共用的 EMA 等
+- 新指標或參數變體只要 register / register_variant，不必改動 compute_features
+
+以 "_" 開頭的是中間節點（例如 _close_std_20），不會出現在預設輸出，但也可以直接要求。
+compute_features 即是 compute_feature_subset(df, DEFAULT_FEATURES)，輸出與原本逐位元相同。
+
+    python feature_registry.py --features RSI_14 MACD_12_26_9
+    python feature_registry.py --report data/feature_analysis_report.json   # 只算報告挑出的特徵
+"""
+from collections import namedtuple
+
+Feature = namedtuple("Feature", ["name", "func", "inputs", "params"])
+
+# K 線本身的欄位（不需計算，直接從輸入 DataFrame 取）
+BASE_INPUTS = ('Date', 'open', 'high', 'low', 'close', 'volume')
+
+REGISTRY = {}
+
+
+def register(name, func, inputs, **params):
+    """登錄特徵節點：name = func(*inputs 的值, **params)；同名會覆蓋"""
+    if name in BASE_INPUTS:
+        raise ValueError(f"特徵名稱不可與 K 線欄位相同：{name}")
+    REGISTRY[name] = Feature(name, func, tuple(inputs), dict(params))
+    return REGISTRY[name]
+
+
+def register_variant(base, name, **params):
+    """以既有節點為基礎登錄參數變體，例如 register_variant("RSI_14", "RSI_7", period=7)"""
+    node = REGISTRY[base]
+    return register(name, node.func, node.inputs, **{**node.params, **params})
+
+
+# === 節點函式（輸入皆為 pandas Series） ===
+def rolling_mean(series, window):
+    return series.rolling(window=window).mean()
+
+
+def rolling_std(series, window):
+    return series.rolling(window=window).std()
+
+
+def rolling_sum(series, window):
+    return series.rolling(window=window).sum()
+
+
+def ema(series, span):
+    return series.ewm(span=span).mean()
+
+
+def pct_change(series):
+    return series.pct_change()
+
+
+def identity(series):
+    return series
+
+
+def sub(a, b):
+    return a - b
+
+
+def mul(a, b):
+    return a * b
+
+
+def band(mid, std, k, sign):
+    """布林通道上下軌：mid ± std × k"""
+    return mid + (std * k) if sign > 0 else mid - (std * k)
+
+
+def band_position(close, lower, upper):
+    return (close - lower) / (upper - lower)
+
+
+def rsi(series, period):
+    delta = series.diff()
+    gain = delta.where(delta > 0, 0).rolling(window=period).mean()
+    loss = (-delta.where(delta < 0, 0)).rolling(window=period).mean()
+    rs = gain / loss
+    return 100 - (100 / (1 + rs))
+
+
+def true_range(high, low, close):
+    import pandas as pd
+    tr1 = high - low
+    tr2 = abs(high - close.shift())
+    tr3 = abs(low - close.shift())
+    return pd.concat([tr1, tr2, tr3], axis=1).max(axis=1)
+
+
+def upper_shadow(high, close, open_):
+    import pandas as pd
+    return high - pd.concat([close, open_], axis=1).max(axis=1)
+
+
+def lower_shadow(low, close, open_):
+    import pandas as pd
+    return pd.concat([close, open_], axis=1).min(axis=1) - low
+
+
+def to_datetime(dates):
+    import pandas as pd
+    return pd.to_datetime(dates)
+
+
+def hour(dt):
+    # 統一為 int64，與 CSV 讀回的型別一致（分箱會依 dtype 決定分箱方式）
+    return dt.dt.hour.astype('int64')
+
+
+def weekday(dt):
+    return dt.dt.weekday.astype('int64')
+
+
+def typical_price(high, low, close):
+    return (high + low + close) / 3
+
+
+def cumulative_ratio(numerator, denominator):
+    return numerator.cumsum() / denominator.cumsum()
+
+
+def rolling_ratio(numerator, denominator, window):
+    return numerator.rolling(window=window).sum() / denominator.rolling(window=window).sum()
+
+
+# === 預設特徵（與 compute_features 相同） ===
+register('MA_20', rolling_mean, ['close'], window=20)
+register('EMA_20', ema, ['close'], span=20)
+
+# 布林通道：中線與 MA_20 是同一個計算
+register('_close_std_20', rolling_std, ['close'], window=20)
+register('BBM_20_2.0', identity, ['MA_20'])
+register('BBL_20_2.0', band, ['MA_20', '_close_std_20'], k=2, sign=-1)
+register('BBU_20_2.0', band, ['MA_20', '_close_std_20'], k=2, sign=1)
+register('BBB_20_2.0', band_position, ['close', 'BBL_20_2.0', 'BBU_20_2.0'])
+register('BBP_20_2.0', identity, ['BBB_20_2.0'])
+
+register('RSI_14', rsi, ['close'], period=14)
+
+register('_ema_close_12', ema, ['close'], span=12)
+register('_ema_close_26', ema, ['close'], span=26)
+register('MACD_12_26_9', sub, ['_ema_close_12', '_ema_close_26'])
+register('MACDs_12_26_9', ema, ['MACD_12_26_9'], span=9)
+register('MACDh_12_26_9', sub, ['MACD_12_26_9', 'MACDs_12_26_9'])
+
+register('_true_range', true_range, ['high', 'low', 'close'])
+register('ATR_14', rolling_mean, ['_true_range'], window=14)
+
+register('Return', pct_change, ['close'])
+register('High_Low', sub, ['high', 'low'])
+register('Open_Close', sub, ['close', 'open'])
+register('UpperShadow', upper_shadow, ['high', 'close', 'open'])
+register('LowerShadow', lower_shadow, ['low', 'close', 'open'])
+
+register('_datetime', to_datetime, ['Date'])
+register('Hour', hour, ['_datetime'])
+register('Weekday', weekday, ['_datetime'])
+
+register('Volume_MA20', rolling_mean, ['volume'], window=20)
+register('Volume_Change', pct_change, ['volume'])
+
+register('_typical_price', typical_price, ['high', 'low', 'close'])
+register('_price_volume', mul, ['_typical_price', 'volume'])
+register('VWAP', cumulative_ratio, ['_price_volume', 'volume'])
+register('VWAP_20', rolling_ratio, ['_price_volume', 'volume'], window=20)
+
+DEFAULT_FEATURES = [
+    'MA_20', 'EMA_20', 'BBL_20_2.0', 'BBM_20_2.0', 'BBU_20_2.0', 'BBB_20_2.0', 'BBP_20_2.0',
+    'RSI_14', 'MACD_12_26_9', 'MACDs_12_26_9', 'MACDh_12_26_9', 'ATR_14',
+    'Return', 'High_Low', 'Open_Close', 'UpperShadow', 'LowerShadow', 'Hour', 'Weekday',
+    'Volume_MA20', 'Volume_Change', 'VWAP', 'VWAP_20',
+]
+
+
+def plan(names, registry=None):
+    """回傳計算 names 需要的節點（拓撲順序，相依在前）；未知名稱或循環相依拋出 ValueError"""
+    registry = REGISTRY if registry is None else registry
+    order, done, visiting = [], set(), set()
+
+    def visit(name, path):
+        if name in done or name in BASE_INPUTS:
+            return
+        if name not in registry:
+            raise ValueError(f"未登錄的特徵：{name}" + (f"（{' → '.join(path)} 需要）" if path else ""))
+        if name in visiting:
+            raise ValueError(f"特徵相依形成循環：{' → '.join(path + [name])}")
+        visiting.add(name)
+        for dep in registry[name].inputs:
+            visit(dep, path + [name])
+        visiting.discard(name)
+        done.add(name)
+        order.append(name)
+
+    for name in names:
+        visit(name, [])
+    return order
+
+
+def _signature(node):
+    params = tuple(sorted((k, repr(v)) for k, v in node.params.items()))
+    return node.func, node.inputs, params
+
+
+def evaluate(df, names, registry=None):
+    """計算 names 需要的節點，回傳 {名稱: Series}（包含中間節點）"""
+    registry = REGISTRY if registry is None else registry
+    values = {}
+    shared = {}
+    for name in plan(names, registry):
+        node = registry[name]
+        # 相同運算（函式、輸入、參數都一樣）只算一次，例如另外登錄的 SMA_close_20 與 MA_20
+        key = _signature(node)
+        if key not in shared:
+            args = [values[i] if i in values else df[i] for i in node.inputs]
+            shared[key] = node.func(*args, **node.params)
+        values[name] = shared[key]
+    return values
+
+
+def compute_feature_subset(df, names, registry=None):
+    """只計算 names 指定的特徵，回傳「原有欄位 + names」的 DataFrame（不修改傳入的 df）"""
+    names = list(dict.fromkeys(names))
+    values = evaluate(df, names, registry)
+    return df.assign(**{name: values[name] for name in names})
+
+
+def features_from_report(report):
+    """
+    從特徵分析報告（dict 或 JSON 路徑）取出用得到的特徵名稱：
+    報告中的欄位是 "{特徵}_binned"，K 線原始欄位（open、volume ...）不需計算會被略過
+    """
+    if isinstance(report, str):
+        import json
+        with open(report, encoding='utf-8') as f:
+            report = json.load(f)
+    names = []
+    for item in report.get('top_features', []):
+        name = item['feature_name']
+        if name.endswith('_binned'):
+            name = name[:-len('_binned')]
+        if name in REGISTRY and not name.startswith('_'):
+            names.append(name)
+    return names
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="依登錄表只計算指定的特徵，並與完整計算比較時間")
+    parser.add_argument("--input", default="data/cleaned.csv")
+    parser.add_argument("--features", nargs="*", default=None)
+    parser.add_argument("--report", default="data/feature_analysis_report.json",
+                        help="未指定 --features 時，改用分析報告挑出的特徵")
+    args = parser.parse_args()
+
+    from columnar_store import read_frame
+    from add_features import compute_features
+
+    names = args.features if args.features is not None else features_from_report(args.report)
+    if not names:
+        raise SystemExit("❌ 沒有要計算的特徵（請指定 --features 或有效的 --report）")
+    df = read_frame(args.input)
+
+    print(f"🧮 要求 {len(names)} 個特徵：{', '.join(names)}")
+    print(f"   需要計算的節點（{len(plan(names))} / {len(REGISTRY)}）：{', '.join(plan(names))}")
+
+    started = time.perf_counter()
+    subset = compute_feature_subset(df, names)
+    subset_s = time.perf_counter() - started
+    started = time.perf_counter()
+    full = compute_features(df)
+    full_s = time.perf_counter() - started
+
+    same = all(subset[name].equals(full[name]) for name in names if name in full.columns)
+    print(f"   部分計算 {subset_s * 1000:.1f}ms，完整計算 {full_s * 1000:.1f}ms（{full_s / subset_s:.1f}x）")
+    print(f"   與完整計算結果相同：{same}")
@@ -1,8 +1,10 @@
 from datetime import datetime, timedelta, timezone
 import time
-import requests
-import pandas as pd
 import os
+# requests / pandas 只在真正抓資料時才載入：排程器、快取鍵等只需要 INTERVAL_MS 的路徑可以快速啟動
+
+# Binance 現貨 REST 位址；可用環境變數 BINANCE_BASE_URL 指向本地替身（binance_replay_server.py）
+BASE_URL = os.environ.get("BINANCE_BASE_URL", "https://api.binance.com").rstrip("/")
 
 # === Binance K線結構 ===
 BINANCE_KLINE_COLS = [
@@ -10,6 +12,10 @@ BINANCE_KLINE_COLS = [
     'close_time', 'quote_asset_volume', 'num_trades',
     'taker_buy_base_asset_volume', 'taker_buy_quote_asset_volume', 'ignore'
 ]
+NUMERIC_KLINE_COLS = [
+    'open', 'high', 'low', 'close', 'volume', 'quote_asset_volume',
+    'taker_buy_base_asset_volume', 'taker_buy_quote_asset_volume'
+]
 
 # 轉換 interval -> 毫秒
 INTERVAL_MS = {
@@ -30,100 +36,231 @@ INTERVAL_MS = {
     "1w": 7 * 24 * 60 * 60_000,
     "1M": 30 * 24 * 60 * 60_000,   # Binance 月線長度不定，這裡僅做近似
 }
+# 開盤時間相對 epoch 的偏移：Binance 週線從週一 00:00 UTC 開始，epoch（1970-01-01）是週四，往後 4 天才是週一
+BAR_ALIGN_OFFSET_MS = {"1w": 4 * 24 * 60 * 60_000}
 
-def fetch_with_retry(url, params, max_attempts=5, backoff_factor=1.5):
-    """從 Binance API 抓資料（具重試機制）"""
-    for attempt in range(1, max_attempts + 1):
-        try:
-            resp = requests.get(url, params=params, timeout=10)
-            resp.raise_for_status()
-            return resp.json()
-        except Exception as e:
-            wait = backoff_factor ** attempt
-            print(f"第 {attempt} 次嘗試失敗：{e}，{wait:.1f} 秒後重試...")
-            time.sleep(wait)
-    raise RuntimeError(f"❌ 多次重試後仍無法成功取得資料（共 {max_attempts} 次）")
+def fetch_with_retry(url, params, max_attempts=5):
+    """從 Binance API 抓資料（共用連線池；429/418 依 Retry-After 等待，其餘錯誤 jitter 退避重試）"""
+    from http_client import get_client
+    try:
+        return get_client().get_json(url, params=params, max_attempts=max_attempts)
+    except Exception as e:
+        raise RuntimeError(f"❌ 多次重試後仍無法成功取得資料（共 {max_attempts} 次）：{e}")
+
+def fetch_klines(params, max_attempts=5):
+    """抓 /api/v3/klines 並直接把回應本文解析成具型別的陣列（見 kline_parser.py）"""
+    from http_client import get_client
+    from kline_parser import parse_klines
+    try:
+        resp = get_client().request("GET", f"{BASE_URL}/api/v3/klines", params=params,
+                                    max_attempts=max_attempts)
+        resp.raise_for_status()
+    except Exception as e:
+        raise RuntimeError(f"❌ 多次重試後仍無法成功取得資料（共 {max_attempts} 次）：{e}")
+    return parse_klines(resp.content)
+
+def get_server_time_offset_ms() -> int:
+    """Binance 現貨伺服器時間 - 本地時間（毫秒），以請求來回的中點估計"""
+    t0 = time.time() * 1000
+    data = fetch_with_retry(f"{BASE_URL}/api/v3/time", {})
+    t1 = time.time() * 1000
+    return int(data["serverTime"] - (t0 + t1) / 2)
 
-def get_latest_closed_kline_close_time(symbol: str, interval: str) -> int:
+def get_latest_closed_kline_close_time(symbol: str, interval: str, now_ms=None) -> int:
     """
     取最新一根「已收盤」K線的 close_time（毫秒）。
-    用 limit=1 直接問 klines，比自己算時間對齊安全。
+    直接問 klines 比自己算時間對齊安全；但回傳的最後一根可能是尚未收盤的 K 線，
+    因此取 limit=2，並挑 close_time 早於現在（now_ms，預設本地時間）的最後一根。
     """
-    url = "https://api.binance.com/api/v3/klines"
-    params = {"symbol": symbol, "interval": interval, "limit": 1}
-    data = fetch_with_retry(url, params)
-    if not data:
+    from kline_parser import closed_only, num_rows
+    params = {"symbol": symbol, "interval": interval, "limit": 2}
+    data = fetch_klines(params)
+    if not num_rows(data):
         raise RuntimeError("⚠️ 取最新K線失敗")
-    # 回傳的格式第7欄為 close_time（毫秒）
-    latest_close_time_ms = data[0][6]
+    if now_ms is None:
+        now_ms = int(time.time() * 1000)
+    closed = closed_only(data, now_ms)
+    if not num_rows(closed):
+        raise RuntimeError("⚠️ 取最新K線失敗：沒有已收盤的K線")
+    latest_close_time_ms = int(closed["close_time"][-1])
     return latest_close_time_ms
 
+def klines_to_frame(raw_data):
+    """
+    Binance klines → DataFrame（本地資料庫格式）：
+    open_time / close_time 為 UTC 毫秒整數，價格與量為 float64，去掉 ignore 欄位。
+    raw_data 可以是原始陣列（list）、回應本文（bytes），或 kline_parser 已解析好的陣列 dict。
+    """
+    from kline_parser import parse_klines, to_frame
+    return to_frame(raw_data if isinstance(raw_data, dict) else parse_klines(raw_data))
+
+def to_window_frame(df):
+    """本地資料庫格式 → 下游流程使用的格式（Date / close_time 轉為 UTC datetime）"""
+    import pandas as pd
+    df = df.copy()
+    df["open_time"]  = pd.to_datetime(df["open_time"], unit="ms", utc=True)
+    df["close_time"] = pd.to_datetime(df["close_time"], unit="ms", utc=True)
+    df.rename(columns={'open_time': 'Date'}, inplace=True)
+    df.reset_index(drop=True, inplace=True)
+    return df
+
+def sync_kline_store(store, symbol, interval, min_bars=0, now_ms=None):
+    """
+    把本地資料庫補到最新一根已收盤 K 線：
+    - 已有資料：從最後一根 close_time 之後開始要（通常只有 1 根新 K 線，一次請求）
+    - 資料不足 min_bars 根：再往前補舊資料
+    now_ms：判斷是否已收盤的伺服器時間（預設本地時鐘；串流以事件時間傳入）。
+    回傳新增的筆數。
+    """
+    from kline_parser import closed_only, num_rows
+    limit = 1000
+    if now_ms is None:
+        now_ms = int(time.time() * 1000)
+    added = 0
+
+    last_close = store.last_close_time(symbol, interval)
+    if last_close is None:
+        # 初次建立：直接要最新的 min_bars 根（+1 是因為最後一根可能尚未收盤）
+        raw = fetch_klines({"symbol": symbol, "interval": interval,
+                            "limit": min(max(min_bars, 1) + 1, limit)})
+        closed = closed_only(raw, now_ms)
+        added += store.append(symbol, interval, klines_to_frame(closed))
+    else:
+        start = last_close + 1
+        while True:
+            raw = fetch_klines({"symbol": symbol, "interval": interval,
+                                "startTime": start, "limit": limit})
+            closed = closed_only(raw, now_ms)
+            if num_rows(closed):
+                added += store.append(symbol, interval, klines_to_frame(closed))
+                start = int(closed["close_time"][-1]) + 1
+            if num_rows(raw) < limit or not num_rows(closed):
+                break
+
+    # 往前補足 min_bars（例如 offset_bars 變大或 window 變長）
+    need = min_bars - store.count(symbol, interval)
+    if need > limit:
+        # 超過單頁上限：交給 backfill 分頁並行抓取
+        from backfill import backfill_klines
+        first_open = store.meta(symbol, interval)["first_open_time"]
+        before = store.count(symbol, interval)
+        backfill_klines(symbol, interval, first_open - need * INTERVAL_MS[interval], first_open - 1, store=store)
+        added += store.count(symbol, interval) - before
+    elif need > 0:
+        first_open = store.meta(symbol, interval)["first_open_time"]
+        raw = fetch_klines({"symbol": symbol, "interval": interval,
+                            "endTime": first_open - 1, "limit": need})
+        if num_rows(raw):  # 空陣列代表幣對歷史不足
+            added += store.append(symbol, interval, klines_to_frame(raw))
+
+    if added:
+        print(f"🗄️ 本地資料庫 {symbol} {interval} 新增 {added} 根（共 {store.count(symbol, interval)} 根）")
+    return added
+
+def _check_window(open_times, interval):
+    """檢查視窗內 K 線是否連續（缺一根會讓 rolling 指標整段錯位）；有問題時印出警告並回傳 False"""
+    from kline_integrity import format_report, scan_open_times
+    report = scan_open_times(open_times, interval)
+    if not report["ok"]:
+        print(f"⚠️ 視窗內 K 線不連續：{format_report(report)}")
+    return report["ok"]
+
 def fetch_kline_window(symbol="BTCUSDT",
                        interval="4h",
                        offset_bars=0,
                        window_size=500,
                        output_dir="data",
-                       prefix="backtest"):
+                       prefix="backtest",
+                       save=True,
+                       store=None,
+                       sync=True):
     """
     回測用窗口抓取：
     以最新K線為0，往回 offset_bars 當作「結尾」，
-    一次取 window_size 根（最大1000，建議<=500）。
+    一次取 window_size 根（超過 1000 根時改由 backfill 分頁並行抓取）。
 
     會將結果輸出兩份 CSV：
     - {prefix}_{symbol}_{interval}_off{offset}_win{window}.csv
     - {prefix}_cleaned.csv（覆蓋式，方便下游固定讀取檔名）
+    save=False 時只回傳 DataFrame，不寫檔（供 in-process 流程使用）。
+    store（KlineStore）有給時：只向 Binance 要本地缺少的 K 線，視窗從本地資料切出；
+    sync=False 時完全不發請求，直接從本地資料切視窗（資料庫由 websocket 串流維護時使用）。
     """
     if interval not in INTERVAL_MS:
         raise ValueError(f"不支援的 interval: {interval}")
 
-    if window_size < 1 or window_size > 1000:
-        raise ValueError("window_size 必須介於 1~1000（Binance 單次上限 1000）")
-
-    os.makedirs(output_dir, exist_ok=True)
-    url = "https://api.binance.com/api/v3/klines"
+    if window_size < 1:
+        raise ValueError("window_size 必須 >= 1")
 
-    # 先拿「最新一根已收盤K」的 close_time 當基準
-    latest_close_time_ms = get_latest_closed_kline_close_time(symbol, interval)
-    step = INTERVAL_MS[interval]
+    if store is not None:
+        print(f"\n📡 同步 {symbol} ({interval}) 本地資料庫：offset_bars={offset_bars}, window_size={window_size}")
+        try:
+            if sync:
+                sync_kline_store(store, symbol, interval, min_bars=offset_bars + window_size)
+            window = store.window(symbol, interval, offset_bars, window_size)
+            if not _check_window(window["open_time"].to_numpy(), interval) and sync:
+                # 視窗內有缺漏 / 重複：修補本地資料庫後重新切視窗
+                from kline_integrity import repair_store
+                repair_store(store, symbol, interval)
+                window = store.window(symbol, interval, offset_bars, window_size)
+        except Exception as e:
+            print("❌ 同步本地資料庫時發生致命錯誤：", e)
+            return None
+        df = to_window_frame(window)
+        if df.empty:
+            print("⚠️ 本地資料庫沒有可用的 K 線。")
+            return None
+    else:
+        # 先拿「最新一根已收盤K」的 close_time 當基準
+        latest_close_time_ms = get_latest_closed_kline_close_time(symbol, interval)
+        step = INTERVAL_MS[interval]
 
-    # 設定「結尾」：往回 offset_bars 根
-    # endTime 的定義：回傳的最後一根K線的 close_time 不會超過 endTime
-    end_time_ms = latest_close_time_ms - offset_bars * step
+        # 設定「結尾」：往回 offset_bars 根
+        # endTime 的定義：回傳的最後一根K線的 close_time 不會超過 endTime
+        end_time_ms = latest_close_time_ms - offset_bars * step
 
-    # 用 endTime + limit 抓取 window_size 連續資料（結尾對齊 end_time_ms）
-    params = {
-        "symbol": symbol,
-        "interval": interval,
-        "limit": window_size,
-        "endTime": end_time_ms
-    }
+        # 用 endTime + limit 抓取 window_size 連續資料（結尾對齊 end_time_ms）
+        params = {
+            "symbol": symbol,
+            "interval": interval,
+            "limit": window_size,
+            "endTime": end_time_ms
+        }
 
-    print(f"\n📡 抓取 {symbol} ({interval}) 回測窗口：offset_bars={offset_bars}, window_size={window_size}")
-    print(f"   以 close_time={end_time_ms}（UTC毫秒）為結尾")
+        print(f"\n📡 抓取 {symbol} ({interval}) 回測窗口：offset_bars={offset_bars}, window_size={window_size}")
+        print(f"   以 close_time={end_time_ms}（UTC毫秒）為結尾")
 
-    try:
-        raw_data = fetch_with_retry(url, params)
-    except Exception as e:
-        print("❌ 抓取資料時發生致命錯誤：", e)
-        return None
+        try:
+            if window_size > 1000:
+                # Binance 單次上限 1000 根：切頁並行抓取
+                from backfill import backfill_klines
+                raw_df = backfill_klines(symbol, interval, end_time_ms + 1 - window_size * step, end_time_ms)
+                raw_data = raw_df if len(raw_df) else None
+            else:
+                raw_data = klines_to_frame(fetch_klines(params))
+                raw_data = raw_data if len(raw_data) else None
+        except Exception as e:
+            print("❌ 抓取資料時發生致命錯誤：", e)
+            return None
 
-    if not raw_data:
-        print("⚠️ 未能成功取得資料。")
-        return None
+        if raw_data is None:
+            print("⚠️ 未能成功取得資料。")
+            return None
 
-    # === 處理資料 ===
-    df = pd.DataFrame(raw_data, columns=BINANCE_KLINE_COLS)
-    df["open_time"]  = pd.to_datetime(df["open_time"], unit="ms", utc=True)
-    df["close_time"] = pd.to_datetime(df["close_time"], unit="ms", utc=True)
-    df.rename(columns={'open_time': 'Date'}, inplace=True)
-    df.drop(columns=["ignore"], inplace=True)
-    df.reset_index(drop=True, inplace=True)
+        # === 處理資料 ===
+        _check_window(raw_data["open_time"].to_numpy(), interval)
+        df = to_window_frame(raw_data)
 
     # 檢查長度是否符合 window_size（太早期幣對可能不夠長）
     if len(df) < window_size:
         print(f"⚠️ 實際取得 {len(df)} 根，小於要求的 {window_size} 根（歷史不足或幣對歷史較短）。")
 
+    if not save:
+        print(f"📈 視窗起訖：{df['Date'].iloc[0]} ~ {df['Date'].iloc[-1]}（UTC）")
+        return df
+
     # === 輸出結果 ===
+    os.makedirs(output_dir, exist_ok=True)
     file_tag = f"{prefix}_{symbol.replace('/', '_')}_{interval}_off{offset_bars}_win{window_size}.csv"
     raw_path = os.path.join(output_dir, file_tag)
     clean_path = os.path.join(output_dir, f"{prefix}_cleaned.csv")
@@ -1,18 +1,21 @@
-import pandas as pd
 from datetime import datetime, timedelta
 import json
 
-def generate_latest_assessment():
+def generate_latest_assessment(df=None):
     """
     生成最新一筆交易評估報告
     步驟：
-    1. 從 CSV 讀取交易信號資料
+    1. 從 CSV 讀取交易信號資料（若已傳入 df 則直接使用）
     2. 抓取最新一筆記錄（最新 K 線）
     3. 計算K線結構（實體、上下影線、漲跌幅）
     4. 根據買賣分數給出交易建議
     """
+    import pandas as pd
+
     # 讀取交易信號數據（含 buy_score、sell_score）
-    df = pd.read_csv('data/trading_signals_with_scores.csv')
+    if df is None:
+        from columnar_store import read_frame
+        df = read_frame('data/trading_signals_with_scores.csv')
 
     # 取最後一筆（最新時間）
     latest_data = df.iloc[-1]
@@ -122,15 +125,16 @@ def format_assessment_report(assessment):
     return report
 
 
-def save_assessment_report():
+def save_assessment_report(assessment=None):
     """
     主流程：
-    1. 生成最新交易評估
+    1. 生成最新交易評估（若已傳入 assessment 則直接保存）
     2. 保存 JSON 與 TXT 檔案
     3. 在終端印出結果
     """
     # 生成分析結果
-    assessment = generate_latest_assessment()
+    if assessment is None:
+        assessment = generate_latest_assessment()
 
     # 儲存 JSON 格式（結構化數據，供系統使用）
     with open('data/latest_trading_assessment.json', 'w', encoding='utf-8') as f:
@@ -1,9 +1,10 @@
-import time, hmac, hashlib, requests, os, ast, json
+import time, hmac, hashlib, os, ast, json
 from pathlib import Path
 import argparse
 
 # === API 基本設定 ===
-BASE_URL = "https://fapi.binance.com"
+# 可用環境變數 BINANCE_FAPI_BASE_URL 或 --base-url 指向本地替身（binance_replay_server.py）
+BASE_URL = os.environ.get("BINANCE_FAPI_BASE_URL", "https://fapi.binance.com").rstrip("/")
 SYMBOL = "BTCUSDT"
 API_KEY = ""
 SECRET_KEY = ""
@@ -38,8 +39,9 @@ def load_api_config(path: str):
 def get_server_time_offset():
     """計算本地與 Binance 伺服器時間差（毫秒）"""
     global TIME_OFFSET
+    from http_client import get_client
     try:
-        server_time = requests.get(BASE_URL + "/fapi/v1/time", timeout=5).json()["serverTime"]
+        server_time = get_client().get_json(BASE_URL + "/fapi/v1/time", timeout=5)["serverTime"]
         local_time = int(time.time() * 1000)
         TIME_OFFSET = server_time - local_time
         print(f"🕒 與伺服器時間差：{TIME_OFFSET} ms\n")
@@ -55,16 +57,24 @@ def _sign(params):
 
 
 def _req(method, endpoint, params=None):
+    # HTTP 客戶端只在真的要呼叫 API 時才載入（dry-run 不需要）
+    from http_client import get_client
     if params is None:
         params = {}
-    # 使用修正後的時間戳
-    params["timestamp"] = int(time.time() * 1000 + TIME_OFFSET)
-    params["recvWindow"] = 1000  # 允許 1 秒誤差
-    params["signature"] = _sign(params)
+
+    def signed(p):
+        # 在 client 等完限流（Retry-After）之後才蓋時間戳並簽章，避免送出過期簽章（-1021）
+        p["timestamp"] = int(time.time() * 1000 + TIME_OFFSET)
+        p["recvWindow"] = 1000  # 允許 1 秒誤差
+        p["signature"] = _sign(p)
+        return p
+
     headers = {"X-MBX-APIKEY": API_KEY}
     url = BASE_URL + endpoint
     try:
-        res = requests.request(method, url, params=params, headers=headers, timeout=10)
+        # 被限流的請求未被執行，可以重送（每次都重新簽章）；連線錯誤時非冪等請求不重送
+        res = get_client().request(method, url, params=params, headers=headers, timeout=10,
+                                   max_attempts=3, prepare=signed)
         return res.json()
     except Exception as e:
         return {"error": str(e)}
@@ -90,7 +100,8 @@ def setup():
 
     print("\n⚙️ 嘗試設定全倉模式...")
     m = _req("POST", "/fapi/v1/marginType", {"symbol": SYMBOL, "marginType": "CROSSED"})
-    if m == {} or m.get("code") == -4046:
+    # 成功時 Binance 回 {"code": 200, "msg": "success"}；-4046 代表已是全倉
+    if m == {} or m.get("code") in (200, -4046):
         print("✅ 全倉模式設定成功（或已是全倉）")
     else:
         print("❌ 全倉模式設定失敗:", m)
@@ -205,9 +216,11 @@ def process_recommendation(json_path: str, live: bool = False):
 # === 主入口 ===
 def main():
     parser = argparse.ArgumentParser(description="根據 latest_trading_assessment.json 決定開倉/平倉")
-    parser.add_argument("--json", "-j", default="data/latest_trading_assessment.json", help="assessment JSON 檔路徑")
+    parser.add_argument("--json", "-j", default="data/BTCUSDT_4h/latest_trading_assessment.json",
+                        help="assessment JSON 檔路徑（a_main / multi_runner 寫在 data/{symbol}_{interval}/）")
     parser.add_argument("--config", "-c", default="user/api.config", help="API config 檔（預設 user/api.config）")
     parser.add_argument("--live", action="store_true", help="帶此參數會真的執行下單（否則 dry-run）")
+    parser.add_argument("--base-url", default=None, help="覆寫 API 位址（例如本地替身 http://127.0.0.1:8765）")
     args = parser.parse_args()
 
     # 載入 config
@@ -218,9 +231,12 @@ def main():
         SECRET_KEY = cfg.get("SECRET_KEY", SECRET_KEY)
         BASE_URL = cfg.get("BASE_URL", BASE_URL)
         SYMBOL = cfg.get("SYMBOL", SYMBOL)
+    if args.base_url:
+        BASE_URL = args.base_url.rstrip("/")
 
-    # 自動同步時間
-    get_server_time_offset()
+    # 自動同步時間（只有實際下單才需要簽章時間戳，dry-run 略過以加快啟動）
+    if args.live:
+        get_server_time_offset()
 
     process_recommendation(args.json, live=args.live)
 
@@ -0,0 +1,220 @@
+"""
+共用 HTTP 客戶端（Binance REST、Discord webhook 等所有對外請求）
+
+- 每個 host 重用同一個 requests.Session（keep-alive 連線池），省去每次 TCP + TLS 握手
+- 429 / 418 依 Retry-After 暫停整個 host（所有執行緒一起等），再重試
+- 5xx 與連線錯誤以 full-jitter 指數退避重試；非冪等請求（POST 下單等）不重送，避免重複下單
+- 紀錄每個 endpoint 的次數、錯誤數與延遲（平均 / 最大 / 最近一次）
+- 保存 Binance 回報的 X-MBX-USED-WEIGHT-1M，供限流器參考
+
+使用方式
+    from http_client import get_client
+    data = get_client().get_json("https://api.binance.com/api/v3/klines", params={...})
+    get_client().print_stats()
+"""
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+RETRY_STATUS = (418, 429, 500, 502, 503, 504)
+RATE_LIMIT_STATUS = (418, 429)
+IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS", "PUT", "DELETE")
+
+
+def _parse_retry_after(value, default):
+    """Retry-After 標頭（秒數）；缺少或無法解析時回傳 default"""
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return default
+
+
+class HttpClient:
+    """
+    連線池化、具限流感知重試的 HTTP 客戶端（執行緒安全）
+    - pool_maxsize: 每個 host 的最大連線數（需 >= 並行執行緒數）
+    - backoff_base / backoff_cap: 退避時間的基數與上限（秒）
+    - default_retry_after: 限流回應沒有 Retry-After 時的等待秒數
+    """
+
+    def __init__(self, pool_maxsize=16, backoff_base=0.5, backoff_cap=30.0, default_retry_after=5.0):
+        self.pool_maxsize = pool_maxsize
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.default_retry_after = default_retry_after
+        self._sessions = {}
+        self._blocked_until = {}
+        self._used_weight = {}
+        self._stats = {}
+        self._windows = []
+        self._lock = threading.Lock()
+
+    # === 連線 ===
+    def session(self, host):
+        """取得（或建立）host 專用的 keep-alive Session"""
+        with self._lock:
+            sess = self._sessions.get(host)
+            if sess is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+                sess = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_maxsize)
+                sess.mount("https://", adapter)
+                sess.mount("http://", adapter)
+                self._sessions[host] = sess
+            return sess
+
+    def close(self):
+        with self._lock:
+            for sess in self._sessions.values():
+                sess.close()
+            self._sessions.clear()
+
+    # === 限流 ===
+    def wait_until_unblocked(self, host):
+        """host 被限流（429 / 418 的 Retry-After）時等到解除；簽章含時間戳的請求要在等完之後才簽"""
+        while True:
+            with self._lock:
+                wait = self._blocked_until.get(host, 0.0) - time.monotonic()
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    def _block(self, host, seconds):
+        with self._lock:
+            until = time.monotonic() + seconds
+            self._blocked_until[host] = max(self._blocked_until.get(host, 0.0), until)
+
+    def used_weight(self, host):
+        """該 host 最近一次回報的 X-MBX-USED-WEIGHT-1M（沒有則為 None）"""
+        with self._lock:
+            return self._used_weight.get(host)
+
+    def _backoff(self, attempt):
+        # full jitter：在 [0, min(cap, base * 2^attempt)] 之間隨機
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+
+    # === 統計 ===
+    def _record(self, endpoint, elapsed, error):
+        with self._lock:
+            for table in [self._stats] + self._windows:
+                s = table.setdefault(endpoint, {"count": 0, "errors": 0, "total_s": 0.0, "max_s": 0.0, "last_s": 0.0})
+                s["count"] += 1
+                s["errors"] += int(error)
+                s["total_s"] += elapsed
+                s["max_s"] = max(s["max_s"], elapsed)
+                s["last_s"] = elapsed
+
+    def open_window(self):
+        """
+        開始另外累計一段期間（例如單次流程執行）的統計，回傳的 window 交給 stats / close_window
+        客戶端是整個行程共用的，長駐的排程或處理多個交易對的 worker 只看 stats() 會混進之前每次執行的請求
+        """
+        window = {}
+        with self._lock:
+            self._windows.append(window)
+        return window
+
+    def close_window(self, window):
+        """停止累計；已累計的內容仍可用 stats(window) 讀取"""
+        with self._lock:
+            if any(w is window for w in self._windows):
+                self._windows = [w for w in self._windows if w is not window]
+
+    def stats(self, window=None):
+        """{endpoint: {count, errors, avg_ms, max_ms, last_ms}}；指定 window 時只統計該期間的請求"""
+        with self._lock:
+            return {
+                ep: {
+                    "count": s["count"],
+                    "errors": s["errors"],
+                    "avg_ms": round(s["total_s"] / s["count"] * 1000, 2) if s["count"] else 0.0,
+                    "max_ms": round(s["max_s"] * 1000, 2),
+                    "last_ms": round(s["last_s"] * 1000, 2),
+                }
+                for ep, s in (self._stats if window is None else window).items()
+            }
+
+    def print_stats(self, window=None):
+        stats = self.stats(window)
+        if not stats:
+            return
+        print("\n🌐 HTTP 延遲統計：")
+        print(f"   {'endpoint':<48}{'次數':>6}{'錯誤':>6}{'平均ms':>10}{'最大ms':>10}")
+        for ep, s in sorted(stats.items()):
+            print(f"   {ep:<48}{s['count']:>6}{s['errors']:>6}{s['avg_ms']:>10.1f}{s['max_ms']:>10.1f}")
+
+    # === 請求 ===
+    def request(self, method, url, params=None, json=None, headers=None, timeout=10,
+                max_attempts=5, endpoint=None, prepare=None):
+        """
+        送出請求並回傳 Response（非重試類的 4xx 也直接回傳，由呼叫端判斷）。
+        重試耗盡時：限流 / 5xx 回傳最後一次 Response；連線錯誤則拋出最後一個例外。
+        prepare(params) 在每次送出前（限流等待之後）呼叫並回傳實際送出的 params，用來重新簽時間戳。
+        """
+        import requests
+
+        method = method.upper()
+        parts = urlsplit(url)
+        host = parts.netloc
+        endpoint = endpoint or f"{method} {host}{parts.path}"
+        idempotent = method in IDEMPOTENT_METHODS
+        sess = self.session(host)
+
+        for attempt in range(1, max_attempts + 1):
+            self.wait_until_unblocked(host)
+            sent = prepare(dict(params or {})) if prepare is not None else params
+            started = time.perf_counter()
+            try:
+                resp = sess.request(method, url, params=sent, json=json, headers=headers, timeout=timeout)
+            except requests.exceptions.RequestException as e:
+                self._record(endpoint, time.perf_counter() - started, True)
+                # 非冪等請求可能已送達伺服器，不重送
+                if attempt == max_attempts or not idempotent:
+                    raise
+                wait = self._backoff(attempt)
+                print(f"第 {attempt} 次嘗試失敗：{e}，{wait:.1f} 秒後重試...")
+                time.sleep(wait)
+                continue
+
+            self._record(endpoint, time.perf_counter() - started, resp.status_code >= 400)
+            used = resp.headers.get("X-MBX-USED-WEIGHT-1M")
+            if used is not None:
+                with self._lock:
+                    self._used_weight[host] = int(used)
+
+            if resp.status_code in RATE_LIMIT_STATUS:
+                retry_after = _parse_retry_after(resp.headers.get("Retry-After"), self.default_retry_after)
+                self._block(host, retry_after)
+                print(f"⏸️ {host} 限流（HTTP {resp.status_code}），暫停 {retry_after:.1f} 秒")
+                # 限流代表請求被拒絕（未執行），非冪等請求也可以安全重送
+                if attempt < max_attempts:
+                    continue
+                return resp
+            if resp.status_code in RETRY_STATUS and idempotent and attempt < max_attempts:
+                wait = _parse_retry_after(resp.headers.get("Retry-After"), self._backoff(attempt))
+                print(f"第 {attempt} 次嘗試失敗：HTTP {resp.status_code}，{wait:.1f} 秒後重試...")
+                time.sleep(wait)
+                continue
+            return resp
+        return resp
+
+    def get_json(self, url, params=None, **kwargs):
+        """GET 並解析 JSON；最終仍非 2xx 時拋出 requests.HTTPError"""
+        resp = self.request("GET", url, params=params, **kwargs)
+        resp.raise_for_status()
+        return resp.json()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """行程內共用的 HttpClient（每個 worker 行程各自一個）"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = HttpClient()
+        return _client
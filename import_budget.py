@@ -0,0 +1,119 @@
+"""
+各入口模組的啟動（import）時間檢查
+
+以 `python -X importtime -c "import <module>"` 在全新的直譯器量測每個入口的
+累計 import 時間，與 IMPORT_BUDGETS_MS 的預算比較；並列出最耗時的相依模組，
+方便找出是誰把 pandas / matplotlib / requests 拉進了不該拉的路徑。
+
+使用方式
+    python import_budget.py                 # 檢查全部入口，超出預算時 exit code = 1
+    python import_budget.py go_again a_main --repeat 5 --top 8
+"""
+import os
+import re
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# 入口模組 → 預算（毫秒，累計 import 時間，不含直譯器本身啟動）
+# 輕量入口（排程 / 下單 / 通知）不應載入 pandas；資料處理腳本則以 pandas 為主要成本
+IMPORT_BUDGETS_MS = {
+    "a_main": 60,
+    "pipeline": 60,
+    "bar_scheduler": 60,
+    "multi_runner": 60,
+    "fetch_data": 30,
+    "go_again": 40,
+    "send_to_discord": 40,
+    "discord_webhook_sender": 40,
+    "generate_latest_assessment": 40,
+    "run_metrics": 40,
+    "backtest_trading": 600,
+}
+
+_LINE_RE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def measure_import(module, python=sys.executable):
+    """
+    回傳 (模組累計微秒, [(相依模組, 累計微秒), ...])；import 失敗時拋出 RuntimeError
+    """
+    proc = subprocess.run(
+        [python, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        last = proc.stderr.strip().splitlines()[-1:] or [""]
+        raise RuntimeError(f"import {module} 失敗：{last[0]}")
+
+    total = None
+    top_level = []
+    for line in proc.stderr.splitlines():
+        m = _LINE_RE.match(line)
+        if not m:
+            continue
+        cumulative, indent, name = int(m.group(2)), len(m.group(3)), m.group(4)
+        if name == module and indent == 1:
+            total = cumulative
+        elif indent == 3:
+            # 入口模組直接 import 的模組（巢狀一層）
+            top_level.append((name, cumulative))
+    if total is None:
+        raise RuntimeError(f"找不到 {module} 的 importtime 紀錄（可能已被其他模組預先載入）")
+    top_level.sort(key=lambda x: x[1], reverse=True)
+    return total, top_level
+
+
+def check_budgets(modules=None, repeat=3, top=5):
+    """逐一量測（取 repeat 次中最小值以降低雜訊），回傳 [(module, ms, budget_ms, ok, heaviest)]"""
+    modules = modules or list(IMPORT_BUDGETS_MS)
+    results = []
+    for module in modules:
+        budget = IMPORT_BUDGETS_MS.get(module)
+        best = None
+        heaviest = []
+        try:
+            for _ in range(max(1, repeat)):
+                total, deps = measure_import(module)
+                if best is None or total < best:
+                    best, heaviest = total, deps[:top]
+        except RuntimeError as e:
+            print(f"⚠️ {e}")
+            results.append((module, None, budget, False, []))
+            continue
+        ms = best / 1000
+        ok = budget is None or ms <= budget
+        results.append((module, ms, budget, ok, [(n, us / 1000) for n, us in heaviest]))
+    return results
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="檢查各入口模組的 import 時間是否超出預算")
+    parser.add_argument("modules", nargs="*", help="要檢查的模組（預設全部）")
+    parser.add_argument("--repeat", type=int, default=3, help="每個模組量測次數（取最小值）")
+    parser.add_argument("--top", type=int, default=5, help="列出最耗時的前 N 個直接相依模組")
+    args = parser.parse_args()
+
+    results = check_budgets(args.modules, repeat=args.repeat, top=args.top)
+    print(f"{'入口模組':<28}{'import(ms)':>11}{'預算(ms)':>10}  狀態")
+    print("-" * 60)
+    for module, ms, budget, ok, heaviest in results:
+        ms_text = "-" if ms is None else f"{ms:.1f}"
+        budget_text = "-" if budget is None else str(budget)
+        print(f"{module:<28}{ms_text:>11}{budget_text:>10}  {'✅' if ok else '❌ 超出預算'}")
+        if not ok:
+            for name, dep_ms in heaviest:
+                print(f"    └─ {name:<32}{dep_ms:>9.1f} ms")
+    print("-" * 60)
+    failed = [r[0] for r in results if not r[3]]
+    if failed:
+        print(f"❌ 超出預算：{', '.join(failed)}")
+        return 1
+    print("✅ 全部入口都在預算內")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,258 @@
+"""
+技術指標的 numpy 核心（單次計算、共用中間結果、寫入同一個預先配置的輸出矩陣）
+
+add_features.compute_features 以 pandas 逐欄計算：先建 typical_price / vwap_numerator / Datetime
+等暫存欄位再刪掉、MA_20 與 BBM 各算一次 20 期平均、為了 ATR 的 true range 另外 concat 三欄，
+EMA 也對同一條序列呼叫好幾次 ewm。這裡改成直接在 numpy 陣列上計算：
+- rolling 以 window 次錯位的連續陣列相加計算（O(n·window) 但全是向量運算，不用 cumsum 相減）；
+  close 的 20 期平均只算一次，同時給 MA_20、BBM 與標準差使用
+- EWM（adjust=True）以分塊的加權 cumsum 計算：分母有封閉解，分子每塊只需接上一塊的尾端
+- true range、typical price、VWAP 分子分母都是一次性的陣列運算，不建立任何暫存欄位
+- 全部特徵寫入 (rows, len(FEATURE_COLUMNS)) 的輸出矩陣，最後才包成 DataFrame
+
+運算順序不同，數值與 pandas 的結果只差最後幾個位元（多數欄位在 1e-15 以內）；布林帶例外：
+pandas 的 rolling std 是線上更新，長序列會累積約 1e-9 的相對誤差，這裡每個視窗重新累加離差平方，
+反而更接近精確值。為了讓既有輸出保持逐位元相同，pipeline 預設仍使用 compute_features，
+設定 feature_kernel="numpy"（或 --feature-kernel numpy）時改用這裡。
+
+效能比較
+    python indicator_kernels.py                       # 1e3 ~ 1e7 根
+    python indicator_kernels.py --sizes 1000 100000 --pandas-max 100000
+"""
+import numpy as np
+
+from feature_engine import FEATURE_COLUMNS
+
+CHUNK_ROWS = 1 << 14          # rolling 錯位相加的分段長度（每段 128KB，留在 L2 快取內）
+EWM_BLOCK_GROWTH = 500.0      # EWM 分塊內權重最多放大 e**500 倍（float64 上限約 e**709，價格量級另留餘裕）
+
+_COL = {name: j for j, name in enumerate(FEATURE_COLUMNS)}
+
+
+def _rolling_sum(x, window, out):
+    """
+    out[i] = x[i-window+1] + ... + x[i]（前 window-1 根為 NaN）。
+    以 window 次錯位的連續陣列相加完成：每根依時間順序累加，不像 cumsum 相減會隨長度累積誤差。
+    依 CHUNK_ROWS 分段，累加中的那一段留在快取裡，長序列不會每次錯位都重新走過整條記憶體。
+    """
+    n = len(x)
+    out[:min(window - 1, n)] = np.nan
+    m = n - window + 1
+    for lo in range(0, max(m, 0), CHUNK_ROWS):
+        hi = min(lo + CHUNK_ROWS, m)
+        acc = out[window - 1 + lo:window - 1 + hi]
+        np.copyto(acc, x[lo:hi])
+        for k in range(1, window):
+            acc += x[lo + k:hi + k]
+    return out
+
+
+def _rolling_mean_std(x, window, mean_out, std_out):
+    """20 期平均與標準差（ddof=1）共用同一次平均：先求平均，再以同樣的錯位方式累加離差平方"""
+    _rolling_sum(x, window, mean_out)
+    mean_out /= window
+    n = len(x)
+    std_out[:min(window - 1, n)] = np.nan
+    m = n - window + 1
+    dev = np.empty(min(max(m, 0), CHUNK_ROWS))
+    for lo in range(0, max(m, 0), CHUNK_ROWS):
+        hi = min(lo + CHUNK_ROWS, m)
+        mean = mean_out[window - 1 + lo:window - 1 + hi]
+        acc = std_out[window - 1 + lo:window - 1 + hi]
+        d = dev[:hi - lo]
+        acc[:] = 0.0
+        for k in range(window):
+            np.subtract(x[lo + k:hi + k], mean, out=d)
+            d *= d
+            acc += d
+        acc /= window - 1
+        np.sqrt(acc, out=acc)
+
+
+def _ewm_mean(x, span, out):
+    """
+    pandas ewm(span).mean()（adjust=True，輸入不含 NaN）：
+    y_t = Σ β^(t-k) x_k / Σ β^(t-k)，分母 = (1 - β^(t+1)) / (1 - β)。
+    分子以分塊的 cumsum(x_k β^-k) 計算，每塊長度讓 β^-k 不超過 e**EWM_BLOCK_GROWTH。
+    """
+    n = len(x)
+    if n == 0:
+        return out
+    com = (span - 1) / 2.0
+    beta = 1.0 - 1.0 / (1.0 + com)
+    block = max(1, int(EWM_BLOCK_GROWTH / -np.log(beta)))
+    k = np.arange(block, dtype=np.float64)
+    grow = beta ** -k            # β^-k
+    decay = beta ** (k + 1)      # 上一塊分子帶到這一塊第 k 根的衰減
+    carry = 0.0
+    for lo in range(0, n, block):
+        seg = x[lo:lo + block]
+        m = len(seg)
+        num = np.cumsum(seg * grow[:m]) * (1.0 / grow[:m]) + carry * decay[:m]
+        out[lo:lo + m] = num
+        carry = num[-1]
+    # β^t 在 t 夠大之後已小於 float64 精度，分母成為常數；只對前段計算次方（避免對整條序列做 underflow 的 pow）
+    head = min(n, int(40.0 / -np.log(beta)) + 1)
+    t = np.arange(1, head + 1, dtype=np.float64)
+    out[:head] /= (1.0 - beta ** t) / (1.0 - beta)
+    out[head:] *= 1.0 - beta
+    return out
+
+
+def _shifted(x):
+    """x 往後移一根（第一根為 NaN），等同 Series.shift()"""
+    prev = np.empty_like(x)
+    prev[:1] = np.nan
+    prev[1:] = x[:-1]
+    return prev
+
+
+def feature_matrix(open_, high, low, close, volume, open_time_ms, out=None):
+    """
+    以 numpy 陣列計算 compute_features 的全部特徵，回傳 (rows, len(FEATURE_COLUMNS)) 的 float64 矩陣
+    （欄位順序同 FEATURE_COLUMNS；Hour / Weekday 也以浮點數存放）。
+    out 可傳入預先配置的矩陣重複使用，建議用 order='F'，否則每欄寫入都是跨列的 strided 存取。
+    """
+    n = len(close)
+    if out is None:
+        # 欄優先（Fortran order）：每個特徵欄都是連續記憶體，逐欄寫入不會跨列跳躍
+        out = np.empty((n, len(FEATURE_COLUMNS)), dtype=np.float64, order='F')
+    col = lambda name: out[:, _COL[name]]  # noqa: E731
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # 20 期平均與標準差（MA_20 與 BBM 共用同一次計算）
+        mid, std = col('BBM_20_2.0'), col('BBU_20_2.0')
+        _rolling_mean_std(close, 20, mid, std)
+        col('MA_20')[:] = mid
+        np.multiply(std, 2, out=std)
+        np.subtract(mid, std, out=col('BBL_20_2.0'))
+        np.add(mid, std, out=col('BBU_20_2.0'))
+        lower, upper = col('BBL_20_2.0'), col('BBU_20_2.0')
+        np.divide(close - lower, upper - lower, out=col('BBB_20_2.0'))
+        col('BBP_20_2.0')[:] = col('BBB_20_2.0')
+
+        # EMA 與 MACD
+        _ewm_mean(close, 20, col('EMA_20'))
+        macd = col('MACD_12_26_9')
+        _ewm_mean(close, 12, macd)
+        macd -= _ewm_mean(close, 26, np.empty(n))
+        signal = _ewm_mean(macd, 9, col('MACDs_12_26_9'))
+        np.subtract(macd, signal, out=col('MACDh_12_26_9'))
+
+        # RSI：漲跌幅的 14 期平均（第一根 delta 為 NaN → 0）
+        prev_close = _shifted(close)
+        delta = close - prev_close
+        gain = _rolling_sum(np.where(delta > 0, delta, 0.0), 14, np.empty(n))
+        loss = _rolling_sum(np.where(delta < 0, -delta, 0.0), 14, np.empty(n))
+        np.subtract(100, 100 / (1 + gain / loss), out=col('RSI_14'))
+
+        # ATR：true range 直接以 fmax 合併（第一根只有 high - low）
+        high_low = np.subtract(high, low, out=col('High_Low'))
+        tr = np.fmax(high_low, np.abs(high - prev_close))
+        np.fmax(tr, np.abs(low - prev_close), out=tr)
+        _rolling_sum(tr, 14, col('ATR_14'))
+        col('ATR_14')[:] /= 14
+
+        # 價格變化
+        np.subtract(close / prev_close, 1, out=col('Return'))
+        np.subtract(close, open_, out=col('Open_Close'))
+        np.subtract(high, np.fmax(close, open_), out=col('UpperShadow'))
+        np.subtract(np.fmin(close, open_), low, out=col('LowerShadow'))
+
+        # 時間（UTC 毫秒 → 小時 / 星期；1970-01-01 為星期四）
+        days = open_time_ms // 86_400_000
+        col('Hour')[:] = (open_time_ms // 3_600_000) % 24
+        col('Weekday')[:] = (days + 3) % 7
+
+        # 成交量
+        vol_ma = col('Volume_MA20')
+        _rolling_sum(volume, 20, vol_ma)
+        vol_ma /= 20
+        np.subtract(volume / _shifted(volume), 1, out=col('Volume_Change'))
+
+        # VWAP：typical price × volume 只算一次，累積與 20 期視窗共用
+        pv = (high + low + close) / 3
+        pv *= volume
+        np.divide(np.cumsum(pv), np.cumsum(volume), out=col('VWAP'))
+        vwap20 = col('VWAP_20')
+        _rolling_sum(pv, 20, vwap20)
+        vwap20 /= _rolling_sum(volume, 20, np.empty(n))
+    return out
+
+
+def compute_features_fast(df):
+    """與 add_features.compute_features 相同的輸入 / 輸出格式（不修改傳入的 df）"""
+    import pandas as pd
+    arrays = {name: df[name].to_numpy(dtype=np.float64) for name in ('open', 'high', 'low', 'close', 'volume')}
+    dates = pd.DatetimeIndex(pd.to_datetime(df['Date']))
+    open_time_ms = dates.as_unit('ms').asi8
+    matrix = feature_matrix(arrays['open'], arrays['high'], arrays['low'], arrays['close'], arrays['volume'],
+                            open_time_ms)
+    # 輸出矩陣直接成為特徵欄的 block（欄優先的矩陣轉置後正好是 pandas 的 block 佈局，不再複製）
+    features = pd.DataFrame(matrix, columns=FEATURE_COLUMNS, index=df.index, copy=False)
+    features = features.astype({'Hour': np.int64, 'Weekday': np.int64})
+    return pd.concat([df, features], axis=1)
+
+
+def _synthetic_arrays(rows, seed=0):
+    """隨機漫步的 1 分鐘 K 線（直接產生陣列；1e7 根時不經過 list of list）"""
+    rng = np.random.default_rng(seed)
+    close = 30000.0 * np.exp(np.cumsum(rng.normal(0.0, 1e-3, rows)))
+    open_ = np.r_[close[:1], close[:-1]]
+    spread = np.abs(rng.normal(0.0, 5e-4, rows)) * close
+    high = np.fmax(open_, close) + spread
+    low = np.fmin(open_, close) - spread
+    volume = rng.gamma(2.0, 5.0, rows)
+    open_time_ms = 1_600_000_000_000 + 60_000 * np.arange(rows, dtype=np.int64)
+    return open_, high, low, close, volume, open_time_ms
+
+
+def _synthetic_frame(arrays):
+    import pandas as pd
+    open_, high, low, close, volume, open_time_ms = arrays
+    return pd.DataFrame({
+        'Date': pd.to_datetime(open_time_ms, unit='ms', utc=True),
+        'open': open_, 'high': high, 'low': low, 'close': close, 'volume': volume,
+    })
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="numpy 指標核心 vs compute_features 的速度與誤差")
+    parser.add_argument("--sizes", type=int, nargs="*", default=[10 ** k for k in range(3, 8)])
+    parser.add_argument("--pandas-max", type=int, default=1_000_000,
+                        help="超過這個根數只量 numpy 核心（1e7 根的 pandas 版本需 4GB 以上記憶體）")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    from add_features import compute_features
+
+    def best_of(fn):
+        timings = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            result = fn()
+            timings.append(time.perf_counter() - started)
+        return min(timings), result
+
+    # 誤差以各欄位的量級為尺度（|差| / 該欄最大絕對值），避免 MACD 等接近 0 的值放大相對誤差
+    print(f"{'根數':>12} {'pandas':>10} {'numpy':>10} {'核心':>10} {'加速':>7} {'最大誤差':>10}")
+    for rows in args.sizes:
+        arrays = _synthetic_arrays(rows)
+        matrix = np.empty((rows, len(FEATURE_COLUMNS)), order='F')
+        core_s, _ = best_of(lambda: feature_matrix(*arrays, out=matrix))
+        if rows > args.pandas_max:
+            print(f"{rows:>12,} {'略過':>10} {'-':>10} {core_s:>9.3f}s {'-':>7} {'-':>10}")
+            continue
+        df = _synthetic_frame(arrays)
+        fast_s, fast = best_of(lambda: compute_features_fast(df))
+        slow_s, ref = best_of(lambda: compute_features(df))
+        a = ref[FEATURE_COLUMNS].to_numpy(dtype=np.float64)
+        b = fast[FEATURE_COLUMNS].to_numpy(dtype=np.float64)
+        scale = np.nanmax(np.where(np.isfinite(a), np.abs(a), np.nan), axis=0)
+        diff = np.where(np.isfinite(a) & np.isfinite(b), np.abs(a - b), 0.0) / np.maximum(scale, 1e-300)
+        same_nan = (np.isnan(a) == np.isnan(b)).all()
+        err = f"{diff.max():.1e}" + ("" if same_nan else "（NaN 位置不同）")
+        print(f"{rows:>12,} {slow_s:>9.3f}s {fast_s:>9.3f}s {core_s:>9.3f}s {slow_s / fast_s:>6.1f}x {err:>10}")
+        del df, fast, ref
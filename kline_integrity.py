@@ -0,0 +1,187 @@
+"""
+本地 K 線歷史的完整性檢查與修補
+
+- scan_open_times：對 open_time 陣列做一次 np.diff，同時找出缺漏（gap）、重複、時間倒退、
+  以及間距不是 interval 整數倍的 K 線；百萬根 1m K 線約數十毫秒
+- repair_store：先把重複 / 亂序的資料排序去重，再只針對缺漏區間向 Binance 補抓；
+  相鄰的小缺口會合併成同一頁請求，分頁以 backfill 的 thread pool 並行抓取
+- 交易所停機造成的缺口（Binance 本身就沒有資料）補不回來，會在報告中列為無法修補
+
+使用方式
+    python kline_integrity.py --symbol BTCUSDT --interval 1m            # 只檢查
+    python kline_integrity.py --symbol BTCUSDT --interval 1m --repair --workers 8
+"""
+import time
+
+import numpy as np
+
+from fetch_data import INTERVAL_MS
+
+MAX_LISTED_RANGES = 10   # 報告中最多列出幾段缺漏區間
+
+
+def _month_open_ms(months):
+    """自 1970-01 起第幾個月 → 該月第一天 00:00 UTC 的毫秒時間"""
+    return np.asarray(months, dtype="int64").astype("datetime64[M]").astype("datetime64[ms]").astype("int64")
+
+
+def scan_open_times(open_times, interval):
+    """
+    一次掃描 open_time（毫秒整數陣列），回傳 dict：
+    - rows / first_open / last_open
+    - duplicates：與前一根相同的筆數；non_monotonic：比前一根早的筆數；misaligned：間距不是 interval 整數倍的筆數
+    - gaps：缺漏段數；missing_bars：缺少的 K 線根數
+    - missing_ranges：[(第一根缺漏的 open_time, 最後一根缺漏的 open_time), ...]
+    - ok：完全沒有問題時為 True
+    月線（1M）的長度依日曆月份而定，改以「第幾個月」計算間距，開盤時間須落在每月 1 日 00:00 UTC。
+    """
+    t = np.asarray(open_times, dtype="int64")
+    report = {"rows": int(len(t)), "first_open": int(t[0]) if len(t) else None,
+              "last_open": int(t[-1]) if len(t) else None,
+              "duplicates": 0, "non_monotonic": 0, "misaligned": 0,
+              "gaps": 0, "missing_bars": 0, "missing_ranges": [], "ok": True}
+    if len(t) < 2:
+        return report
+
+    d = np.diff(t)
+    report["duplicates"] = int(np.count_nonzero(d == 0))
+    report["non_monotonic"] = int(np.count_nonzero(d < 0))
+    if report["non_monotonic"]:
+        # 時間倒退時缺漏要在排序去重後的序列上計算
+        t = np.unique(t)
+        d = np.diff(t)
+        report["first_open"], report["last_open"] = int(t[0]), int(t[-1])
+
+    if interval == "1M":
+        months = t.astype("datetime64[ms]").astype("datetime64[M]").astype("int64")
+        report["misaligned"] = int(np.count_nonzero(_month_open_ms(months) != t))
+        dm = np.diff(months)
+        gap_idx = np.flatnonzero(dm > 1)
+        starts = _month_open_ms(months[gap_idx] + 1)
+        ends = _month_open_ms(months[gap_idx + 1] - 1)
+        counts = dm[gap_idx] - 1
+    else:
+        step = INTERVAL_MS[interval]
+        report["misaligned"] = int(np.count_nonzero(d % step))
+        gap_idx = np.flatnonzero(d > step)
+        starts = t[gap_idx] + step
+        ends = t[gap_idx + 1] - step
+        counts = (ends - starts) // step + 1
+
+    # 未對齊的間距若放不下一整根 K 線，只算 misaligned，不算缺漏
+    keep = counts > 0
+    if keep.any():
+        report["gaps"] = int(np.count_nonzero(keep))
+        report["missing_bars"] = int(counts[keep].sum())
+        report["missing_ranges"] = list(zip(starts[keep].tolist(), ends[keep].tolist()))
+    report["ok"] = not (report["duplicates"] or report["non_monotonic"]
+                        or report["misaligned"] or report["gaps"])
+    return report
+
+
+def format_report(report):
+    """一行摘要"""
+    if report["ok"]:
+        return f"{report['rows']:,} 根，連續無缺漏"
+    parts = [f"{report['rows']:,} 根"]
+    if report["gaps"]:
+        parts.append(f"缺漏 {report['gaps']:,} 段共 {report['missing_bars']:,} 根")
+    if report["duplicates"]:
+        parts.append(f"重複 {report['duplicates']:,} 根")
+    if report["non_monotonic"]:
+        parts.append(f"時間倒退 {report['non_monotonic']:,} 處")
+    if report["misaligned"]:
+        parts.append(f"間距未對齊 {report['misaligned']:,} 處")
+    return "，".join(parts)
+
+
+def _fmt_ms(ms):
+    from datetime import datetime, timezone
+    return datetime.fromtimestamp(ms / 1000, tz=timezone.utc).strftime('%Y-%m-%d %H:%M')
+
+
+def print_report(report, title=""):
+    print(f"{'🩺 ' + title + '：' if title else ''}{format_report(report)}")
+    for s, e in report["missing_ranges"][:MAX_LISTED_RANGES]:
+        print(f"   - {_fmt_ms(s)} ~ {_fmt_ms(e)} UTC")
+    if len(report["missing_ranges"]) > MAX_LISTED_RANGES:
+        print(f"   ...（其餘 {len(report['missing_ranges']) - MAX_LISTED_RANGES:,} 段略）")
+
+
+def scan_store(store, symbol, interval):
+    """掃描本地資料庫（只讀 open_time 欄位）"""
+    return scan_open_times(store.open_times(symbol, interval), interval)
+
+
+def coalesce_ranges(ranges, step, page_bars):
+    """
+    把缺漏區間合併成請求分頁：相鄰的小缺口若能放進同一頁（page_bars 根）就合併，
+    超過一頁的長缺口再切成多頁。回傳 [(startTime, endTime), ...]。
+    step 為 None 表示月線（K 線長度不固定）。
+    """
+    from backfill import page_ranges
+    if step is None:
+        # 月線：每段缺漏直接當一頁（一頁 1000 個月綽綽有餘），不能用固定 step 對齊
+        return [(int(s), int(e)) for s, e in ranges]
+    pages = []
+    span = page_bars * step
+    for s, e in ranges:
+        if pages and e - pages[-1][0] < span:
+            pages[-1] = (pages[-1][0], e)
+        else:
+            pages.extend(page_ranges(s, e, step, page_bars))
+    return pages
+
+
+def repair_store(store, symbol, interval, max_workers=8, limiter=None):
+    """
+    修補本地資料庫：排序去重 → 只補抓缺漏區間 → 重新掃描。
+    回傳修補後的掃描報告（另含 removed / added 筆數）。
+    """
+    from backfill import PAGE_BARS, fetch_pages
+    step = None if interval == "1M" else INTERVAL_MS[interval]
+    report = scan_store(store, symbol, interval)
+    removed = added = 0
+    if report["duplicates"] or report["non_monotonic"]:
+        removed = store.normalize(symbol, interval)
+        print(f"🧹 已排序去重：移除 {removed:,} 根重複 K 線")
+        report = scan_store(store, symbol, interval)
+
+    if report["missing_ranges"]:
+        pages = coalesce_ranges(report["missing_ranges"], step, PAGE_BARS)
+        print(f"🩹 補抓 {report['gaps']:,} 段缺漏（{report['missing_bars']:,} 根）：{len(pages)} 個請求，{max_workers} 條執行緒")
+        started = time.perf_counter()
+        df = fetch_pages(symbol, interval, pages, max_workers=max_workers, limiter=limiter)
+        if len(df):
+            # 只保留真正缺少的 K 線（合併分頁時會順便抓到已有的）
+            have = store.open_times(symbol, interval)
+            df = df[~np.isin(df["open_time"].to_numpy(), have)]
+            added = store.append(symbol, interval, df)
+        print(f"✅ 補回 {added:,} 根，耗時 {time.perf_counter() - started:.1f}s")
+        report = scan_store(store, symbol, interval)
+        if report["gaps"]:
+            print(f"⚠️ 仍有 {report['missing_bars']:,} 根無法補回（交易所在該時段沒有資料）")
+
+    report["removed"], report["added"] = removed, added
+    return report
+
+
+if __name__ == "__main__":
+    import argparse
+    from kline_store import KlineStore
+
+    parser = argparse.ArgumentParser(description="檢查 / 修補本地 K 線資料庫的缺漏與重複")
+    parser.add_argument("--symbol", default="BTCUSDT")
+    parser.add_argument("--interval", default="4h")
+    parser.add_argument("--store-dir", default="data/store")
+    parser.add_argument("--repair", action="store_true", help="排序去重並補抓缺漏區間")
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    store = KlineStore(args.store_dir)
+    started = time.perf_counter()
+    result = scan_store(store, args.symbol, args.interval)
+    print_report(result, f"{args.symbol} {args.interval}（掃描 {time.perf_counter() - started:.3f}s）")
+    if args.repair and not result["ok"]:
+        result = repair_store(store, args.symbol, args.interval, max_workers=args.workers)
+        print_report(result, "修補後")
@@ -0,0 +1,207 @@
+"""
+由 1m K 線在本地聚合出任意 interval（向量化，另有增量版本）
+
+INTERVAL_MS 列了 16 種 interval，原本每一種都要各自向 Binance 抓、各自存一份。
+這裡只保存一份 1m 資料，其餘 interval 都在本地由它聚合：
+- 開盤時間對齊與 Binance 相同：固定週期以 epoch 為基準、1w 從週一 00:00 UTC 起算、1M 依日曆月份
+- open 取第一根、close 取最後一根、high / low 取極值；volume、quote volume、成交筆數、
+  taker 買入量都是加總；close_time = 下一根開盤 - 1 毫秒
+- 以 np.*.reduceat 一次聚合所有區間，不經過 groupby
+- 預設只回傳完整的 K 線：區間內每一根 1m 都要在（缺任何一分鐘都不算完整，不會聚合出少算量的 K 線）
+
+量與金額是 1m 數值的浮點加總，與 Binance 直接給的較大週期數值可能差在最後幾個位元。
+這是供離線分析與 CLI 使用的函式庫：fetch_klines / sync_kline_store 仍各自向 Binance 抓每個 interval。
+
+    python kline_resampler.py --check                                  # 合成 1 年 1m 資料：速度與增量一致性
+    python kline_resampler.py --store-dir data/store --symbol BTCUSDT --interval 4h   # 從本地 1m 聚合
+"""
+import numpy as np
+
+from fetch_data import BAR_ALIGN_OFFSET_MS, INTERVAL_MS
+from kline_parser import KLINE_FIELDS, concat, num_rows, take, to_frame
+
+# 加總的欄位（其餘：open 取第一根、close 取最後一根、high / low 取極值）
+SUM_FIELDS = ('volume', 'quote_asset_volume', 'num_trades',
+              'taker_buy_base_asset_volume', 'taker_buy_quote_asset_volume')
+
+
+def bucket_open_ms(open_ms, interval):
+    """每根 K 線所屬 interval K 線的開盤時間（毫秒 int64 陣列）"""
+    open_ms = np.asarray(open_ms, dtype=np.int64)
+    if interval == "1M":
+        months = open_ms.astype('datetime64[ms]').astype('datetime64[M]')
+        return months.astype('datetime64[ms]').astype(np.int64)
+    if interval not in INTERVAL_MS:
+        raise ValueError(f"不支援的 interval: {interval}")
+    step = INTERVAL_MS[interval]
+    align = BAR_ALIGN_OFFSET_MS.get(interval, 0)
+    return (open_ms - align) // step * step + align
+
+
+def next_bucket_open_ms(bucket_open, interval):
+    """bucket_open 的下一根開盤時間（月線依日曆月份）"""
+    bucket_open = np.asarray(bucket_open, dtype=np.int64)
+    if interval == "1M":
+        months = bucket_open.astype('datetime64[ms]').astype('datetime64[M]') + 1
+        return months.astype('datetime64[ms]').astype(np.int64)
+    return bucket_open + INTERVAL_MS[interval]
+
+
+def bucket_bounds(open_ms, interval, base_interval="1m"):
+    """
+    依 interval 切分已排序的 open_ms，回傳 (starts, ends, bucket_open, complete)：
+    starts / ends 為每個區間第一根 / 最後一根的索引；complete 表示該區間的 base K 線一根不缺
+    （open_ms 需已排序去重：根數等於區間長度、頭尾都在邊界上）。
+    """
+    open_ms = np.asarray(open_ms, dtype=np.int64)
+    base_step = INTERVAL_MS[base_interval]
+    if interval != "1M" and (INTERVAL_MS[interval] < base_step or INTERVAL_MS[interval] % base_step):
+        raise ValueError(f"{interval} 不是 {base_interval} 的整數倍，無法聚合")
+    if not len(open_ms):
+        empty = np.empty(0, dtype=np.intp)
+        return empty, empty, np.empty(0, dtype=np.int64), np.empty(0, dtype=bool)
+    bucket = bucket_open_ms(open_ms, interval)
+    starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+    ends = np.r_[starts[1:], len(bucket)] - 1
+    bucket_open = bucket[starts]
+    next_open = next_bucket_open_ms(bucket_open, interval)
+    complete = (ends - starts + 1 == (next_open - bucket_open) // base_step) & \
+               (open_ms[starts] == bucket_open) & (open_ms[ends] + base_step == next_open)
+    return starts, ends, bucket_open, complete
+
+
+def resample_arrays(arrays, interval, base_interval="1m", complete_only=True):
+    """
+    {欄位: 陣列}（kline_parser 格式、依 open_time 排序）→ interval 的 {欄位: 陣列}。
+    complete_only=False 時也回傳不完整的區間（例如尚未收盤的最後一根）。
+    """
+    starts, ends, bucket_open, complete = bucket_bounds(arrays['open_time'], interval, base_interval)
+    if complete_only:
+        keep = complete
+    else:
+        keep = np.ones(len(starts), dtype=bool)
+    out = {}
+    for name in KLINE_FIELDS:
+        col = arrays[name]
+        if name == 'open_time':
+            values = bucket_open
+        elif name == 'close_time':
+            values = next_bucket_open_ms(bucket_open, interval) - 1
+        elif not len(starts):
+            values = col[:0].astype(np.int64) if name == 'num_trades' else col[:0]
+        elif name == 'open':
+            values = col[starts]
+        elif name == 'close':
+            values = col[ends]
+        elif name == 'high':
+            values = np.maximum.reduceat(col, starts)
+        elif name == 'low':
+            values = np.minimum.reduceat(col, starts)
+        else:
+            # 成交筆數以 int64 加總（月線可能超過 int32）
+            values = np.add.reduceat(col.astype(np.int64) if name == 'num_trades' else col, starts)
+        out[name] = values[keep]
+    return out
+
+
+def resample(df, interval, base_interval="1m", complete_only=True):
+    """本地資料庫格式（open_time 毫秒）的 DataFrame → interval 的同格式 DataFrame"""
+    arrays = {name: df[name].to_numpy() for name in KLINE_FIELDS}
+    return to_frame(resample_arrays(arrays, interval, base_interval, complete_only))
+
+
+def load_interval(store, symbol, interval, start_ms=None, end_ms=None, base_interval="1m"):
+    """
+    從本地資料庫的 base_interval 資料聚合出 interval K 線（只讀需要的時間範圍）。
+    start_ms 會往前對齊到該區間開盤，讓第一根是完整的；只回傳完整的 K 線。
+    """
+    if start_ms is not None:
+        start_ms = int(bucket_open_ms([start_ms], interval)[0])
+    if end_ms is not None:
+        end_ms = int(next_bucket_open_ms(bucket_open_ms([end_ms], interval), interval)[0]) - 1
+    base = store.range(symbol, base_interval, start_ms, end_ms)
+    return resample(base, interval, base_interval)
+
+
+class IncrementalResampler:
+    """
+    逐批餵入新的 base_interval K 線，回傳新完成的 interval K 線。
+    只保留目前這一根尚未完成區間內的 base K 線（1d 最多 1440 根 1m），每批仍以向量化方式聚合。
+    """
+
+    def __init__(self, interval, base_interval="1m"):
+        bucket_bounds(np.empty(0, dtype=np.int64), interval, base_interval)  # 提早檢查 interval
+        self.interval = interval
+        self.base_interval = base_interval
+        self._pending = None
+
+    def update(self, arrays):
+        """arrays：新收盤的 base K 線（{欄位: 陣列}，時間需晚於先前餵入的）；回傳完成的 K 線 {欄位: 陣列}"""
+        if self._pending is not None:
+            pending_last = self._pending['open_time'][-1]
+            if num_rows(arrays) and arrays['open_time'][0] <= pending_last:
+                arrays = take(arrays, arrays['open_time'] > pending_last)
+            arrays = concat([self._pending, arrays])
+        if not num_rows(arrays):
+            self._pending = None
+            return resample_arrays(arrays, self.interval, self.base_interval)
+
+        starts, ends, _, complete = bucket_bounds(arrays['open_time'], self.interval, self.base_interval)
+        if complete[-1]:
+            done_rows, self._pending = num_rows(arrays), None
+        else:
+            done_rows = starts[-1]
+            self._pending = take(arrays, slice(done_rows, None))
+        return resample_arrays(take(arrays, slice(0, done_rows)), self.interval, self.base_interval)
+
+    def partial(self):
+        """目前尚未完成的那一根（{欄位: 陣列}，0 或 1 根）"""
+        if self._pending is None:
+            return resample_arrays(concat([]), self.interval, self.base_interval, complete_only=False)
+        return resample_arrays(self._pending, self.interval, self.base_interval, complete_only=False)
+
+
+def _synthetic_minutes(days):
+    from binance_replay_server import SyntheticKlines
+    from kline_parser import parse_klines
+    return parse_klines(SyntheticKlines().rows("BTCUSDT", "1m", 0, days * 1440))
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="由 1m K 線在本地聚合任意 interval")
+    parser.add_argument("--store-dir", default=None, help="本地資料庫位置；不指定時使用合成資料")
+    parser.add_argument("--symbol", default="BTCUSDT")
+    parser.add_argument("--interval", nargs="*", default=["5m", "15m", "1h", "4h", "1d", "1w", "1M"])
+    parser.add_argument("--base", default="1m")
+    parser.add_argument("--days", type=int, default=365, help="合成資料的天數")
+    parser.add_argument("--check", action="store_true", help="以隨機批次餵入增量版本，確認與一次聚合相同")
+    args = parser.parse_args()
+
+    if args.store_dir:
+        from kline_store import KlineStore
+        store = KlineStore(args.store_dir)
+        for interval in args.interval:
+            started = time.perf_counter()
+            df = load_interval(store, args.symbol, interval, base_interval=args.base)
+            print(f"📊 {args.symbol} {interval:>4}：{len(df):>7,} 根（{(time.perf_counter() - started) * 1000:.1f}ms）")
+        raise SystemExit(0)
+
+    minutes = _synthetic_minutes(args.days)
+    print(f"🧪 合成 {num_rows(minutes):,} 根 1m K 線")
+    for interval in args.interval:
+        started = time.perf_counter()
+        bars = resample_arrays(minutes, interval)
+        elapsed = time.perf_counter() - started
+        line = f"   {interval:>4}：{num_rows(bars):>7,} 根（{elapsed * 1000:.1f}ms）"
+        if args.check:
+            rng = np.random.default_rng(0)
+            resampler = IncrementalResampler(interval)
+            cuts = np.unique(np.r_[0, rng.integers(0, num_rows(minutes), 200), num_rows(minutes)])
+            parts = [resampler.update(take(minutes, slice(lo, hi))) for lo, hi in zip(cuts[:-1], cuts[1:])]
+            merged = concat(parts)
+            same = all(np.array_equal(merged[name], bars[name]) for name in KLINE_FIELDS)
+            line += "，增量結果" + ("相同 ✅" if same else "不同 ❌")
+        print(line)
@@ -0,0 +1,148 @@
+"""
+本地 K 線資料庫（每個 symbol / interval 一份）
+
+- 只保存「已收盤」的 K 線，時間欄位以 UTC 毫秒整數保存（open_time / close_time）
+- 記錄最後一根的 close_time，下次只向 Binance 要缺少的 K 線並追加
+- 任意 (offset_bars, window_size) 視窗或時間區間都從本地資料切出，不必重新下載
+
+檔案：{root}/{SYMBOL}_{interval}.cols/（欄式資料表，見 columnar_store.py）
+以 open_time 建立時間索引，切視窗時只讀需要的 segment。
+舊版的 {SYMBOL}_{interval}.csv 會在第一次存取時自動轉換。
+"""
+import os
+
+from columnar_store import append_table, read_table, table_meta, write_table
+
+# 本地保存的欄位（Binance 原始欄位去掉 ignore）
+STORE_COLS = [
+    'open_time', 'open', 'high', 'low', 'close', 'volume',
+    'close_time', 'quote_asset_volume', 'num_trades',
+    'taker_buy_base_asset_volume', 'taker_buy_quote_asset_volume'
+]
+
+
+class KlineStore:
+    """以 (symbol, interval) 為單位的本地 K 線存放區"""
+
+    def __init__(self, root="data/store"):
+        self.root = root
+
+    def _base(self, symbol, interval):
+        return os.path.join(self.root, f"{symbol.replace('/', '_')}_{interval}")
+
+    def data_path(self, symbol, interval):
+        return self._base(symbol, interval) + ".cols"
+
+    def _legacy_csv_path(self, symbol, interval):
+        return self._base(symbol, interval) + ".csv"
+
+    def _migrate_legacy(self, symbol, interval):
+        """舊版 CSV 資料庫 → 欄式資料表（只做一次，原 CSV 保留）"""
+        path = self.data_path(symbol, interval)
+        legacy = self._legacy_csv_path(symbol, interval)
+        if table_meta(path) is not None or not os.path.exists(legacy):
+            return
+        import pandas as pd
+        df = pd.read_csv(legacy)[STORE_COLS]
+        df = df.sort_values("open_time").drop_duplicates("open_time", keep="last")
+        write_table(path, df, time_col="open_time")
+        print(f"🔄 已將舊版 CSV 資料庫轉為欄式格式：{legacy} → {path}（{len(df):,} 根）")
+
+    # === metadata ===
+    def meta(self, symbol, interval):
+        """{symbol, interval, rows, first_open_time, last_open_time, last_close_time}；尚無資料回傳 {}"""
+        self._migrate_legacy(symbol, interval)
+        path = self.data_path(symbol, interval)
+        meta = table_meta(path)
+        if not meta or not meta["rows"]:
+            return {}
+        last = read_table(path, columns=["close_time"], rows=(-1, None))
+        return {
+            "symbol": symbol,
+            "interval": interval,
+            "rows": meta["rows"],
+            "first_open_time": meta["segments"][0]["t_min"],
+            "last_open_time": meta["segments"][-1]["t_max"],
+            "last_close_time": int(last["close_time"].iloc[0]),
+        }
+
+    def last_close_time(self, symbol, interval):
+        """最後一根已保存 K 線的 close_time（毫秒）；尚無資料回傳 None"""
+        return self.meta(symbol, interval).get("last_close_time")
+
+    def count(self, symbol, interval):
+        return self.meta(symbol, interval).get("rows", 0)
+
+    # === 讀寫 ===
+    def _empty(self):
+        import pandas as pd
+        return pd.DataFrame({c: pd.Series(dtype="int64" if c in ("open_time", "close_time", "num_trades")
+                                          else "float64") for c in STORE_COLS})
+
+    def load(self, symbol, interval):
+        """讀出全部 K 線（open_time / close_time 為毫秒整數）；尚無資料回傳空 DataFrame"""
+        self._migrate_legacy(symbol, interval)
+        path = self.data_path(symbol, interval)
+        if table_meta(path) is None:
+            return self._empty()
+        return read_table(path)
+
+    def append(self, symbol, interval, df):
+        """
+        追加 K 線（需為 STORE_COLS 格式）。
+        新資料全部晚於最後一根時直接附加到表尾（只重寫最後一個 segment）；
+        否則與既有資料合併、依 open_time 去重排序後整表重寫。
+        回傳實際新增的筆數。
+        """
+        if df is None or len(df) == 0:
+            return 0
+        os.makedirs(self.root, exist_ok=True)
+        df = df[STORE_COLS].sort_values("open_time").drop_duplicates("open_time", keep="last")
+        path = self.data_path(symbol, interval)
+        last_open = self.meta(symbol, interval).get("last_open_time")
+
+        if last_open is None or int(df["open_time"].iloc[0]) > last_open:
+            append_table(path, df, time_col="open_time")
+            return len(df)
+
+        import pandas as pd
+        old = self.load(symbol, interval)
+        merged = pd.concat([old, df], ignore_index=True)
+        merged = merged.sort_values("open_time").drop_duplicates("open_time", keep="last")
+        write_table(path, merged, time_col="open_time")
+        return len(merged) - len(old)
+
+    def open_times(self, symbol, interval):
+        """全部 open_time（毫秒 int64 numpy 陣列），只讀這一個欄位，供完整性掃描使用"""
+        import numpy as np
+        self._migrate_legacy(symbol, interval)
+        path = self.data_path(symbol, interval)
+        if table_meta(path) is None:
+            return np.empty(0, dtype="int64")
+        return read_table(path, columns=["open_time"])["open_time"].to_numpy()
+
+    def normalize(self, symbol, interval):
+        """依 open_time 排序、去重後整表重寫；回傳移除的筆數"""
+        df = self.load(symbol, interval)
+        clean = df.sort_values("open_time", kind="stable").drop_duplicates("open_time", keep="last")
+        if len(clean) != len(df) or not df["open_time"].is_monotonic_increasing:
+            write_table(self.data_path(symbol, interval), clean, time_col="open_time")
+        return len(df) - len(clean)
+
+    def window(self, symbol, interval, offset_bars=0, window_size=500):
+        """
+        以最新一根為 0，往回 offset_bars 根當作結尾，取 window_size 根（毫秒時間欄位）。
+        """
+        rows = self.count(symbol, interval)
+        end = rows - offset_bars
+        if end <= 0:
+            return self._empty()
+        return read_table(self.data_path(symbol, interval), rows=(max(0, end - window_size), end))
+
+    def range(self, symbol, interval, start_ms=None, end_ms=None):
+        """open_time 落在 [start_ms, end_ms] 的 K 線（依時間索引只讀相關 segment）"""
+        self._migrate_legacy(symbol, interval)
+        path = self.data_path(symbol, interval)
+        if table_meta(path) is None:
+            return self._empty()
+        return read_table(path, start=start_ms, end=end_ms)
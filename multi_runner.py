@@ -0,0 +1,147 @@
+"""
+多交易對 / 多週期平行執行器
+
+把 fetch → features → binning → analysis → scoring → assessment 整條流程
+以 (symbol, interval) 為單位丟到 process pool，平行使用多顆 CPU。
+
+- 每個組合有自己的輸出目錄：{output_root}/{symbol}_{interval}/
+  （階段快取、評估報告、執行歷史、終端輸出 run.log 都在裡面，互不覆蓋）
+- 全部完成後合併成一份摘要：{output_root}/multi_summary.json 與 multi_summary.csv
+
+使用方式
+    python multi_runner.py --pairs BTCUSDT:4h ETHUSDT:4h SOLUSDT:1h --workers 8
+"""
+import contextlib
+import csv
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+# 資料庫表沒有 symbol 欄位，多組合同時寫入會互相覆蓋，因此預設略過 save_sql
+DEFAULT_SKIP = ("save_sql",)
+
+SUMMARY_FIELDS = [
+    "symbol", "interval", "status", "recommendation", "buy_score", "sell_score",
+    "close", "assessment_time", "elapsed_s", "output_dir", "error",
+]
+
+
+def pair_output_dir(output_root, symbol, interval):
+    """每個 (symbol, interval) 的獨立輸出目錄"""
+    return os.path.join(output_root, f"{symbol.replace('/', '_')}_{interval}")
+
+
+def parse_pair(text):
+    """'BTCUSDT:4h' → ('BTCUSDT', '4h')"""
+    symbol, sep, interval = text.partition(":")
+    if not sep or not symbol or not interval:
+        raise ValueError(f"格式應為 SYMBOL:INTERVAL，收到：{text}")
+    return symbol.upper(), interval
+
+
+def run_pair(symbol, interval, output_root="data", skip=DEFAULT_SKIP, quiet=True, **config):
+    """
+    在 worker 行程內執行單一組合的完整流程，回傳摘要 dict（失敗時 status="failed"）。
+    quiet=True 時流程輸出寫到 {output_dir}/run.log，避免多個行程的輸出交錯。
+    """
+    from pipeline import run_pipeline
+
+    output_dir = pair_output_dir(output_root, symbol, interval)
+    os.makedirs(output_dir, exist_ok=True)
+    summary = {"symbol": symbol, "interval": interval, "output_dir": output_dir}
+    started = time.perf_counter()
+
+    log = open(os.path.join(output_dir, "run.log"), "a", encoding="utf-8") if quiet else None
+    try:
+        with contextlib.redirect_stdout(log) if log else contextlib.nullcontext():
+            print(f"\n===== {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} {symbol} {interval} =====")
+            results = run_pipeline(
+                save_outputs=["assessment"], output_dir=output_dir, skip=skip,
+                history_path=os.path.join(output_dir, "run_history.jsonl"),
+                symbol=symbol, interval=interval, **config)
+        assessment = results["assessment"]
+        summary.update({
+            "status": "ok",
+            "recommendation": assessment["recommendation"],
+            "buy_score": float(assessment["trading_signals"]["buy_score"]),
+            "sell_score": float(assessment["trading_signals"]["sell_score"]),
+            "close": float(assessment["candlestick_data"]["close"]),
+            "assessment_time": assessment["assessment_time"],
+        })
+    except Exception as e:
+        summary.update({"status": "failed", "error": str(e)})
+    finally:
+        if log:
+            log.close()
+    summary["elapsed_s"] = round(time.perf_counter() - started, 3)
+    return summary
+
+
+def run_pairs(pairs, max_workers=None, output_root="data", **kwargs):
+    """
+    平行執行多個 (symbol, interval) 組合，回傳依 buy_score 排序的摘要清單，
+    並寫出 multi_summary.json / multi_summary.csv。
+    max_workers 預設為 CPU 核心數（且不超過組合數）。
+    """
+    pairs = list(pairs)
+    if not pairs:
+        return []
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    max_workers = max(1, min(max_workers, len(pairs)))
+
+    print(f"🚀 平行執行 {len(pairs)} 個組合（{max_workers} 個行程）")
+    started = time.perf_counter()
+    summaries = []
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(run_pair, s, i, output_root=output_root, **kwargs): (s, i) for s, i in pairs}
+        for fut in as_completed(futures):
+            symbol, interval = futures[fut]
+            try:
+                summary = fut.result()
+            except Exception as e:  # worker 行程本身崩潰
+                summary = {"symbol": symbol, "interval": interval, "status": "failed", "error": str(e)}
+            summaries.append(summary)
+            if summary["status"] == "ok":
+                print(f"✅ {symbol} {interval}：{summary['recommendation']}"
+                      f"（買 {summary['buy_score']:.3f} / 賣 {summary['sell_score']:.3f}，{summary['elapsed_s']:.1f}s）")
+            else:
+                print(f"❌ {symbol} {interval} 失敗：{summary.get('error')}")
+
+    summaries.sort(key=lambda r: (r["status"] != "ok", -(r.get("buy_score") or 0)))
+    write_summary(summaries, output_root)
+    ok = sum(r["status"] == "ok" for r in summaries)
+    print(f"🎯 完成 {ok}/{len(summaries)} 個組合，總耗時 {time.perf_counter() - started:.1f}s")
+    return summaries
+
+
+def write_summary(summaries, output_root="data"):
+    """合併所有組合的結果為 multi_summary.json 與 multi_summary.csv"""
+    os.makedirs(output_root, exist_ok=True)
+    json_path = os.path.join(output_root, "multi_summary.json")
+    csv_path = os.path.join(output_root, "multi_summary.csv")
+    with open(json_path, "w", encoding="utf-8") as f:
+        json.dump({"generated_at": datetime.now().strftime('%Y-%m-%d %H:%M:%S'), "pairs": summaries},
+                  f, ensure_ascii=False, indent=2)
+    with open(csv_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=SUMMARY_FIELDS, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(summaries)
+    print(f"📄 摘要已儲存：{json_path}、{csv_path}")
+    return json_path, csv_path
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="平行執行多個 (symbol, interval) 的交易流程")
+    parser.add_argument("--pairs", nargs="+", default=["BTCUSDT:4h"], help="例如 BTCUSDT:4h ETHUSDT:1h")
+    parser.add_argument("--workers", type=int, default=None, help="行程數（預設 CPU 核心數）")
+    parser.add_argument("--output-root", default="data")
+    parser.add_argument("--window-size", type=int, default=500)
+    parser.add_argument("--verbose", action="store_true", help="流程輸出直接印到終端（不寫 run.log）")
+    args = parser.parse_args()
+
+    run_pairs([parse_pair(p) for p in args.pairs], max_workers=args.workers, output_root=args.output_root,
+              quiet=not args.verbose, window_size=args.window_size)
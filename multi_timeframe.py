@@ -0,0 +1,196 @@
+"""
+多時間框架特徵：從同一條基礎 K 線序列聚合出較大的週期，計算指標後因果地對齊回目標 K 線
+
+例如目標是 4h K 線，想同時看 12h、日線的 RSI / ATR / MACD：
+1. 以基礎序列（通常就是 4h 本身）聚合出 12h / 1d K 線，不另外向 Binance 抓資料
+2. 只保留完整的高階 K 線（區間內的基礎 K 線一根不缺）；尚未收盤的那根不會參與計算
+3. 高階 K 線在收盤那一刻（open + 週期）才「可用」，每根目標 K 線只取收盤時間不晚於自己收盤時間的
+   最近一根（as-of join），因此不會有未來資料
+4. 欄位命名為 {特徵}_{週期}，例如 RSI_14_12h、ATR_14_1d
+5. 高階週期的完整 K 線數必須足以算出指標：預設 500 根 4h（約 83 天）只有約 11 根週線，
+   RSI_14 / ATR_14 需要 14 根，1w 因此全為缺值；pipeline 會先以 check_window 檢查，
+   視窗不夠時在抓資料前就拋出 ValueError（要用週線請把視窗加大到 630 根以上）
+
+    python multi_timeframe.py --input data/cleaned.csv --interval 4h --timeframes 12h 1d --check
+"""
+import numpy as np
+
+from fetch_data import INTERVAL_MS
+from kline_resampler import bucket_bounds, next_bucket_open_ms
+
+DEFAULT_TIMEFRAME_FEATURES = ('RSI_14', 'ATR_14', 'MACD_12_26_9')
+
+
+def _step_ms(interval):
+    if interval not in INTERVAL_MS:
+        raise ValueError(f"不支援的 interval: {interval}")
+    return INTERVAL_MS[interval]
+
+
+def min_higher_bars(features=DEFAULT_TIMEFRAME_FEATURES):
+    """
+    features 至少要幾根高階 K 線才會有值。直接在一段合成 K 線上計算、看第一個非缺值的位置，
+    不必另外維護每個指標的暖機長度（新登錄的特徵也適用）。
+    """
+    import pandas as pd
+    from feature_registry import compute_feature_subset
+    n = 256
+    close = 100 + np.cumsum(np.sin(np.arange(n)) + 0.1)
+    bars = pd.DataFrame({
+        'Date': pd.date_range('2020-01-01', periods=n, freq='D', tz='UTC'),
+        'open': close - 0.5, 'high': close + 1.0, 'low': close - 1.0, 'close': close,
+        'volume': np.full(n, 10.0),
+    })
+    computed = compute_feature_subset(bars, features)
+    need = 1
+    for name in features:
+        valid = np.flatnonzero(computed[name].notna().to_numpy())
+        if not len(valid):
+            raise ValueError(f"{name} 在 {n} 根 K 線內都算不出值")
+        need = max(need, int(valid[0]) + 1)
+    return need
+
+
+def base_bars_per_bar(interval, timeframe):
+    """一根 timeframe K 線最多包含幾根 interval K 線（月線以 31 天計）；timeframe 必須是 interval 的整數倍"""
+    step = _step_ms(interval)
+    span = 31 * INTERVAL_MS["1d"] if timeframe == "1M" else _step_ms(timeframe)
+    if timeframe != "1M" and (span <= step or span % step):
+        raise ValueError(f"{timeframe} 不是 {interval} 的整數倍，無法聚合")
+    return -(-span // step)
+
+
+def check_window(interval, window_size, timeframes, features=DEFAULT_TIMEFRAME_FEATURES):
+    """
+    抓資料前先檢查：window_size 根 interval K 線聚合出的每個 timeframe 都要夠算出 features。
+    視窗頭尾各可能有一根不完整的高階 K 線，因此最少需要 (需要根數 + 1) × 每根包含的基礎 K 線數。
+    不夠時拋出 ValueError，列出每個週期需要的視窗大小。
+    """
+    if not timeframes:
+        return
+    need = min_higher_bars(features)
+    short = {}
+    for tf in timeframes:
+        required = (need + 1) * base_bars_per_bar(interval, tf)
+        if window_size < required:
+            short[tf] = required
+    if short:
+        detail = "、".join(f"{tf} 至少需要 {n:,} 根" for tf, n in short.items())
+        raise ValueError(f"{window_size} 根 {interval} K 線聚合出的高階 K 線不足以計算 {', '.join(features)}"
+                         f"（每個週期需要 {need} 根完整 K 線）：{detail}；請加大 window_size 或改用較小的週期")
+
+
+def _open_ms(dates):
+    """Date 欄（datetime 或字串）→ UTC 毫秒 int64 陣列"""
+    import pandas as pd
+    return pd.DatetimeIndex(pd.to_datetime(dates, utc=True)).as_unit('ms').asi8
+
+
+def resample_ohlcv(df, base_interval, interval):
+    """
+    把 base_interval 的 K 線聚合成 interval（需為 base_interval 的整數倍，或 1M），只回傳完整的 K 線。
+    回傳 Date / open / high / low / close / volume，另加 available_ms（該根收盤、可被使用的時間，毫秒）。
+    區間切分與 kline_resampler 相同（1w 從週一起算、1M 依日曆月份）。
+    """
+    import pandas as pd
+    starts, ends, bucket_open, complete = bucket_bounds(_open_ms(df['Date']), interval, base_interval)
+
+    def column(name):
+        return df[name].to_numpy(dtype=np.float64)
+
+    def reduce(ufunc, name):
+        return ufunc.reduceat(column(name), starts)[complete] if len(starts) else np.empty(0)
+
+    bucket_open = bucket_open[complete]
+    return pd.DataFrame({
+        'Date': pd.to_datetime(bucket_open, unit='ms', utc=True),
+        'open': column('open')[starts[complete]],
+        'high': reduce(np.maximum, 'high'),
+        'low': reduce(np.minimum, 'low'),
+        'close': column('close')[ends[complete]],
+        'volume': reduce(np.add, 'volume'),
+        'available_ms': next_bucket_open_ms(bucket_open, interval),
+    })
+
+
+def timeframe_features(df, base_interval, interval, features=DEFAULT_TIMEFRAME_FEATURES):
+    """在聚合後的 interval K 線上計算 features，欄位加上 _{interval} 後綴；保留 available_ms 供對齊"""
+    from feature_registry import compute_feature_subset
+    bars = resample_ohlcv(df, base_interval, interval)
+    computed = compute_feature_subset(bars, features)
+    out = computed[list(features)].rename(columns={name: f"{name}_{interval}" for name in features})
+    out['available_ms'] = bars['available_ms']
+    return out
+
+
+def align_asof(target_close_ms, higher):
+    """
+    每根目標 K 線取 available_ms <= 目標收盤時間的最近一根高階特徵（沒有則為 NaN）。
+    target_close_ms 為目標 K 線收盤的毫秒時間（open + 週期）。
+    """
+    import pandas as pd
+    available = higher['available_ms'].to_numpy()
+    idx = np.searchsorted(available, target_close_ms, side='right') - 1
+    columns = [c for c in higher.columns if c != 'available_ms']
+    aligned = {}
+    for name in columns:
+        values = higher[name].to_numpy(dtype=np.float64)
+        col = np.full(len(idx), np.nan)
+        hit = idx >= 0
+        col[hit] = values[idx[hit]]
+        aligned[name] = col
+    return pd.DataFrame(aligned, columns=columns)
+
+
+def add_timeframe_features(df, interval, timeframes, features=DEFAULT_TIMEFRAME_FEATURES, warn=True):
+    """
+    對 interval 的 K 線 df 加上各 timeframes 的高階特徵欄位（不修改傳入的 df）。
+    高階 K 線由 df 本身聚合，不需要另外抓資料；timeframes 必須是 interval 的整數倍。
+    warn：某個週期的完整 K 線不足、整欄特徵都是缺值時印出警告。
+    """
+    if not timeframes:
+        return df
+    target_close_ms = _open_ms(df['Date']) + _step_ms(interval)
+    parts = {}
+    for tf in timeframes:
+        higher = timeframe_features(df, interval, tf, features)
+        empty = [name for name in higher.columns if name != 'available_ms' and not higher[name].notna().any()]
+        if empty and warn:
+            print(f"⚠️ {tf} 只有 {len(higher)} 根完整 K 線，不足以計算 {', '.join(empty)}（整欄為缺值）；"
+                  f"請加長 {interval} K 線視窗或改用較小的週期")
+        aligned = align_asof(target_close_ms, higher)
+        for name in aligned.columns:
+            parts[name] = aligned[name].to_numpy()
+    return df.assign(**parts)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="由單一 K 線序列產生多時間框架特徵")
+    parser.add_argument("--input", default="data/cleaned.csv")
+    parser.add_argument("--interval", default="4h")
+    parser.add_argument("--timeframes", nargs="*", default=["12h", "1d"])
+    parser.add_argument("--features", nargs="*", default=list(DEFAULT_TIMEFRAME_FEATURES))
+    parser.add_argument("--check", action="store_true",
+                        help="檢查沒有未來資料：截斷在每個位置重算，最後一根的值必須與完整計算相同")
+    args = parser.parse_args()
+
+    from columnar_store import read_frame
+    df = read_frame(args.input)
+    out = add_timeframe_features(df, args.interval, args.timeframes, args.features)
+    added = [c for c in out.columns if c not in df.columns]
+    print(f"🧮 {len(df)} 根 {args.interval} K 線，新增 {len(added)} 個欄位")
+    for name in added:
+        print(f"   {name:<24} 有值 {out[name].notna().sum():>6} 根")
+
+    if args.check:
+        full = out[added].to_numpy(dtype=np.float64)
+        cuts = np.unique(np.linspace(1, len(df), num=min(len(df), 200), dtype=int))
+        bad = 0
+        for n in cuts:
+            head = add_timeframe_features(df.iloc[:n], args.interval, args.timeframes, args.features, warn=False)
+            last = head[added].to_numpy(dtype=np.float64)[-1]
+            if not np.array_equal(last, full[n - 1], equal_nan=True):
+                bad += 1
+        print(("✅ " if not bad else "❌ ") + f"截斷檢查 {len(cuts)} 個位置，{bad} 個與完整計算不同")
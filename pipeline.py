@@ -0,0 +1,424 @@
+"""
+In-process 交易流程執行器
+
+把 fetch → 特徵工程 → 分箱 → 箱子分析 → 交易分數 → 評估報告 → 資料庫
+串成同一個 Python 行程內的函式呼叫：各階段直接以 DataFrame / dict 交接，
+不必每一步重新啟動 python3、重新 import pandas、再把中間結果寫成 CSV 又讀回來。
+
+中間檔案只有在 save_outputs 指定時才會寫出（檔名與舊版腳本相同，
+方便 backtest_trading.py、send_to_discord.py、go_again.py 等下游繼續讀取）。
+
+每個階段的輸出會依「上游輸出指紋 + 參數 + 程式碼版本」快取（見 stage_cache.py）：
+輸入沒變就直接重用，上次失敗的流程會從第一個壞掉的階段繼續。
+"""
+import ast
+import inspect
+import json
+import os
+import textwrap
+import time
+from collections import namedtuple
+
+from run_metrics import DEFAULT_HISTORY_PATH, RunRecorder, StageTimer, count_rows, print_stage_summary
+from stage_cache import StageCache, file_fingerprint, fingerprint
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# 每個階段：名稱、顯示文字、執行函式、上游階段（依序作為位置參數傳入）、使用的設定參數。
+# 執行函式 import 到的本地模組（遞迴）由原始碼自動找出，指紋都納入快取鍵，任何一個改了快取自動失效
+Stage = namedtuple("Stage", ["name", "desc", "func", "inputs", "params"])
+
+# 各階段輸出對應的舊版檔名（save_outputs 時使用）
+STAGE_OUTPUT_FILES = {
+    "fetch": "cleaned.csv",
+    "features": "cleaned_features.csv",
+    "binning": "binned_features.csv",
+    "analysis": "feature_analysis_report.json",
+    "scoring": "trading_signals_with_scores.csv",
+    "assessment": "latest_trading_assessment.json",
+}
+
+DEFAULT_CONFIG = {
+    "symbol": "BTCUSDT",
+    "interval": "4h",
+    "window_size": 500,
+    "bin_window": 12,
+    "top_features": 8,
+    "sync_store": True,
+    "incremental_features": False,
+    "feature_kernel": "pandas",
+    "feature_subset": None,
+    "timeframes": (),
+    "compact": False,
+    "bin_mode": "tumbling",
+    "bin_edges": None,
+}
+
+
+class PipelineStageError(RuntimeError):
+    """某個階段執行失敗；stage 為失敗階段名稱，原始例外保留在 __cause__"""
+
+    def __init__(self, stage, desc, error):
+        super().__init__(f"{desc} 執行失敗: {error}")
+        self.stage = stage
+        self.desc = desc
+
+
+# === 各階段函式（pandas 等重量級模組在此才載入） ===
+def _fetch(symbol, interval, window_size, store_dir, bar_slot=None, sync_store=True):
+    # bar_slot（目前 K 線的開盤時間）只用來組快取鍵：同一根 K 線內重跑不會重新抓取
+    from fetch_data import fetch_kline_window
+    from kline_store import KlineStore
+    # 本地 K 線資料庫只會向 Binance 要上次之後新收盤的 K 線；
+    # sync_store=False 表示資料庫已由 websocket 串流（binance_ws.py）寫到最新，不再發 REST 請求
+    store = KlineStore(store_dir) if store_dir else None
+    df = fetch_kline_window(symbol=symbol, interval=interval, offset_bars=0,
+                            window_size=window_size, save=False, store=store, sync=sync_store)
+    if df is None:
+        raise RuntimeError("未能取得 K 線資料")
+    return df
+
+
+def _features(klines, symbol, interval, store_dir, incremental_features=False, feature_kernel="pandas",
+              feature_subset=None, timeframes=(), compact=False):
+    features = _base_features(klines, symbol, interval, store_dir, incremental_features, feature_kernel,
+                              feature_subset)
+    if timeframes:
+        # 高階週期（例如 12h、1d）由同一段 K 線聚合後計算，因果對齊回每根 K 線（見 multi_timeframe.py）
+        from multi_timeframe import add_timeframe_features
+        features = add_timeframe_features(features, interval, timeframes)
+    if compact:
+        # 精簡型別：float32 特徵、int8 整數、category 文字（見 compact_frames.py）
+        from compact_frames import compact_features
+        features = compact_features(features)
+    return features
+
+
+def _base_features(klines, symbol, interval, store_dir, incremental_features, feature_kernel, feature_subset):
+    # incremental_features：指標狀態存在本地資料庫旁，每根新 K 線只做 O(1) 更新（見 feature_engine.py）；
+    # 累積 VWAP 與 EMA 從資料庫第一根起算，不再隨抓到的視窗改變
+    if incremental_features and store_dir:
+        from feature_engine import incremental_features as update_features
+        return update_features(klines, store_dir, symbol, interval)
+    if feature_subset:
+        # 只計算指定的特徵與它們的相依（例如上次分析報告挑出的特徵，見 feature_registry.py）
+        from feature_registry import compute_feature_subset
+        return compute_feature_subset(klines, feature_subset)
+    if feature_kernel == "numpy":
+        # numpy 指標核心：結果與 compute_features 只差最後幾個位元（見 indicator_kernels.py）
+        from indicator_kernels import compute_features_fast
+        return compute_features_fast(klines)
+    from add_features import compute_features
+    return compute_features(klines)
+
+
+def _binning(features, bin_window, compact=False, bin_mode="tumbling", bin_edges=None, bin_edges_version=None,
+             symbol=None, interval=None, store_dir=None, incremental_features=False):
+    # bin_edges_version（邊界檔的內容指紋）只用來組快取鍵：重新訓練邊界後 binning 不會誤用舊快取
+    if bin_edges:
+        # 保存的分箱邊界：分析與即時運行用同一組邊界（檔案不存在時以這次的特徵訓練並保存，見 bin_edge_model.py）
+        from bin_edge_model import load_or_fit
+        model, fitted = load_or_fit(bin_edges, features)
+        if fitted:
+            print(f"💾 已以 {len(features)} 列訓練分箱邊界：{bin_edges}")
+        return model.transform(features, compact=compact)
+    if bin_mode == "rolling":
+        # 因果滑動窗口：每根只和自己與前 bin_window - 1 根比較，歷史箱子不隨新 K 線改變（見 rolling_binning.py）
+        if incremental_features and store_dir:
+            # 增量特徵的歷史值固定：窗口狀態與分箱結果存在本地資料庫旁，每次只把新 K 線餵進 RollingBinner
+            from rolling_binning import incremental_rolling_bins
+            return incremental_rolling_bins(features, store_dir, symbol, interval, window_size=bin_window,
+                                            compact=compact)
+        from rolling_binning import bin_features_rolling
+        return bin_features_rolling(features, window_size=bin_window, compact=compact)
+    from binned_features import bin_features
+    return bin_features(features, window_size=bin_window, compact=compact)
+
+
+def _analysis(binned, top_features):
+    from feature_bin_analysis import FeatureBinAnalyzer
+    return FeatureBinAnalyzer(binned).generate_json_report(top_features=top_features)
+
+
+def _scoring(binned, report):
+    from calculate_trading_scores import calculate_trading_scores
+    return calculate_trading_scores(binned, report)
+
+
+def _assessment(signals):
+    from generate_latest_assessment import generate_latest_assessment
+    return generate_latest_assessment(signals)
+
+
+def _save_sql(features, assessment):
+    import save_results_sql
+    rows = features[["open", "high", "low", "close", "volume"]].to_dict("records")
+    numeric_last, closes, raw_last = save_results_sql.summarize_rows(rows)
+    record = save_results_sql.build_record(
+        save_results_sql.parse_assessment(assessment), numeric_last, closes, raw_last)
+    return {"row_id": save_results_sql.save_record(record), "ts": record["ts"]}
+
+
+STAGES = [
+    Stage("fetch", "📥 獲取 K 線數據", _fetch, (),
+          ("symbol", "interval", "window_size", "store_dir", "bar_slot", "sync_store")),
+    Stage("features", "🧮 特徵工程", _features, ("fetch",),
+          ("symbol", "interval", "store_dir", "incremental_features", "feature_kernel", "feature_subset",
+           "timeframes", "compact")),
+    Stage("binning", "📊 特徵分箱", _binning, ("features",),
+          ("bin_window", "compact", "bin_mode", "bin_edges", "bin_edges_version",
+           "symbol", "interval", "store_dir", "incremental_features")),
+    Stage("analysis", "🔍 箱子分析", _analysis, ("binning",), ("top_features",)),
+    Stage("scoring", "📈 計算交易分數", _scoring, ("binning", "analysis"), ()),
+    Stage("assessment", "🧾 生成評估報告", _assessment, ("scoring",), ()),
+    Stage("save_sql", "💾 儲存結果到資料庫", _save_sql, ("features", "assessment"), ()),
+]
+
+
+def current_bar_slot(interval, now_ms=None):
+    """目前（尚未收盤）K 線的開盤時間（毫秒）；換了一根新 K 線，fetch 的快取鍵就會改變"""
+    from fetch_data import INTERVAL_MS
+    step = INTERVAL_MS[interval]
+    if now_ms is None:
+        now_ms = int(time.time() * 1000)
+    return now_ms // step * step
+
+
+_IMPORT_CACHE = {}
+
+
+def _is_main_guard(node):
+    return isinstance(node, ast.If) and isinstance(node.test, ast.Compare) and \
+        getattr(node.test.left, "id", None) == "__name__"
+
+
+def _imports(tree):
+    """語法樹中 import 的本地模組名稱（含函式內的延遲 import；略過 if __name__ == "__main__" 區塊）"""
+    names = set()
+    stack = [tree]
+    while stack:
+        for child in ast.iter_child_nodes(stack.pop()):
+            if _is_main_guard(child):
+                continue
+            if isinstance(child, ast.Import):
+                names.update(alias.name.split(".")[0] for alias in child.names)
+            elif isinstance(child, ast.ImportFrom) and child.module and not child.level:
+                names.add(child.module.split(".")[0])
+            stack.append(child)
+    return {name for name in names if os.path.exists(os.path.join(ROOT, f"{name}.py"))}
+
+
+def _module_imports(name):
+    path = os.path.join(ROOT, f"{name}.py")
+    stat = os.stat(path)
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    if key not in _IMPORT_CACHE:
+        with open(path, encoding="utf-8") as f:
+            _IMPORT_CACHE[key] = _imports(ast.parse(f.read()))
+    return _IMPORT_CACHE[key]
+
+
+def _function_imports(func, seen=None):
+    """pipeline 中某個函式（及它呼叫的其他 pipeline 函式）import 的本地模組"""
+    seen = set() if seen is None else seen
+    seen.add(func.__name__)
+    tree = ast.parse(textwrap.dedent(inspect.getsource(func)))
+    names = _imports(tree)
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id not in seen:
+            callee = globals().get(node.func.id)
+            if inspect.isfunction(callee) and callee.__module__ == __name__:
+                names |= _function_imports(callee, seen)
+    return names
+
+
+def stage_modules(stage):
+    """階段執行時可能用到的所有本地模組（依 import 遞迴展開），依名稱排序"""
+    found = set()
+    pending = list(_function_imports(stage.func))
+    while pending:
+        name = pending.pop()
+        if name in found or name == "pipeline":
+            continue
+        found.add(name)
+        pending.extend(_module_imports(name))
+    return sorted(found)
+
+
+def _code_version(stage):
+    return ":".join(file_fingerprint(os.path.join(ROOT, f"{name}.py"))
+                    for name in ["pipeline"] + stage_modules(stage))
+
+
+def write_stage_output(name, result, output_dir="data", output_format="csv"):
+    """
+    把單一階段的輸出寫成舊版腳本使用的檔案；回傳路徑（無對應檔名時回傳 None）。
+    output_format="columnar" 時表格改寫成同名 .cols 欄式資料表（見 columnar_store.py）。
+    """
+    filename = STAGE_OUTPUT_FILES.get(name)
+    if filename is None:
+        return None
+    os.makedirs(output_dir, exist_ok=True)
+    path = os.path.join(output_dir, filename)
+    if isinstance(result, dict):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    elif output_format == "columnar":
+        from columnar_store import columnar_path, write_table
+        path = columnar_path(path)
+        write_table(path, result, time_col="Date" if "Date" in result.columns else None)
+    else:
+        result.to_csv(path, index=False)
+    return path
+
+
+def run_pipeline(save_outputs=False, output_dir="data", skip=(), use_cache=True, force=(),
+                 history_path=DEFAULT_HISTORY_PATH, output_format="csv", **config):
+    """
+    依序執行所有階段，回傳 {階段名稱: 輸出物件}。
+    - save_outputs: True 寫出全部中間檔；也可傳入階段名稱清單只寫指定階段
+    - output_format: 表格中間檔格式，"csv"（預設）或 "columnar"（.cols 欄式資料表）
+    - skip: 要略過的階段名稱（例如不連資料庫時略過 "save_sql"）
+    - use_cache: 是否啟用階段快取（{output_dir}/.stage_cache）
+    - force: 即使快取命中也要重新執行的階段名稱
+    - history_path: 每次執行追加一筆各階段效能紀錄（None 表示不記錄，見 run_metrics.py）
+    - config: 覆寫 DEFAULT_CONFIG（symbol、interval、window_size ...）；
+      store_dir 為本地 K 線資料庫位置（預設 {output_dir}/store，設為 None 則每次完整下載）
+    任何階段失敗會拋出 PipelineStageError（下游階段需要上游輸出，無法繼續）；
+    已完成階段的輸出都已進快取，下次執行會從失敗的階段繼續。
+    """
+    cfg = dict(DEFAULT_CONFIG, **config)
+    if "store_dir" not in cfg:
+        cfg["store_dir"] = os.path.join(output_dir, "store")
+    if cfg.get("bar_slot") is None:
+        cfg["bar_slot"] = current_bar_slot(cfg["interval"])
+    if cfg.get("timeframes"):
+        # 視窗聚合不出足夠的高階 K 線時，特徵會整欄缺值；在抓資料前就擋下來
+        from multi_timeframe import check_window
+        check_window(cfg["interval"], cfg["window_size"], cfg["timeframes"])
+    cfg["bin_edges_version"] = file_fingerprint(cfg["bin_edges"]) if cfg.get("bin_edges") else None
+    if cfg.get("bin_edges") and not os.path.exists(cfg["bin_edges"]):
+        # 邊界檔還不存在：binning 必須實際執行才會訓練並寫出，不能直接用快取
+        force = set(force) | {"binning"}
+    if save_outputs is True:
+        save_outputs = list(STAGE_OUTPUT_FILES)
+    save_outputs = set(save_outputs or ())
+
+    cache = StageCache(os.path.join(output_dir, ".stage_cache")) if use_cache else None
+    manifest = {"config": cfg, "stages": {}, "failed_stage": None}
+    if cache is not None:
+        last = cache.load_manifest()
+        # 上次的設定是從 JSON 讀回的（tuple 變成 list），比較前先做同樣的轉換
+        if last.get("failed_stage") and last.get("config") == json.loads(json.dumps(cfg)):
+            print(f"⏩ 上次執行在「{last['failed_stage']}」失敗，之前的階段將直接使用快取")
+
+    recorder = RunRecorder(history_path, symbol=cfg["symbol"], interval=cfg["interval"])
+    results = {}
+    fingerprints = {}
+    # 客戶端是整個行程共用的，只累計這次執行發出的請求，執行紀錄才不會混進之前幾次的數字
+    from http_client import get_client
+    http = get_client()
+    http_window = http.open_window()
+    try:
+        for stage in STAGES:
+            if stage.name in skip:
+                continue
+            print(f"\n▶️ {stage.desc}...")
+            args = [results[name] for name in stage.inputs]
+            kwargs = {p: cfg[p] for p in stage.params}
+            rows_in = sum(count_rows(a) or 0 for a in args)
+
+            key = None
+            hit = False
+            timer = StageTimer(stage.name)
+            try:
+                with timer:
+                    if cache is not None:
+                        key = cache.make_key(stage.name, _code_version(stage),
+                                             [fingerprints[name] for name in stage.inputs], kwargs)
+                        if stage.name not in force:
+                            hit, value, fp = cache.get(stage.name, key)
+
+                    if hit:
+                        results[stage.name], fingerprints[stage.name] = value, fp
+                    else:
+                        results[stage.name] = stage.func(*args, **kwargs)
+                        if cache is not None:
+                            fingerprints[stage.name] = fingerprint(results[stage.name])
+                            cache.put(stage.name, key, results[stage.name], fingerprints[stage.name])
+            except Exception as e:
+                recorder.add(timer.record(rows_in=rows_in, cached=False, error=str(e)))
+                print_stage_summary(recorder.finish(status=f"failed:{stage.name}"))
+                manifest["stages"][stage.name] = {"key": key, "status": "failed", "error": str(e)}
+                manifest["failed_stage"] = stage.name
+                if cache is not None:
+                    cache.save_manifest(manifest)
+                raise PipelineStageError(stage.name, stage.desc, e) from e
+
+            recorder.add(timer.record(rows_in=rows_in, rows_out=count_rows(results[stage.name]), cached=hit))
+            if hit:
+                print(f"♻️ 輸入未變更，使用快取結果（{key[:12]}）")
+            manifest["stages"][stage.name] = {"key": key, "status": "cached" if hit else "ok"}
+
+            if stage.name in save_outputs:
+                path = write_stage_output(stage.name, results[stage.name], output_dir, output_format)
+                if path:
+                    print(f"💾 已寫出：{path}")
+            print(f"✅ {stage.desc} 完成")
+
+        if cache is not None:
+            cache.save_manifest(manifest)
+    finally:
+        http.close_window(http_window)
+    if http_window:
+        # 本次執行有對外請求時，把各 endpoint 的延遲一起記進執行紀錄
+        recorder.record["http"] = http.stats(http_window)
+        http.print_stats(http_window)
+    print_stage_summary(recorder.finish(status="ok"))
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="In-process 執行完整交易流程")
+    parser.add_argument("--symbol", default=DEFAULT_CONFIG["symbol"])
+    parser.add_argument("--interval", default=DEFAULT_CONFIG["interval"])
+    parser.add_argument("--window-size", type=int, default=DEFAULT_CONFIG["window_size"])
+    parser.add_argument("--output-dir", default="data")
+    parser.add_argument("--save-outputs", action="store_true", help="寫出所有中間檔（CSV/JSON）")
+    parser.add_argument("--format", choices=["csv", "columnar"], default="csv",
+                        help="表格中間檔格式（columnar = .cols 欄式資料表）")
+    parser.add_argument("--skip", nargs="*", default=[], help="略過的階段，例如 save_sql")
+    parser.add_argument("--incremental-features", action="store_true",
+                        help="以保存的指標狀態增量計算特徵（指標從本地資料庫第一根起算）")
+    parser.add_argument("--feature-kernel", choices=["pandas", "numpy"], default=DEFAULT_CONFIG["feature_kernel"],
+                        help="特徵計算方式（numpy = indicator_kernels 的向量化核心）")
+    parser.add_argument("--features", nargs="*", default=None,
+                        help="只計算這些特徵（feature_registry 的名稱）；預設計算全部")
+    parser.add_argument("--features-from-report", default=None,
+                        help="只計算這份分析報告挑出的特徵（例如 data/feature_analysis_report.json）")
+    parser.add_argument("--timeframes", nargs="*", default=[],
+                        help="另外加上這些較大週期的 RSI / ATR / MACD（例如 12h 1d），由同一段 K 線聚合；"
+                             "視窗聚合出的完整 K 線須足以算出指標，否則直接報錯（預設 500 根 4h 不夠算 1w）")
+    parser.add_argument("--compact", action="store_true",
+                        help="精簡型別模式（float32 特徵、int8 分箱代碼），多交易對 / 長期間時省記憶體")
+    parser.add_argument("--bin-mode", choices=["tumbling", "rolling"], default=DEFAULT_CONFIG["bin_mode"],
+                        help="分箱方式（rolling = 每根只和前 bin_window 根比較的因果滑動窗口）")
+    parser.add_argument("--bin-edges", default=None,
+                        help="以保存的分箱邊界分箱（JSON，不存在時以本次特徵訓練並保存；見 bin_edge_model.py）")
+    parser.add_argument("--no-cache", action="store_true", help="停用階段快取，全部重新計算")
+    parser.add_argument("--force", nargs="*", default=[], help="強制重新執行的階段（忽略快取）")
+    args = parser.parse_args()
+
+    feature_subset = args.features
+    if args.features_from_report:
+        from feature_registry import features_from_report
+        feature_subset = (feature_subset or []) + features_from_report(args.features_from_report)
+
+    run_pipeline(save_outputs=args.save_outputs, output_dir=args.output_dir, skip=args.skip,
+                 use_cache=not args.no_cache, force=args.force, output_format=args.format,
+                 symbol=args.symbol, interval=args.interval, window_size=args.window_size,
+                 incremental_features=args.incremental_features, feature_kernel=args.feature_kernel,
+                 feature_subset=feature_subset, timeframes=args.timeframes,
+                 compact=args.compact, bin_mode=args.bin_mode,
+                 bin_edges=args.bin_edges)
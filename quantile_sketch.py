@@ -0,0 +1,309 @@
+"""
+串流近似分位數分箱：超過記憶體的長期歷史，以可合併的分位數草圖一次掃描算出全域分箱邊界
+
+binned_features / bin_edge_model 的精確分位數需要整張特徵表在記憶體裡；多年的 1m 特徵放不下。
+這裡用 KLL 式的壓縮器階層（KLLSketch）：
+- 第 h 層的每個值代表 2^h 個原始值；某層超過 k 個值就排序後隨機取奇數或偶數位置的一半升到上一層
+- 每次壓縮對任何查詢的排名誤差最多 2^h，累計在 max_error，因此 rank_error() 是保證的上界
+  （實際誤差因隨機位移互相抵銷，通常小得多）；記憶體約 k × log2(n / k) 個值
+- 兩個草圖可直接合併（各層串接後再壓縮），誤差上界相加
+- 最小值 / 最大值精確保存，Weekday 的 cut 等寬邊界因此與精確版本相同
+
+流程：每個 chunk（欄式資料表依列範圍由 worker 自己讀；CSV 由主行程分段讀）各自建草圖，
+以 ProcessPoolExecutor 平行處理後合併，得到的邊界包成 BinEdgeModel（見 bin_edge_model.py），
+之後再逐 chunk 分箱寫出，整段歷史都不需要同時放進記憶體。
+
+    python quantile_sketch.py --input data/features.cols --edges data/bin_edges.json --output data/binned.cols
+    python quantile_sketch.py --check --rows 2000000      # 合成資料：與精確分位數比較排名誤差
+"""
+import numpy as np
+
+from bin_edge_model import BinEdgeModel, _column_kind
+from binned_features import QUANTILES, WEEKDAY_BINS, cut_edges
+from columnar_store import SEGMENT_ROWS
+
+# 每層最多保留的值數；排名誤差上界約為 log2(n / k) / k
+DEFAULT_K = 2048
+
+
+class KLLSketch:
+    """單一欄位的可合併分位數草圖（忽略 NaN 與 ±inf）"""
+
+    def __init__(self, k=DEFAULT_K, seed=None):
+        self.k = k
+        self.levels = [np.empty(0)]
+        self.n = 0
+        self.min = np.inf
+        self.max = -np.inf
+        self.max_error = 0
+        self._rng = np.random.default_rng(seed)
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[np.isfinite(values)]
+        if not len(values):
+            return self
+        self.n += len(values)
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compress()
+        return self
+
+    def merge(self, other):
+        """把 other 併入自己（other 不變）；兩者的 k 必須相同"""
+        if other.k != self.k:
+            raise ValueError(f"無法合併不同 k 的草圖：{self.k} != {other.k}")
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for h, items in enumerate(other.levels):
+            self.levels[h] = np.concatenate([self.levels[h], items])
+        self.n += other.n
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.max_error += other.max_error
+        self._compress()
+        return self
+
+    def _compress(self):
+        h = 0
+        while h < len(self.levels):
+            items = self.levels[h]
+            if len(items) > self.k:
+                items = np.sort(items)
+                # 奇數個時保留最後一個在本層，其餘兩兩一組隨機取一個升到上一層
+                even = len(items) - len(items) % 2
+                promoted = items[int(self._rng.integers(2)):even:2]
+                self.levels[h] = items[even:]
+                if h + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                self.levels[h + 1] = np.concatenate([self.levels[h + 1], promoted])
+                self.max_error += 1 << h
+            h += 1
+
+    def rank_error(self):
+        """分位數查詢的正規化排名誤差保證上界（0 ~ 1）：壓縮累計的誤差 + 最上層一個值代表的權重"""
+        if not self.n:
+            return 0.0
+        top = max(h for h, items in enumerate(self.levels) if len(items))
+        return (self.max_error + (1 << top)) / self.n
+
+    def size(self):
+        return sum(len(items) for items in self.levels)
+
+    def quantiles(self, qs):
+        """近似分位數（qs 為 0 ~ 1 的陣列；0 與 1 回傳精確的最小 / 最大值）；沒有資料時為 NaN"""
+        qs = np.asarray(qs, dtype=np.float64)
+        if not self.n:
+            return np.full(qs.shape, np.nan)
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(level), 1 << h, dtype=np.int64) for h, level in enumerate(self.levels)])
+        order = np.argsort(items, kind='stable')
+        items, cum = items[order], np.cumsum(weights[order])
+        idx = np.searchsorted(cum, qs * cum[-1], side='left')
+        out = items[np.minimum(idx, len(items) - 1)]
+        out[qs <= 0] = self.min
+        out[qs >= 1] = self.max
+        return out
+
+
+def sketch_frame(df, k=DEFAULT_K, seed=None):
+    """DataFrame 的每個數值欄位（Date 除外）各建一個草圖：{欄位: KLLSketch}"""
+    rng = np.random.default_rng(seed)
+    sketches = {}
+    for col in df.columns:
+        if col == 'Date' or _column_kind(df, col) == 'text':
+            continue
+        sketch = KLLSketch(k, seed=int(rng.integers(1 << 31)))
+        sketches[col] = sketch.update(df[col].to_numpy(dtype=np.float64))
+    return sketches
+
+
+def merge_sketches(parts):
+    """多個 {欄位: 草圖} → 合併後的 {欄位: 草圖}（依序合併；會修改第一個）"""
+    merged = {}
+    for sketches in parts:
+        for col, sketch in sketches.items():
+            if col in merged:
+                merged[col].merge(sketch)
+            else:
+                merged[col] = sketch
+    return merged
+
+
+def _table_rows(path):
+    from columnar_store import table_meta
+    return table_meta(path)["rows"]
+
+
+def _sketch_rows(path, lo, hi, k, seed):
+    """worker：自己讀欄式資料表的 [lo, hi) 列再建草圖（不經過行程間傳送原始資料）"""
+    from columnar_store import read_table
+    return sketch_frame(read_table(path, rows=(lo, hi)), k, seed)
+
+
+def _sketch_chunk(df, k, seed):
+    return sketch_frame(df, k, seed)
+
+
+def iter_chunks(path, chunk_rows=SEGMENT_ROWS):
+    """依序讀出資料（欄式資料表或 CSV）的 DataFrame chunk"""
+    from columnar_store import columnar_path, is_columnar, read_table
+    if not is_columnar(path) and is_columnar(columnar_path(path)):
+        path = columnar_path(path)
+    if is_columnar(path):
+        total = _table_rows(path)
+        for lo in range(0, total, chunk_rows):
+            yield read_table(path, rows=(lo, min(lo + chunk_rows, total)))
+    else:
+        import pandas as pd
+        yield from pd.read_csv(path, chunksize=chunk_rows)
+
+
+def build_sketches(path, chunk_rows=SEGMENT_ROWS, k=DEFAULT_K, workers=None, seed=0):
+    """
+    一次掃描 path（欄式資料表或 CSV）建出每個欄位的全域草圖，並回傳 (草圖, 欄位型別)。
+    workers > 1 時以 ProcessPoolExecutor 平行建各 chunk 的草圖再合併；同一份輸入與 seed 結果固定。
+    """
+    import os
+    from collections import deque
+    from concurrent.futures import ProcessPoolExecutor
+    from columnar_store import columnar_path, is_columnar, read_table
+
+    if not is_columnar(path) and is_columnar(columnar_path(path)):
+        path = columnar_path(path)
+    head = read_table(path, rows=(0, 1)) if is_columnar(path) else next(iter_chunks(path, 1))
+    kinds = {col: _column_kind(head, col) for col in head.columns if col != 'Date'}
+    workers = workers or os.cpu_count() or 1
+
+    if is_columnar(path):
+        total = _table_rows(path)
+        tasks = ((_sketch_rows, path, lo, min(lo + chunk_rows, total)) for lo in range(0, total, chunk_rows))
+    else:
+        tasks = ((_sketch_chunk, chunk) for chunk in iter_chunks(path, chunk_rows))
+    if workers <= 1:
+        return merge_sketches(func(*args, k, seed + i) for i, (func, *args) in enumerate(tasks)), kinds
+
+    # 同時最多 2 × workers 個 chunk 在處理中（CSV 的 chunk 由主行程讀出後傳給 worker，不能一次全部送出）；
+    # 依 chunk 順序合併，結果與單行程相同
+    def results():
+        pending = deque()
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for i, (func, *args) in enumerate(tasks):
+                pending.append(pool.submit(func, *args, k, seed + i))
+                if len(pending) >= 2 * workers:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    return merge_sketches(results()), kinds
+
+
+def sketch_model(sketches, kinds, meta=None):
+    """草圖 → BinEdgeModel：一般欄位取近似 qcut(q=5) 分位數邊界，Weekday 以精確最小 / 最大值做 cut 7 箱"""
+    columns = {}
+    for col, kind in kinds.items():
+        sketch = sketches.get(col)
+        if kind == 'text' or sketch is None or not sketch.n:
+            columns[col] = {"kind": kind, "edges": []}
+            continue
+        if kind == 'weekday':
+            edges = cut_edges(np.float64(sketch.min), np.float64(sketch.max), WEEKDAY_BINS)
+        else:
+            edges = sketch.quantiles(QUANTILES)
+        edges = edges[np.r_[True, edges[1:] != edges[:-1]]]
+        columns[col] = {"kind": kind, "edges": edges.tolist()}
+    n = max([s.n for s in sketches.values()] or [0])
+    meta = dict(meta or {}, rows=n, approximate=True,
+                rank_error=max([s.rank_error() for s in sketches.values()] or [0.0]))
+    return BinEdgeModel(columns, meta)
+
+
+def bin_out_of_core(path, output, model, chunk_rows=SEGMENT_ROWS):
+    """以 model 逐 chunk 分箱 path，寫到 output（.cols 為欄式資料表，否則 CSV）；回傳列數"""
+    import os
+    import pandas as pd
+    rows = 0
+    columnar = output.endswith('.cols')
+    if columnar:
+        from columnar_store import append_table
+        import shutil
+        shutil.rmtree(output, ignore_errors=True)
+    elif os.path.exists(output):
+        os.remove(output)
+    for chunk in iter_chunks(path, chunk_rows):
+        binned = model.transform(chunk)
+        if columnar:
+            timed = 'Date' in binned.columns and pd.api.types.is_datetime64_any_dtype(binned['Date'])
+            append_table(output, binned, time_col='Date' if timed else None)
+        else:
+            binned.to_csv(output, mode='a', header=not rows, index=False)
+        rows += len(binned)
+    return rows
+
+
+def _check(rows, k, workers, chunk_rows):
+    """合成特徵：多行程草圖的邊界與精確分位數比較實際排名誤差"""
+    import time
+    from concurrent.futures import ProcessPoolExecutor
+    import pandas as pd
+    rng = np.random.default_rng(7)
+    data = {
+        'normal': rng.normal(size=rows),
+        'heavy_tail': rng.standard_t(2, size=rows),
+        'lognormal': rng.lognormal(size=rows),
+        'discrete': rng.integers(0, 20, size=rows).astype(np.float64),
+    }
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = []
+        for i, lo in enumerate(range(0, rows, chunk_rows)):
+            chunk = pd.DataFrame({name: values[lo:lo + chunk_rows] for name, values in data.items()})
+            futures.append(pool.submit(_sketch_chunk, chunk, k, i))
+        parts = [f.result() for f in futures]
+    sketches = merge_sketches(parts)
+    elapsed = time.perf_counter() - started
+    print(f"🧪 {rows:,} 列 × {len(data)} 欄，{len(parts)} 個 chunk、{workers} 個行程：{elapsed:.2f}s")
+    for name, values in data.items():
+        sketch = sketches[name]
+        ordered = np.sort(values)
+        approx = sketch.quantiles(QUANTILES[1:-1])
+        # 近似邊界在精確排序中的排名位置 vs 目標分位數
+        lo = np.searchsorted(ordered, approx, side='left') / rows
+        hi = np.searchsorted(ordered, approx, side='right') / rows
+        target = QUANTILES[1:-1]
+        err = np.where(target < lo, lo - target, np.where(target > hi, target - hi, 0)).max()
+        print(f"   {name:<11} 實際排名誤差 {err:.5f}（保證上界 {sketch.rank_error():.5f}），"
+              f"保留 {sketch.size():,} 個值")
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="以可合併的分位數草圖算全域分箱邊界（適用於超過記憶體的歷史）")
+    parser.add_argument("--input", default="data/cleaned_features.csv", help="特徵（欄式資料表或 CSV）")
+    parser.add_argument("--edges", default="data/bin_edges.json", help="邊界輸出（BinEdgeModel JSON）")
+    parser.add_argument("--output", default=None, help="另外逐 chunk 分箱寫出（.cols 或 CSV）")
+    parser.add_argument("--chunk-rows", type=int, default=SEGMENT_ROWS)
+    parser.add_argument("--k", type=int, default=DEFAULT_K)
+    parser.add_argument("--workers", type=int, default=None, help="行程數（預設 CPU 核心數）")
+    parser.add_argument("--check", action="store_true", help="以合成資料比較草圖與精確分位數")
+    parser.add_argument("--rows", type=int, default=2_000_000, help="--check 的合成列數")
+    args = parser.parse_args()
+
+    if args.check:
+        import os
+        _check(args.rows, args.k, args.workers or os.cpu_count() or 1, args.chunk_rows)
+        raise SystemExit(0)
+
+    started = time.perf_counter()
+    sketches, kinds = build_sketches(args.input, args.chunk_rows, args.k, args.workers)
+    model = sketch_model(sketches, kinds)
+    model.save(args.edges)
+    print(f"💾 {model.meta['rows']:,} 列、{len(kinds)} 個欄位的邊界 → {args.edges}"
+          f"（{time.perf_counter() - started:.2f}s，排名誤差上界 {model.meta['rank_error']:.5f}）")
+    if args.output:
+        started = time.perf_counter()
+        rows = bin_out_of_core(args.input, args.output, model, args.chunk_rows)
+        print(f"📊 已分箱 {rows:,} 列 → {args.output}（{time.perf_counter() - started:.2f}s）")
@@ -0,0 +1,269 @@
+"""
+流程效能量測與執行歷史
+
+- StageTimer：量測單一階段的 wall time、CPU time、峰值 RSS 與輸入/輸出筆數
+- RunRecorder：收集一次執行的所有階段紀錄，結束時以一行 JSON 追加到歷史檔
+- CLI：讀取歷史檔，列出各階段趨勢並標記效能退步
+
+使用方式
+    python run_metrics.py                    # 每個 (symbol, interval) 最近 20 次執行的各階段趨勢
+    python run_metrics.py --symbol BTCUSDT --interval 4h
+    python run_metrics.py --last 50 --threshold 1.3
+    python run_metrics.py --runs 5           # 列出最近 5 次執行明細
+"""
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+DEFAULT_HISTORY_PATH = "logs/run_history.jsonl"
+
+
+def _read_status_kb(field):
+    """從 /proc/self/status 讀取記憶體欄位（kB）；非 Linux 回傳 None"""
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def _reset_peak_rss():
+    """重設行程的 RSS 高水位（Linux clear_refs=5），讓每個階段量到自己的峰值"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb():
+    """目前的峰值 RSS（MB）：優先讀 VmHWM，否則退回 ru_maxrss（整個行程的峰值）；都沒有（Windows）時為 None"""
+    kb = _read_status_kb("VmHWM")
+    if kb is None:
+        try:
+            import resource  # Windows 沒有這個模組
+        except ImportError:
+            return None
+        kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if sys.platform == "darwin":  # macOS 單位為 bytes
+            kb //= 1024
+    return round(kb / 1024, 1)
+
+
+def count_rows(obj):
+    """DataFrame / list 回傳筆數；報告類 dict 回傳 None"""
+    if obj is None or isinstance(obj, dict):
+        return None
+    try:
+        return len(obj)
+    except TypeError:
+        return None
+
+
+class StageTimer:
+    """
+    量測一個階段：
+        with StageTimer("features") as t:
+            out = compute(...)
+        t.record(rows_in=..., rows_out=len(out))
+    """
+
+    def __init__(self, stage):
+        self.stage = stage
+        self.metrics = {"stage": stage}
+
+    def __enter__(self):
+        self._per_stage_peak = _reset_peak_rss()
+        self._wall0 = time.perf_counter()
+        self._cpu0 = time.process_time()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.metrics.update({
+            "wall_s": round(time.perf_counter() - self._wall0, 4),
+            "cpu_s": round(time.process_time() - self._cpu0, 4),
+            "peak_rss_mb": peak_rss_mb(),
+            "peak_rss_scope": "stage" if self._per_stage_peak else "process",
+            "status": "failed" if exc_type else "ok",
+        })
+        return False
+
+    def record(self, **fields):
+        self.metrics.update(fields)
+        return self.metrics
+
+
+class RunRecorder:
+    """收集一次流程執行的各階段量測，finish() 時追加一筆紀錄到歷史檔"""
+
+    def __init__(self, history_path=DEFAULT_HISTORY_PATH, **run_info):
+        self.history_path = history_path
+        self.started = time.perf_counter()
+        self.record = {
+            "run_id": datetime.now().strftime('%Y%m%d-%H%M%S-%f'),
+            "started_at": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            **run_info,
+            "stages": [],
+        }
+
+    def add(self, metrics):
+        self.record["stages"].append(metrics)
+
+    def finish(self, status="ok"):
+        self.record["status"] = status
+        self.record["total_wall_s"] = round(time.perf_counter() - self.started, 4)
+        if self.history_path:
+            os.makedirs(os.path.dirname(self.history_path) or ".", exist_ok=True)
+            with open(self.history_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(self.record, ensure_ascii=False, default=str) + "\n")
+        return self.record
+
+
+def print_stage_summary(record):
+    """在終端印出一次執行的各階段耗時"""
+    print("\n⏱️ 各階段效能：")
+    print(f"   {'階段':<12}{'wall(s)':>9}{'cpu(s)':>9}{'峰值RSS(MB)':>13}{'輸出筆數':>10}")
+    for m in record["stages"]:
+        rows = m.get("rows_out")
+        tag = " ♻️" if m.get("cached") else ""
+        print(f"   {m['stage']:<12}{m.get('wall_s', 0):>9.3f}{m.get('cpu_s', 0):>9.3f}"
+              f"{_fmt(m.get('peak_rss_mb'), '.1f'):>13}{'-' if rows is None else rows:>10}{tag}")
+    print(f"   總計 {record.get('total_wall_s', 0):.3f}s（{record.get('status')}）")
+
+
+# === 歷史分析 ===
+def load_history(path=DEFAULT_HISTORY_PATH, last=None):
+    runs = []
+    if not os.path.exists(path):
+        return runs
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                runs.append(json.loads(line))
+            except ValueError:
+                continue
+    return runs[-last:] if last else runs
+
+
+def _median(values):
+    values = sorted(values)
+    n = len(values)
+    if n == 0:
+        return None
+    mid = n // 2
+    return values[mid] if n % 2 else (values[mid - 1] + values[mid]) / 2
+
+
+def run_pair(run):
+    """執行紀錄的 (symbol, interval)；舊紀錄沒有時為 None"""
+    return run.get("symbol"), run.get("interval")
+
+
+def stage_trends(runs, threshold=1.5, min_delta_s=0.05, include_cached=False):
+    """
+    對每個 (symbol, interval) 的每個階段比較「最新一次」與「先前執行的中位數」
+    （不同交易對 / 週期的資料量不同，不能混在一起比）：
+    latest > median * threshold 且差距超過 min_delta_s 秒即標記為退步。
+    回傳 [{symbol, interval, stage, runs, median_wall_s, latest_wall_s, change_pct, latest_rss_mb,
+    latest_rows, regression}]
+    """
+    per_stage = {}
+    for run in runs:
+        for m in run.get("stages", []):
+            if m.get("cached") and not include_cached:
+                continue
+            if m.get("status", "ok") != "ok":
+                continue
+            per_stage.setdefault(run_pair(run) + (m["stage"],), []).append(m)
+
+    trends = []
+    for (symbol, interval, stage), items in per_stage.items():
+        latest = items[-1]
+        previous = [m["wall_s"] for m in items[:-1]]
+        median = _median(previous)
+        change = None
+        regression = False
+        if median:
+            change = (latest["wall_s"] - median) / median * 100
+            regression = (latest["wall_s"] > median * threshold
+                          and latest["wall_s"] - median > min_delta_s)
+        trends.append({
+            "symbol": symbol,
+            "interval": interval,
+            "stage": stage,
+            "runs": len(items),
+            "median_wall_s": median,
+            "latest_wall_s": latest["wall_s"],
+            "change_pct": change,
+            "latest_rss_mb": latest.get("peak_rss_mb"),
+            "latest_rows": latest.get("rows_out"),
+            "regression": regression,
+        })
+    return trends
+
+
+def _fmt(v, spec):
+    return "-" if v is None else format(v, spec)
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="顯示流程各階段效能趨勢與退步")
+    parser.add_argument("--history", default=DEFAULT_HISTORY_PATH, help="歷史檔路徑")
+    parser.add_argument("--last", type=int, default=20, help="只看最近 N 次執行")
+    parser.add_argument("--threshold", type=float, default=1.5, help="最新耗時超過中位數幾倍視為退步")
+    parser.add_argument("--runs", type=int, default=0, help="另外列出最近 N 次執行明細")
+    parser.add_argument("--include-cached", action="store_true", help="快取命中的階段也納入統計")
+    parser.add_argument("--symbol", default=None, help="只看這個交易對")
+    parser.add_argument("--interval", default=None, help="只看這個週期")
+    args = parser.parse_args()
+
+    # --last 是每個 (symbol, interval) 各自最近 N 次
+    by_pair = {}
+    for run in load_history(args.history):
+        if args.symbol and run.get("symbol") != args.symbol.upper():
+            continue
+        if args.interval and run.get("interval") != args.interval:
+            continue
+        by_pair.setdefault(run_pair(run), []).append(run)
+    if not by_pair:
+        print(f"⚠️ 找不到執行歷史：{args.history}")
+        return 0
+
+    regression = False
+    for (symbol, interval), runs in by_pair.items():
+        runs = runs[-args.last:] if args.last else runs
+        print(f"\n📊 {symbol or '-'} {interval or '-'}：最近 {len(runs)} 次執行"
+              f"（{runs[0].get('started_at')} ~ {runs[-1].get('started_at')}）")
+        print("-" * 84)
+        print(f"{'階段':<12}{'次數':>6}{'中位數(s)':>12}{'最新(s)':>10}{'變化%':>9}{'峰值RSS(MB)':>13}{'筆數':>8}  狀態")
+        trends = stage_trends(runs, threshold=args.threshold, include_cached=args.include_cached)
+        for t in trends:
+            flag = "🔺 退步" if t["regression"] else "✅"
+            print(f"{t['stage']:<12}{t['runs']:>6}{_fmt(t['median_wall_s'], '.3f'):>12}"
+                  f"{t['latest_wall_s']:>10.3f}{_fmt(t['change_pct'], '+.1f'):>9}"
+                  f"{_fmt(t['latest_rss_mb'], '.1f'):>13}{_fmt(t['latest_rows'], 'd'):>8}  {flag}")
+        print("-" * 84)
+
+        totals = [r.get("total_wall_s", 0) for r in runs]
+        print(f"總耗時：最新 {totals[-1]:.3f}s｜中位數 {_median(totals):.3f}s｜最大 {max(totals):.3f}s")
+        regression = regression or any(t["regression"] for t in trends)
+
+        for run in runs[-args.runs:] if args.runs else []:
+            print(f"\n🧾 {run.get('run_id')} {symbol or ''} {interval or ''} ({run.get('status')})")
+            print_stage_summary(run)
+
+    return 1 if regression else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,6 +5,9 @@ Read latest assessment JSON and the last row from cleaned_features.csv, compute
 and store a record into an SQLite database at data/trading_results.db.
 
 Usage: python save_results_sql.py
+
+MySQL connection settings come from the environment (defaults in parentheses):
+MYSQL_HOST (127.0.0.1), MYSQL_PORT (3306), MYSQL_USER (root), MYSQL_PASSWORD (empty), MYSQL_DB (trading).
 """
 from pathlib import Path
 import csv
@@ -29,8 +32,12 @@ JSON_PATH = DATA_DIR / "latest_trading_assessment.json"
 CSV_PATH = DATA_DIR / "cleaned_features.csv"
 DB_PATH = DATA_DIR / "trading_results.db"
 
-# Hard-coded MySQL credentials (as requested)
-
+# MySQL connection settings (override via environment variables)
+MYSQL_HOST = os.environ.get("MYSQL_HOST", "127.0.0.1")
+MYSQL_PORT = int(os.environ.get("MYSQL_PORT", "3306"))
+MYSQL_USER = os.environ.get("MYSQL_USER", "root")
+MYSQL_PASSWORD = os.environ.get("MYSQL_PASSWORD", "")
+MYSQL_DB = os.environ.get("MYSQL_DB", "trading")
 
 
 def safe_float(x):
@@ -45,7 +52,11 @@ def read_assessment(json_path):
         raise FileNotFoundError(f"assessment file not found: {json_path}")
     with open(json_path, "r", encoding="utf-8") as f:
         data = json.load(f)
+    return parse_assessment(data)
+
 
+def parse_assessment(data):
+    """Extract (buy_score, sell_score, recommendation, assessment_time) from an assessment dict."""
     # Extract buy/sell scores from common nested locations
     buy_score = None
     sell_score = None
@@ -77,6 +88,11 @@ def read_cleaned_csv(csv_path):
         for r in reader:
             rows.append(r)
 
+    return summarize_rows(rows)
+
+
+def summarize_rows(rows):
+    """Return (numeric_last, closes, raw_last) from a list of OHLCV row dicts."""
     if not rows:
         raise ValueError("CSV contains no rows")
 
@@ -161,18 +177,9 @@ def insert_record_mysql(conn, rec):
     return cur.lastrowid
 
 
-def main():
-    try:
-        buy_score, sell_score, recommendation, assessment_time = read_assessment(JSON_PATH)
-    except Exception as e:
-        print(f"Failed to read assessment: {e}")
-        sys.exit(1)
-
-    try:
-        numeric_last, closes, raw_last = read_cleaned_csv(CSV_PATH)
-    except Exception as e:
-        print(f"Failed to read CSV: {e}")
-        sys.exit(1)
+def build_record(assessment_fields, numeric_last, closes, raw_last):
+    """Combine parsed assessment fields and the last OHLCV row into a DB record dict."""
+    buy_score, sell_score, recommendation, assessment_time = assessment_fields
 
     ma30 = round(compute_ma(closes, 30), 2)
     ma90 = round(compute_ma(closes, 90), 2)
@@ -196,14 +203,17 @@ def main():
         "recommendation": recommendation,
         "created_at": datetime.utcnow().isoformat(),
     }
+    return record
+
 
+def save_record(record):
+    """Insert record into MySQL (skipping duplicates by ts); returns the row id or None."""
     # Ensure data dir exists (kept for SQLite fallback)
     DATA_DIR.mkdir(parents=True, exist_ok=True)
 
     # Require mysql-connector to be available and use MySQL only (no SQLite fallback)
     if not MYSQL_AVAILABLE:
-        print("mysql-connector not installed. Please install via: pip install mysql-connector-python")
-        sys.exit(1)
+        raise RuntimeError("mysql-connector not installed. Please install via: pip install mysql-connector-python")
 
     # connect without database to ensure database exists
     tmp = mysql.connector.connect(
@@ -227,6 +237,7 @@ def main():
         database=MYSQL_DB,
         connection_timeout=10,
     )
+    rowid = None
     try:
         ensure_table_mysql(conn)
         # Check for duplicate by ts
@@ -239,6 +250,28 @@ def main():
             rowid = insert_record_mysql(conn, record)
     finally:
         conn.close()
+    return rowid
+
+
+def main():
+    try:
+        assessment_fields = read_assessment(JSON_PATH)
+    except Exception as e:
+        print(f"Failed to read assessment: {e}")
+        sys.exit(1)
+
+    try:
+        numeric_last, closes, raw_last = read_cleaned_csv(CSV_PATH)
+    except Exception as e:
+        print(f"Failed to read CSV: {e}")
+        sys.exit(1)
+
+    record = build_record(assessment_fields, numeric_last, closes, raw_last)
+    try:
+        rowid = save_record(record)
+    except RuntimeError as e:
+        print(e)
+        sys.exit(1)
 
     print("Inserted record id:", rowid)
     print("Wrote to MySQL at %s:%s DB=%s" % (MYSQL_HOST, MYSQL_PORT, MYSQL_DB))
@@ -4,17 +4,18 @@ Discord Webhook 發送器 - 發送交易評估報告到Discord
 """
 
 import json
-import requests
 from datetime import datetime
 import sys
 import os
 import ast
 from pathlib import Path
 
-def load_assessment_data():
-    """載入最新的評估數據"""
+DEFAULT_ASSESSMENT_PATH = 'data/BTCUSDT_4h/latest_trading_assessment.json'
+
+def load_assessment_data(json_path=DEFAULT_ASSESSMENT_PATH):
+    """載入最新的評估數據（a_main / multi_runner 的報告在 data/{symbol}_{interval}/）"""
     try:
-        with open('data/latest_trading_assessment.json', 'r', encoding='utf-8') as f:
+        with open(json_path, 'r', encoding='utf-8') as f:
             return json.load(f)
     except FileNotFoundError:
         print("❌ 找不到評估文件，請先運行: python3 generate_latest_assessment.py")
@@ -113,6 +114,8 @@ def get_market_status(assessment_data):
 
 def send_to_discord(webhook_url, embed):
     """發送embed到Discord"""
+    import requests
+    from http_client import get_client
     payload = {
         "embeds": [embed],
         "username": "BTC交易助手 🤖",
@@ -120,7 +123,7 @@ def send_to_discord(webhook_url, embed):
     }
 
     try:
-        response = requests.post(webhook_url, json=payload, timeout=10)
+        response = get_client().request("POST", webhook_url, json=payload, timeout=10)
         response.raise_for_status()
 
         if response.status_code == 204:
@@ -141,11 +144,16 @@ def send_to_discord(webhook_url, embed):
 
 def main():
     """主函數"""
+    import argparse
+    parser = argparse.ArgumentParser(description="發送交易評估報告到 Discord")
+    parser.add_argument("--json", "-j", default=DEFAULT_ASSESSMENT_PATH, help="assessment JSON 檔路徑")
+    args = parser.parse_args()
+
     print("🎯 Discord Webhook 交易評估發送器")
     print("=" * 50)
 
     # 載入評估數據
-    assessment_data = load_assessment_data()
+    assessment_data = load_assessment_data(args.json)
     if not assessment_data:
         return
 
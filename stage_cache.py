@@ -0,0 +1,116 @@
+"""
+流程階段快取（content-addressed）
+
+每個階段的快取鍵 = sha256(階段名稱 + 程式碼版本 + 上游輸出指紋 + 參數)。
+輸入沒變的階段直接讀回上次的輸出；某階段失敗時，它之前的階段鍵值不變，
+下次執行會全部命中快取，自然從第一個壞掉的階段「續跑」。
+
+快取檔案：{cache_dir}/{stage}/{key}.pkl（內容為 (輸出物件, 輸出指紋)）
+執行紀錄：{cache_dir}/last_run.json（每個階段的鍵值與狀態，供續跑提示）
+"""
+import hashlib
+import json
+import os
+import pickle
+from datetime import datetime
+
+# 每個階段最多保留幾份快取（依修改時間淘汰舊檔）
+MAX_ENTRIES_PER_STAGE = 6
+
+
+def fingerprint(obj):
+    """計算物件內容指紋：DataFrame 以 pandas 逐列雜湊，其餘以排序後的 JSON / repr"""
+    h = hashlib.sha256()
+    if hasattr(obj, "columns") and hasattr(obj, "dtypes"):
+        import pandas as pd
+        h.update(repr(list(obj.columns)).encode())
+        h.update(repr([str(t) for t in obj.dtypes]).encode())
+        h.update(pd.util.hash_pandas_object(obj, index=True).values.tobytes())
+    elif isinstance(obj, (dict, list, tuple)):
+        h.update(json.dumps(obj, sort_keys=True, ensure_ascii=False, default=str).encode())
+    else:
+        h.update(repr(obj).encode())
+    return h.hexdigest()
+
+
+def file_fingerprint(path):
+    """程式碼檔案的內容指紋（程式改了快取就失效）；檔案不存在時回傳空字串"""
+    try:
+        with open(path, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return ""
+
+
+class StageCache:
+    """以內容雜湊為鍵的階段輸出快取"""
+
+    def __init__(self, cache_dir="data/.stage_cache"):
+        self.cache_dir = cache_dir
+        self.manifest_path = os.path.join(cache_dir, "last_run.json")
+
+    def make_key(self, stage, code_version, input_fingerprints, params):
+        payload = json.dumps({
+            "stage": stage,
+            "code": code_version,
+            "inputs": list(input_fingerprints),
+            "params": params,
+        }, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def _path(self, stage, key):
+        return os.path.join(self.cache_dir, stage, f"{key}.pkl")
+
+    def get(self, stage, key):
+        """回傳 (是否命中, 輸出物件, 輸出指紋)；快取檔損毀時視為未命中"""
+        path = self._path(stage, key)
+        if not os.path.exists(path):
+            return False, None, None
+        try:
+            with open(path, "rb") as f:
+                value, fp = pickle.load(f)
+        except Exception:
+            return False, None, None
+        return True, value, fp
+
+    def put(self, stage, key, value, fp):
+        stage_dir = os.path.join(self.cache_dir, stage)
+        os.makedirs(stage_dir, exist_ok=True)
+        path = self._path(stage, key)
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump((value, fp), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+        self._prune(stage_dir)
+
+    def _prune(self, stage_dir):
+        entries = [os.path.join(stage_dir, n) for n in os.listdir(stage_dir) if n.endswith(".pkl")]
+        if len(entries) <= MAX_ENTRIES_PER_STAGE:
+            return
+        entries.sort(key=os.path.getmtime, reverse=True)
+        for old in entries[MAX_ENTRIES_PER_STAGE:]:
+            try:
+                os.remove(old)
+            except OSError:
+                pass
+
+    # === 執行紀錄（續跑用） ===
+    def load_manifest(self):
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save_manifest(self, manifest):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        manifest["updated_at"] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        tmp = self.manifest_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, self.manifest_path)
+
+    def clear(self):
+        """刪除全部快取檔"""
+        import shutil
+        shutil.rmtree(self.cache_dir, ignore_errors=True)